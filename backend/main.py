@@ -10,6 +10,7 @@ from .bulkban import BulkBanManager
 from pydantic import BaseModel, validator
 import os
 import logging
+import requests
 
 from .auth_manager import (
     auth_manager,
@@ -1761,6 +1762,44 @@ def get_system_status(
     )
 
 
+@app.get(
+    "/api/analyzer/metrics", summary="🔒 Metriche analizzatore", tags=["System"]
+)
+@handle_endpoint_exceptions("recupero metriche analizzatore")
+def get_analyzer_metrics(
+    request: Request,
+    response: Response,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    """
+    🔒 PROTETTO - Inoltra le metriche Prometheus esposte dall'analizzatore
+    (righe/sec per file, code, latenza ban, cleanup IP, tempo regex).
+    """
+    get_current_user_and_refresh_token(request, response, credentials)
+
+    analyzer_config = config_manager.get_config()
+    if not analyzer_config.get("METRICS_ENABLED", True):
+        raise HTTPException(
+            status_code=404, detail="Endpoint metriche disabilitato (METRICS_ENABLED)"
+        )
+
+    host = analyzer_config.get("METRICS_HOST", "127.0.0.1")
+    port = analyzer_config.get("METRICS_PORT", 9877)
+
+    try:
+        upstream = requests.get(f"http://{host}:{port}/metrics", timeout=3)
+        upstream.raise_for_status()
+    except requests.RequestException as e:
+        raise HTTPException(
+            status_code=503, detail=f"Analizzatore non raggiungibile: {e}"
+        )
+
+    return Response(
+        content=upstream.content,
+        media_type=upstream.headers.get("Content-Type", "text/plain"),
+    )
+
+
 @app.get("/api/system/history", summary="📊 Storico del sistema", tags=["System"])
 @handle_endpoint_exceptions("recupero storico del sistema")
 def get_system_history(
@@ -2304,17 +2343,21 @@ def get_pattern_stats(
     response: Response,
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ):
-    """🔒 PROTETTO - Recupera le statistiche sui pattern"""
+    """🔒 PROTETTO - Recupera le statistiche sui pattern e i pattern piu' lenti sul traffico (profilo dell'analyzer)"""
     current_user = get_current_user_and_refresh_token(request, response, credentials)
 
     try:
         stats = pattern_manager.get_stats()
+        profile = pattern_manager.get_profile()
+        store = pattern_manager.get_store_stats()
 
         log_manager.log_operation(
             "Recuperate statistiche pattern", current_user.get("username")
         )
 
-        return response_manager.create_success_response(extra_fields={"stats": stats})
+        return response_manager.create_success_response(
+            extra_fields={"stats": stats, "profile": profile, "store": store}
+        )
     except Exception as e:
         log_manager.log_operation(
             "Errore recupero statistiche pattern", current_user.get("username"), str(e)
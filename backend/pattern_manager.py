@@ -3,6 +3,11 @@ import json
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+from .pattern_validator import validate_pattern
+from .pattern_store import PatternStore, VERSION_FILE_NAME
+
+PROFILE_TOP_N = 20
+PATTERN_TYPES = ["user_agent", "url", "dangerous_ua", "dangerous_url"]
 
 
 class PatternManager:
@@ -23,9 +28,21 @@ class PatternManager:
         self.url_file = self.patterns_dir / "url.pattern"
         self.dangerous_ua_file = self.dangerous_dir / "user_agents.dangerous"
         self.dangerous_url_file = self.dangerous_dir / "intentions.dangerous"
+        # Profili scritti dall'analyzer (uno per processo)
+        self.profile_dir = self.base_path / "data" / "log"
 
         self._ensure_files_exist()
 
+        self.store = PatternStore(
+            {
+                "user_agent": self.user_agent_file,
+                "url": self.url_file,
+                "dangerous_ua": self.dangerous_ua_file,
+                "dangerous_url": self.dangerous_url_file,
+            },
+            self.patterns_dir / VERSION_FILE_NAME,
+        )
+
     def _ensure_files_exist(self):
         for file_path in [
             self.user_agent_file,
@@ -40,113 +57,37 @@ class PatternManager:
         self, pattern_type: str = "all"
     ) -> Dict[str, List[Dict[str, Any]]]:
 
-        patterns = {}
-
-        if pattern_type in ["user_agent", "all"]:
-            patterns["user_agent"] = self._read_patterns(
-                self.user_agent_file, "user_agent"
-            )
-
-        if pattern_type in ["url", "all"]:
-            patterns["url"] = self._read_patterns(self.url_file, "url")
-
-        if pattern_type in ["dangerous_ua", "all"]:
-            patterns["dangerous_ua"] = self._read_patterns(
-                self.dangerous_ua_file, "dangerous_ua"
-            )
-
-        if pattern_type in ["dangerous_url", "all"]:
-            patterns["dangerous_url"] = self._read_patterns(
-                self.dangerous_url_file, "dangerous_url"
-            )
-
-        return patterns
-
-    def _read_patterns(
-        self, file_path: Path, pattern_type: str
-    ) -> List[Dict[str, Any]]:
-
-        if not file_path.exists():
-            return []
-
-        try:
-            patterns = []
-            with open(file_path, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-
-            for i, line in enumerate(lines):
-                line = line.rstrip("\n")
-                if not line or line.startswith("#"):
-                    continue
-
-                try:
-                    entry = json.loads(line)
-                    if "id" not in entry:
-                        entry["id"] = f"{pattern_type}_{i}"
-                    if "pattern" not in entry:
-                        entry["pattern"] = entry.get("regex", line)
-                    if "type" not in entry:
-                        entry["type"] = pattern_type
-                    if "createdAt" not in entry:
-                        entry["createdAt"] = datetime.now().isoformat()
-                    if "description" not in entry:
-                        entry["description"] = ""
-                    patterns.append(entry)
-                except json.JSONDecodeError:
-
-                    if "=" in line:
-                        pattern_part, description_part = line.split("=", 1)
-                        pattern_part = pattern_part.strip()
-                        description_part = description_part.strip()
-                    else:
-                        pattern_part = line
-                        description_part = ""
-
-                    patterns.append(
-                        {
-                            "id": f"{pattern_type}_{i}",
-                            "pattern": pattern_part,
-                            "description": description_part,
-                            "type": pattern_type,
-                            "createdAt": datetime.now().isoformat(),
-                        }
-                    )
-
-            return patterns
-        except Exception as e:
-            print(f"[ERROR] Errore lettura pattern {file_path}: {e}")
-            return []
+        return {
+            name: self.store.list_entries(name)
+            for name in PATTERN_TYPES
+            if pattern_type in [name, "all"]
+        }
 
     def add_pattern(
         self, pattern_type: str, pattern: str, description: str = ""
     ) -> Dict[str, Any]:
 
-        if pattern_type == "user_agent":
-            file_path = self.user_agent_file
-        elif pattern_type == "url":
-            file_path = self.url_file
-        elif pattern_type == "dangerous_ua":
-            file_path = self.dangerous_ua_file
-        elif pattern_type == "dangerous_url":
-            file_path = self.dangerous_url_file
-        else:
+        if pattern_type not in PATTERN_TYPES:
             return {
                 "success": False,
                 "error": f"Tipo pattern non valido: {pattern_type}",
             }
 
-        try:
+        validation = validate_pattern(pattern, pattern_type=pattern_type)
+        if not validation["valid"]:
+            return {"success": False, "error": validation["error"]}
 
-            entry = {
-                "id": f"{pattern_type}_{int(datetime .now().timestamp()*1000)}",
-                "pattern": pattern,
-                "description": description,
-                "type": pattern_type,
-                "createdAt": datetime.now().isoformat(),
-            }
-
-            with open(file_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(entry) + "\n")
+        try:
+            entry = self.store.add(
+                pattern_type,
+                {
+                    "id": f"{pattern_type}_{int(datetime.now().timestamp()*1000)}",
+                    "pattern": pattern,
+                    "description": description,
+                    "type": pattern_type,
+                    "createdAt": datetime.now().isoformat(),
+                },
+            )
 
             return {
                 "success": True,
@@ -158,28 +99,14 @@ class PatternManager:
 
     def remove_pattern(self, pattern_type: str, pattern_id: str) -> Dict[str, Any]:
 
-        if pattern_type == "user_agent":
-            file_path = self.user_agent_file
-        elif pattern_type == "url":
-            file_path = self.url_file
-        elif pattern_type == "dangerous_ua":
-            file_path = self.dangerous_ua_file
-        elif pattern_type == "dangerous_url":
-            file_path = self.dangerous_url_file
-        else:
+        if pattern_type not in PATTERN_TYPES:
             return {
                 "success": False,
                 "error": f"Tipo pattern non valido: {pattern_type}",
             }
 
         try:
-            patterns = self._read_patterns(file_path, pattern_type)
-            remaining_patterns = [p for p in patterns if p["id"] != pattern_id]
-
-            with open(file_path, "w", encoding="utf-8") as f:
-                for pattern in remaining_patterns:
-                    f.write(json.dumps(pattern) + "\n")
-
+            self.store.remove(pattern_type, pattern_id)
             return {"success": True, "message": "Pattern rimosso con successo"}
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -188,61 +115,85 @@ class PatternManager:
         self, pattern_type: str, pattern_id: str, pattern: str, description: str
     ) -> Dict[str, Any]:
 
-        if pattern_type == "user_agent":
-            file_path = self.user_agent_file
-        elif pattern_type == "url":
-            file_path = self.url_file
-        elif pattern_type == "dangerous_ua":
-            file_path = self.dangerous_ua_file
-        elif pattern_type == "dangerous_url":
-            file_path = self.dangerous_url_file
-        else:
+        if pattern_type not in PATTERN_TYPES:
             return {
                 "success": False,
                 "error": f"Tipo pattern non valido: {pattern_type}",
             }
 
-        try:
-            patterns = self._read_patterns(file_path, pattern_type)
+        validation = validate_pattern(pattern, pattern_type=pattern_type)
+        if not validation["valid"]:
+            return {"success": False, "error": validation["error"]}
 
-            updated = False
-            for p in patterns:
-                if p["id"] == pattern_id:
-                    p["pattern"] = pattern
-                    p["description"] = description
-                    updated = True
-                    break
+        try:
+            entry = self.store.update(
+                pattern_type,
+                pattern_id,
+                {"pattern": pattern, "description": description},
+            )
 
-            if not updated:
+            if entry is None:
                 return {
                     "success": False,
                     "error": f"Pattern con ID {pattern_id} non trovato",
                 }
 
-            with open(file_path, "w", encoding="utf-8") as f:
-                for p in patterns:
-                    f.write(json.dumps(p) + "\n")
-
             return {
                 "success": True,
                 "message": "Pattern aggiornato con successo",
-                "pattern": patterns[
-                    [i for i, p in enumerate(patterns) if p["id"] == pattern_id][0]
-                ],
+                "pattern": entry,
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
 
     def get_stats(self) -> Dict[str, Any]:
 
-        patterns = self.get_patterns("all")
-
+        counts = {name: self.store.count(name) for name in PATTERN_TYPES}
+        return {**counts, "total": sum(counts.values())}
+
+    def get_store_stats(self) -> Dict[str, Any]:
+        return self.store.get_stats()
+
+    def get_profile(self, top_n: int = PROFILE_TOP_N) -> Dict[str, Any]:
+        """Pattern piu' lenti sul traffico reale, dai profili dell'analyzer."""
+        merged = {}
+        samples = 0
+        updated = None
+
+        for profile_file in self.profile_dir.glob("pattern_profile*.json"):
+            try:
+                with open(profile_file, "r", encoding="utf-8") as f:
+                    profile = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            samples += profile.get("samples", 0)
+            if updated is None or profile.get("updated", 0) > updated:
+                updated = profile.get("updated")
+
+            for entry in profile.get("patterns", []):
+                key = (entry["type"], entry["pattern"])
+                current = merged.get(key)
+                if current is None:
+                    merged[key] = dict(entry)
+                    continue
+                count = current["samples"] + entry["samples"]
+                current["avg_us"] = (
+                    current["avg_us"] * current["samples"]
+                    + entry["avg_us"] * entry["samples"]
+                ) / count
+                current["samples"] = count
+                if entry["max_us"] > current["max_us"]:
+                    current["max_us"] = entry["max_us"]
+                    current["slowest_input"] = entry["slowest_input"]
+
+        slowest = sorted(merged.values(), key=lambda e: e["avg_us"], reverse=True)
         return {
-            "user_agent": len(patterns.get("user_agent", [])),
-            "url": len(patterns.get("url", [])),
-            "dangerous_ua": len(patterns.get("dangerous_ua", [])),
-            "dangerous_url": len(patterns.get("dangerous_url", [])),
-            "total": sum(len(v) for v in patterns.values()),
+            "samples": samples,
+            "updated": (
+                datetime.fromtimestamp(updated).isoformat() if updated else None
+            ),
+            "slowest": slowest[:top_n],
         }
 
 
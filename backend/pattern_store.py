@@ -0,0 +1,266 @@
+import os
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+
+# Righe superate (modifiche e rimozioni) oltre le quali il file viene
+# riscritto: solo se sono anche piu' delle voci vive
+COMPACT_MIN_DEAD_LINES = 32
+VERSION_FILE_NAME = "store.version"
+
+
+class PatternFile:
+    """
+    Un file di pattern JSONL come log di sole aggiunte, con indice in
+    memoria per id.
+
+    Aggiunte e modifiche accodano la voce (una modifica riusa l'id e prende
+    il posto della precedente), le rimozioni accodano {"id": ..., "deleted":
+    true}. Stesse regole di functions.load_pattern_file lato analyzer.
+    Quando le righe superate diventano troppe il file viene compattato con
+    una riscrittura atomica.
+
+    L'indice viene riletto solo se mtime, dimensione o inode del file
+    cambiano (modifiche a mano o da un altro processo).
+    """
+
+    def __init__(self, path: Path, pattern_type: str):
+        self.path = path
+        self.pattern_type = pattern_type
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        # Id assegnati in lettura a righe che non ne hanno uno nel file
+        self.synthetic_ids = set()
+        self.lines = 0
+        self.signature = None
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def refresh(self) -> bool:
+        signature = self._stat()
+        if signature == self.signature:
+            return False
+        self._load(signature)
+        return True
+
+    def _load(self, signature):
+        previous = self.entries
+        entries = {}
+        synthetic_ids = set()
+        lines = 0
+        fallback_created = (
+            datetime.fromtimestamp(signature[0] / 1e9).isoformat()
+            if signature
+            else datetime.now().isoformat()
+        )
+
+        if signature is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for i, line in enumerate(f):
+                    line = line.rstrip("\n")
+                    if not line or line.startswith("#"):
+                        continue
+                    lines += 1
+
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        entry = None
+                    if not isinstance(entry, dict):
+                        pattern_part, _, description_part = line.partition("=")
+                        entry = {
+                            "pattern": pattern_part.strip(),
+                            "description": description_part.strip(),
+                        }
+
+                    if "id" not in entry:
+                        # Stabile finche' il file non viene compattato: le
+                        # righe non si spostano, si aggiungono solo in coda
+                        entry["id"] = f"{self.pattern_type}_{i}"
+                        synthetic_ids.add(entry["id"])
+                    entry_id = entry["id"]
+
+                    if entry.get("deleted"):
+                        entries.pop(entry_id, None)
+                        continue
+
+                    if "pattern" not in entry:
+                        entry["pattern"] = entry.get("regex", line)
+                    entry.setdefault("type", self.pattern_type)
+                    entry.setdefault("description", "")
+                    if "createdAt" not in entry:
+                        known = previous.get(entry_id)
+                        entry["createdAt"] = (
+                            known["createdAt"] if known else fallback_created
+                        )
+                    entries[entry_id] = entry
+
+        self.entries = entries
+        self.synthetic_ids = synthetic_ids
+        self.lines = lines
+        self.signature = signature
+
+    def append(self, records: List[Dict[str, Any]]):
+        """Accoda le righe con una sola write e aggiorna l'indice senza rileggere."""
+        data = "".join(json.dumps(record) + "\n" for record in records)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        for record in records:
+            if record.get("deleted"):
+                self.entries.pop(record["id"], None)
+            else:
+                self.entries[record["id"]] = record
+        self.lines += len(records)
+        self.signature = self._stat()
+        self.maybe_compact()
+
+    def dead_lines(self) -> int:
+        return self.lines - len(self.entries)
+
+    def maybe_compact(self):
+        dead = self.dead_lines()
+        if dead >= COMPACT_MIN_DEAD_LINES and dead > len(self.entries):
+            self.compact()
+
+    def compact(self):
+        """Riscrive solo le voci vive: file temporaneo, fsync e rename atomico."""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        # Gli id assegnati in lettura ora sono scritti nel file
+        self.synthetic_ids = set()
+        self.lines = len(self.entries)
+        self.signature = self._stat()
+
+
+class PatternStore:
+    """
+    File di pattern del backend con indice per id e contatore di versione.
+
+    Ogni modifica incrementa la versione scritta in store.version (nella
+    cartella dei pattern): l'analyzer la controlla con una sola stat per
+    sapere quando ricompilare.
+    """
+
+    def __init__(self, files: Dict[str, Path], version_path: Path):
+        self.files = {
+            pattern_type: PatternFile(path, pattern_type)
+            for pattern_type, path in files.items()
+        }
+        self.version_path = version_path
+        self.lock = threading.Lock()
+        self.version = self._read_version()
+
+    def _read_version(self) -> int:
+        try:
+            with open(self.version_path, "r", encoding="utf-8") as f:
+                return int(json.load(f)["version"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0
+
+    def _bump_version(self):
+        self.version += 1
+        tmp_path = self.version_path.with_name(self.version_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": self.version, "updated": datetime.now().isoformat()}, f
+            )
+        os.replace(tmp_path, self.version_path)
+
+    def _file(self, pattern_type: str) -> PatternFile:
+        pattern_file = self.files[pattern_type]
+        pattern_file.refresh()
+        return pattern_file
+
+    def list_entries(self, pattern_type: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [dict(entry) for entry in self._file(pattern_type).entries.values()]
+
+    def get(self, pattern_type: str, entry_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self._file(pattern_type).entries.get(entry_id)
+            return dict(entry) if entry else None
+
+    def count(self, pattern_type: str) -> int:
+        with self.lock:
+            return len(self._file(pattern_type).entries)
+
+    def add(self, pattern_type: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        with self.lock:
+            self._file(pattern_type).append([entry])
+            self._bump_version()
+            return dict(entry)
+
+    def update(
+        self, pattern_type: str, entry_id: str, changes: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            pattern_file = self._file(pattern_type)
+            current = pattern_file.entries.get(entry_id)
+            if current is None:
+                return None
+            entry = {**current, **changes}
+            pattern_file.entries[entry_id] = entry
+            if entry_id in pattern_file.synthetic_ids:
+                # L'analyzer non conosce l'id: il file va riscritto con gli id
+                pattern_file.compact()
+            else:
+                pattern_file.append([entry])
+            self._bump_version()
+            return dict(entry)
+
+    def remove(self, pattern_type: str, entry_id: str) -> bool:
+        with self.lock:
+            pattern_file = self._file(pattern_type)
+            if entry_id not in pattern_file.entries:
+                return False
+            if entry_id in pattern_file.synthetic_ids:
+                del pattern_file.entries[entry_id]
+                pattern_file.compact()
+            else:
+                pattern_file.append([{"id": entry_id, "deleted": True}])
+            self._bump_version()
+            return True
+
+    def compact(self):
+        with self.lock:
+            compacted = False
+            for pattern_file in self.files.values():
+                pattern_file.refresh()
+                if pattern_file.dead_lines():
+                    pattern_file.compact()
+                    compacted = True
+            if compacted:
+                self._bump_version()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            files = {
+                pattern_type: self._file(pattern_type)
+                for pattern_type in self.files
+            }
+            return {
+                "counts": {
+                    pattern_type: len(pattern_file.entries)
+                    for pattern_type, pattern_file in files.items()
+                },
+                "dead_lines": {
+                    pattern_type: pattern_file.dead_lines()
+                    for pattern_type, pattern_file in files.items()
+                },
+                "version": self.version,
+            }
@@ -0,0 +1,177 @@
+import gc
+import os
+import re
+import sys
+import json
+import time
+import subprocess
+from typing import Dict, Any, List
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+# Tempo massimo per una singola ricerca sul corpus avversario: oltre,
+# il pattern renderebbe lenta ogni riga di log su cui viene provato
+PATTERN_TIME_BUDGET_MS = 50
+# Un input oltre il budget viene ricronometrato e conta il tempo minore:
+# una pausa dello scheduler non basta a rifiutare un pattern
+BENCHMARK_ATTEMPTS = 3
+# Limite del processo di benchmark, separato dal budget: copre avvio
+# dell'interprete e compilazione, e scatta solo per backtracking senza fine
+PATTERN_PROCESS_TIMEOUT = 10
+# Ben oltre la lunghezza tipica di URL e user agent: un pattern quadratico
+# (".*" tra due letterali) resta entro il budget, uno cubico o esponenziale no
+ADVERSARIAL_LENGTH = 2048
+BASE_FILLERS = ["a", "0", " ", "/", ".", "-", "=", "%", "../", "%2e", "a/", "a.b"]
+# I pattern vengono usati dall'analyzer senza distinzione maiuscole/minuscole
+PATTERN_FLAGS = re.IGNORECASE
+# Tipi che l'analyzer, se la regex non compila, cerca come sottostringa
+LITERAL_FALLBACK_TYPES = ("dangerous_ua", "dangerous_url")
+
+
+def _pattern_fillers(items, fillers: List[str]):
+    """Caratteri e sequenze letterali del pattern, anche dentro gruppi e classi."""
+    run = []
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            fillers.append(chr(av))
+            continue
+        if run:
+            fillers.append("".join(run))
+            run = []
+        if op is sre_parse.IN:
+            for in_op, in_av in av:
+                if in_op is sre_parse.LITERAL:
+                    fillers.append(chr(in_av))
+                elif in_op is sre_parse.RANGE:
+                    fillers.append(chr(in_av[0]))
+        elif op is sre_parse.SUBPATTERN:
+            _pattern_fillers(av[-1], fillers)
+        elif op is sre_parse.BRANCH:
+            for branch in av[1]:
+                _pattern_fillers(branch, fillers)
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            _pattern_fillers(av[2], fillers)
+    if run:
+        fillers.append("".join(run))
+
+
+def adversarial_corpus(pattern: str, length: int = ADVERSARIAL_LENGTH) -> List[str]:
+    """
+    Stringhe lunghe costruite ripetendo caratteri comuni negli URL e i
+    letterali del pattern, chiuse da un carattere che fa fallire il match:
+    sono gli input che scatenano il backtracking (es. "(a+)+$" o ".*x.*x").
+    """
+    fillers = list(BASE_FILLERS)
+    try:
+        _pattern_fillers(sre_parse.parse(pattern, PATTERN_FLAGS), fillers)
+    except Exception:
+        pass
+
+    corpus = []
+    for filler in dict.fromkeys(fillers):
+        repeated = (filler * (length // len(filler) + 1))[:length]
+        corpus.append(repeated + "\x00")
+        corpus.append(repeated + "!" + repeated[: length // 2])
+    return corpus
+
+
+def _run_benchmark(request: Dict[str, Any]) -> Dict[str, Any]:
+    compiled = re.compile(request["pattern"], request["flags"])
+    budget = request["budget_ms"] / 1000
+    worst = 0.0
+    worst_index = 0
+    # Cronometrate solo le ricerche, senza pause del GC in mezzo
+    gc.disable()
+    for index, text in enumerate(request["corpus"]):
+        elapsed = None
+        for _ in range(BENCHMARK_ATTEMPTS):
+            start = time.perf_counter()
+            compiled.search(text)
+            attempt = time.perf_counter() - start
+            if elapsed is None or attempt < elapsed:
+                elapsed = attempt
+            if elapsed <= budget:
+                break
+        if elapsed > worst:
+            worst, worst_index = elapsed, index
+        if elapsed > budget:
+            break
+    gc.enable()
+    return {"max_ms": worst * 1000, "worst_index": worst_index}
+
+
+def validate_pattern(
+    pattern: str,
+    budget_ms: float = PATTERN_TIME_BUDGET_MS,
+    pattern_type: str = "",
+) -> Dict[str, Any]:
+    """
+    Controlla un pattern prima del salvataggio: deve compilare e ogni
+    ricerca sul corpus avversario deve restare entro budget_ms.
+
+    Il benchmark gira in un processo separato con timeout, perche' una
+    regex con backtracking esponenziale non si puo' interrompere. Il budget
+    vale per la singola ricerca, cronometrata nel processo figlio.
+
+    Per i tipi in LITERAL_FALLBACK_TYPES una regex non valida e' accettata
+    come testo letterale, come fa l'analyzer a runtime.
+    """
+    try:
+        re.compile(pattern, PATTERN_FLAGS)
+    except re.error as e:
+        if pattern_type in LITERAL_FALLBACK_TYPES:
+            # Ricerca di sottostringa: nessun backtracking da misurare
+            return {"valid": True, "literal": True, "max_ms": 0.0}
+        return {"valid": False, "error": f"Regex non valida: {e}"}
+
+    corpus = adversarial_corpus(pattern)
+    request = {
+        "pattern": pattern,
+        "flags": PATTERN_FLAGS,
+        "budget_ms": budget_ms,
+        "corpus": corpus,
+    }
+    timeout = PATTERN_PROCESS_TIMEOUT + (
+        BENCHMARK_ATTEMPTS * budget_ms * len(corpus) / 1000
+    )
+
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__)],
+            input=json.dumps(request),
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+        result = json.loads(completed.stdout)
+    except subprocess.TimeoutExpired:
+        return {
+            "valid": False,
+            "error": (
+                f"Pattern troppo lento: nessuna risposta entro {timeout:.1f}s "
+                f"sul corpus di test (backtracking catastrofico)"
+            ),
+        }
+    except (OSError, ValueError) as e:
+        return {"valid": False, "error": f"Validazione del pattern non riuscita: {e}"}
+
+    sample = corpus[result["worst_index"]]
+    if result["max_ms"] > budget_ms:
+        return {
+            "valid": False,
+            "error": (
+                f"Pattern troppo lento: {result['max_ms']:.1f}ms su un input di "
+                f"{len(sample)} caratteri (limite {budget_ms}ms)"
+            ),
+            "max_ms": result["max_ms"],
+            "slowest_input": sample[:80],
+        }
+    return {"valid": True, "max_ms": result["max_ms"]}
+
+
+if __name__ == "__main__":
+    print(json.dumps(_run_benchmark(json.loads(sys.stdin.read()))))
@@ -0,0 +1,132 @@
+"""
+Micro-benchmark del DangerDetector con molti pattern.
+
+Genera una blacklist sintetica (di default 10.000 pattern, 80% testo e
+20% regex, divisi tra user agent e URL) e confronta il ciclo su ogni
+pattern (implementazione precedente) con PatternSet (Aho-Corasick per i
+letterali e prefiltro ad atomi per le regex). Le cache TTL dei verdetti
+del detector (user agent e path URL) vengono escluse chiamando
+direttamente i PatternSet: si misura solo il costo del matching.
+
+Uso: python benchmarks/danger_detector_bench.py [--patterns N] [--texts N] [--rounds R]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import string
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions.blacklist_manager import DangerDetector  # noqa: E402
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "curl/8.4.0",
+    "python-requests/2.31.0",
+]
+PATHS = ["/", "/index.php", "/wp-login.php", "/api/v1/items?id=42", "/static/app.js"]
+
+
+class LoopDetector:
+    """Implementazione precedente: una ricerca per pattern."""
+
+    def __init__(self, user_agents_blacklist, intent_blacklist_set):
+        self.ua_patterns = [re.compile(p, re.IGNORECASE) for p in user_agents_blacklist]
+        self.intent_patterns = [re.compile(p, re.IGNORECASE) for p in intent_blacklist_set]
+
+    def match(self, user_agent_full, url):
+        ua = user_agent_full.lower()
+        url_lower = url.lower()
+        for pattern in self.ua_patterns:
+            if pattern.search(ua):
+                return "user_agent", pattern.pattern
+        for pattern in self.intent_patterns:
+            if pattern.search(url_lower):
+                return "url", pattern.pattern
+        return None
+
+
+def random_word(length):
+    return "".join(random.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def synthetic_patterns(count):
+    patterns = []
+    for i in range(count):
+        word = random_word(random.randint(6, 12))
+        if i % 5 == 0:
+            patterns.append(f"{word[:4]}[0-9]+{word[4:]}")
+        else:
+            patterns.append(word)
+    return patterns
+
+
+def bench(func, pairs, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for ua, url in pairs:
+            func(ua, url)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(pairs) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--patterns", type=int, default=10000)
+    parser.add_argument("--texts", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(42)
+    ua_patterns = synthetic_patterns(args.patterns // 2)
+    url_patterns = synthetic_patterns(args.patterns - len(ua_patterns))
+
+    pairs = []
+    for i in range(args.texts):
+        ua = f"{random.choice(USER_AGENTS)} {random_word(8)}"
+        url = f"{random.choice(PATHS)}?q={random_word(10)}"
+        # Una richiesta su venti contiene un pattern della blacklist
+        if i % 20 == 0:
+            url += random.choice(url_patterns).replace("[0-9]+", "42")
+        pairs.append((ua, url))
+
+    start = time.perf_counter()
+    detector = DangerDetector(ua_patterns, url_patterns)
+    build_seconds = time.perf_counter() - start
+    loop = LoopDetector(ua_patterns, url_patterns)
+
+    def combined(ua, url):
+        found = detector.ua_set.search(ua)
+        if found is not None:
+            return "user_agent", found
+        found = detector.intent_set.search(url)
+        return ("url", found) if found is not None else None
+
+    loop_hits = sum(1 for ua, url in pairs if loop.match(ua, url))
+    combined_hits = sum(1 for ua, url in pairs if combined(ua, url))
+
+    loop_us = bench(loop.match, pairs, args.rounds)
+    combined_us = bench(combined, pairs, args.rounds)
+
+    stats = detector.get_stats()
+    print(f"Pattern: {args.patterns}, testi: {len(pairs)}")
+    print(
+        f"Letterali: {stats['ua_string_patterns'] + stats['intent_string_patterns']} "
+        f"({stats['literal_backend']}), regex: "
+        f"{stats['ua_regex_patterns'] + stats['intent_regex_patterns']}"
+    )
+    print(f"Compilazione PatternSet: {build_seconds:.2f}s")
+    print(f"ciclo per pattern: {loop_us:10.1f} us/richiesta ({loop_hits} match)")
+    print(f"PatternSet:        {combined_us:10.1f} us/richiesta ({combined_hits} match)")
+    print(f"speedup: {loop_us / combined_us:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Micro-benchmark del parser JSON rispetto al parser regex.
+
+Genera righe equivalenti nel formato npm_proxy e in JSON (escape=json)
+e misura l'estrazione del LogRecord con la regex compilata, con il
+decoder JSON attivo (orjson se installato) e con il modulo json standard.
+
+Uso: python benchmarks/json_parser_bench.py [--lines N] [--rounds R]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import functions.log_formats as log_formats  # noqa: E402
+from functions.log_formats import LogFormatRegistry  # noqa: E402
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "curl/8.4.0",
+]
+PATHS = ["/", "/index.php", "/wp-login.php", "/api/v1/items?id=42", "/.env"]
+
+
+def synthetic_pair():
+    fields = {
+        "time_local": f"17/Oct/2026:10:{random.randint(0, 59):02d}:{random.randint(0, 59):02d} +0000",
+        "upstream_cache_status": "-",
+        "upstream_status": "-",
+        "status": str(random.choice([200, 200, 301, 404, 403, 500])),
+        "request_method": "GET",
+        "scheme": "https",
+        "host": "test.com",
+        "request_uri": random.choice(PATHS),
+        "remote_addr": ".".join(str(random.randint(1, 254)) for _ in range(4)),
+        "body_bytes_sent": str(random.randint(100, 5000)),
+        "gzip_ratio": "-",
+        "server": f"10.8.10.{random.randint(100, 120)}",
+        "http_user_agent": random.choice(USER_AGENTS),
+        "http_referer": "-",
+    }
+    text = (
+        "[{time_local}] {upstream_cache_status} {upstream_status} {status} - "
+        '{request_method} {scheme} {host} "{request_uri}" [Client {remote_addr}] '
+        "[Length {body_bytes_sent}] [Gzip {gzip_ratio}] [Sent-to {server}] "
+        '"{http_user_agent}" "{http_referer}"'
+    ).format(**fields)
+    return text, json.dumps(fields)
+
+
+def bench(func, lines, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for line in lines:
+            func(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(lines) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(42)
+    pairs = [synthetic_pair() for _ in range(args.lines)]
+    text_lines = [text for text, _ in pairs]
+    json_lines = [line for _, line in pairs]
+
+    registry = LogFormatRegistry({}, os.devnull)
+    regex_format = registry.get("npm_proxy")
+    json_format = registry.get("json")
+
+    mismatches = sum(
+        1
+        for text, line in pairs
+        if regex_format.extract(text) != json_format.extract(line)
+    )
+
+    regex_ns = bench(regex_format.extract, text_lines, args.rounds)
+    json_ns = bench(json_format.extract, json_lines, args.rounds)
+
+    print(f"regex npm_proxy:           {regex_ns:8.0f} ns/riga")
+    print(f"JSON ({log_formats.JSON_DECODER:6}):           {json_ns:8.0f} ns/riga")
+
+    if log_formats.JSON_DECODER != "json":
+        log_formats.json_loads = json.loads
+        stdlib_ns = bench(json_format.extract, json_lines, args.rounds)
+        print(f"JSON (json stdlib):        {stdlib_ns:8.0f} ns/riga")
+
+    print(f"record diversi tra regex e JSON: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Micro-benchmark del parser delle righe proxy-host.
+
+Confronta l'estrazione a regex multiple (legacy) con la regex unica
+ancorata su un corpus di righe. Di default usa fakelogf2b.log; se il
+corpus non contiene righe proxy valide ne genera di sintetiche nello
+stesso formato di fakelogs_for_test.py.
+
+Uso: python benchmarks/proxy_parser_bench.py [corpus] [--lines N] [--rounds R]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions.log_formats import CompiledFormat, PRESETS  # noqa: E402
+from functions.log_parsers import extract_proxy_fields_legacy  # noqa: E402
+
+# Come il preset npm_proxy dell'analyzer, con il parser legacy di fallback
+NPM_PROXY_FORMAT = CompiledFormat(
+    "npm_proxy", PRESETS["npm_proxy"], fallback=extract_proxy_fields_legacy
+)
+extract_proxy_fields = NPM_PROXY_FORMAT.extract
+
+DEFAULT_CORPUS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fakelogf2b.log"
+)
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "curl/8.4.0",
+    "sqlmap/1.7.2#stable (https://sqlmap.org)",
+]
+PATHS = ["/", "/index.php", "/wp-login.php", "/api/v1/items?id=42", "/.env"]
+
+
+def synthetic_line():
+    ip = ".".join(str(random.randint(1, 254)) for _ in range(4))
+    code = random.choice([200, 200, 301, 404, 403, 500])
+    gzip = f"{random.uniform(1.5, 3.5):.2f}" if random.random() < 0.3 else "-"
+    return (
+        f"[17/Oct/2026:10:{random.randint(0, 59):02d}:{random.randint(0, 59):02d} +0000] "
+        f"- - {code} - GET https test.com \"{random.choice(PATHS)}\" "
+        f"[Client {ip}] [Length {random.randint(100, 5000)}] [Gzip {gzip}] "
+        f"[Sent-to 10.8.10.{random.randint(100, 120)}] \"{random.choice(USER_AGENTS)}\" \"-\""
+    )
+
+
+def load_corpus(path, count):
+    lines = []
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            lines = [line.strip() for line in f if NPM_PROXY_FORMAT.regex.match(line.strip())]
+
+    if not lines:
+        print(f"Nessuna riga proxy in {path}, uso {count} righe sintetiche")
+        random.seed(42)
+        return [synthetic_line() for _ in range(count)]
+
+    print(f"Corpus: {len(lines)} righe proxy da {path}")
+    return lines
+
+
+def bench(func, lines, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for line in lines:
+            func(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(lines) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS)
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = load_corpus(args.corpus, args.lines)
+
+    mismatches = 0
+    for line in lines:
+        new = extract_proxy_fields(line)
+        old = extract_proxy_fields_legacy(line)
+        # Il codice legacy prende il primo numero a 3 cifre ($upstream_status)
+        if new[0] != old[0] or new[2:] != old[2:]:
+            mismatches += 1
+
+    legacy_ns = bench(extract_proxy_fields_legacy, lines, args.rounds)
+    single_ns = bench(extract_proxy_fields, lines, args.rounds)
+
+    print(f"legacy (regex multiple): {legacy_ns:8.0f} ns/riga")
+    print(f"regex unica ancorata:    {single_ns:8.0f} ns/riga")
+    print(f"speedup: {legacy_ns / single_ns:.2f}x, campi diversi: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
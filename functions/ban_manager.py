@@ -238,11 +238,8 @@ def ban_and_reset(
             ip, domain, user_agent, http_code, url, db_file, NPM_DEBUG_LOG
         )
 
-        with ip_manager.ip_data_lock:
-            if ip in ip_manager.ip_data:
-
-                del ip_manager.ip_data[ip]
-                debug_log(f"IP {ip} rimosso dalla memoria dopo il ban.", NPM_DEBUG_LOG)
+        if ip_manager.remove_ip(ip):
+            debug_log(f"IP {ip} rimosso dalla memoria dopo il ban.", NPM_DEBUG_LOG)
 
         debug_log(
             f"IP: {ip}, Ban eseguito con successo. Stato resettato e dati rimossi dalla memoria.",
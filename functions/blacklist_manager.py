@@ -1,84 +1,129 @@
-import json
 import re
-from functools import lru_cache
 from .debug_log import debug_log
+from .load_pattern_file import read_pattern_entries
+from .multi_pattern import PatternSet
+from .ttl_cache import TTLCache, MISSING
+
+DANGER_CACHE_SIZE = 10000
+DANGER_CACHE_TTL = 3600
+
+
+def normalize_url(url):
+    """Chiave della cache URL: solo il path, in minuscolo (i pattern sono case-insensitive)."""
+    return url.split("?", 1)[0].lower()
 
 
 class DangerDetector:
-    
-    def __init__(self, user_agents_blacklist, intent_blacklist_set):
-        self.ua_patterns = []
-        self.ua_strings = []
-        
-        for pattern in user_agents_blacklist:
-            try:
-                compiled = re.compile(pattern, re.IGNORECASE)
-                self.ua_patterns.append(compiled)
-            except re.error:
-                self.ua_strings.append(pattern)
-        
-        self.intent_patterns = []
-        self.intent_strings = []
-        
-        for pattern in intent_blacklist_set:
-            try:
-                compiled = re.compile(pattern, re.IGNORECASE)
-                self.intent_patterns.append(compiled)
-            except re.error:
-                self.intent_strings.append(pattern)
-    
-    @lru_cache(maxsize=10000)
+    """
+    Blacklist di user agent e URL compilate una sola volta: i pattern
+    letterali finiscono in un automa Aho-Corasick e le regex vengono
+    eseguite solo se compare una loro sottostringa obbligatoria (vedi
+    PatternSet), quindi il costo cresce poco con il numero di pattern.
+
+    I verdetti sono in due cache separate: una per user agent e una per
+    path dell'URL (senza query, in minuscolo), che si ripetono molto piu'
+    delle coppie (user agent, URL completo). La query string, che non si
+    ripete quasi mai, viene controllata senza cache e solo se il path e'
+    pulito.
+    """
+
+    def __init__(
+        self,
+        user_agents_blacklist,
+        intent_blacklist_set,
+        cache_size=DANGER_CACHE_SIZE,
+        cache_ttl=DANGER_CACHE_TTL,
+    ):
+        self.ua_set = PatternSet(user_agents_blacklist, re.IGNORECASE)
+        self.intent_set = PatternSet(intent_blacklist_set, re.IGNORECASE)
+        self.ua_cache = TTLCache(cache_size, cache_ttl)
+        self.url_cache = TTLCache(cache_size, cache_ttl)
+        # PatternProfiler opzionale, campiona le ricerche non in cache
+        self.profiler = None
+
+    def match_user_agent(self, user_agent_full):
+        pattern = self.ua_cache.get(user_agent_full)
+        if pattern is MISSING:
+            pattern = self.ua_set.search(user_agent_full)
+            self.ua_cache.put(user_agent_full, pattern)
+            if self.profiler is not None:
+                self.profiler.sample(
+                    "dangerous_ua", self.ua_set.regexes.compiled, user_agent_full
+                )
+        return pattern
+
+    def match_url(self, url):
+        path = normalize_url(url)
+        pattern = self.url_cache.get(path)
+        searched = pattern is MISSING
+        if searched:
+            pattern = self.intent_set.search(path)
+            self.url_cache.put(path, pattern)
+        if pattern is None and len(path) < len(url):
+            # Pattern sulla query (SQL injection, XSS, ...) o a cavallo del "?"
+            pattern = self.intent_set.search(url)
+            searched = True
+        if searched and self.profiler is not None:
+            self.profiler.sample("dangerous_url", self.intent_set.regexes.compiled, url)
+        return pattern
+
+    def match(self, user_agent_full, url):
+        """Ritorna ("user_agent" | "url", pattern) per il primo pattern trovato, o None."""
+        if user_agent_full:
+            pattern = self.match_user_agent(user_agent_full)
+            if pattern is not None:
+                return "user_agent", pattern
+
+        if url:
+            pattern = self.match_url(url)
+            if pattern is not None:
+                return "url", pattern
+
+        return None
+
+    def clear_cache(self):
+        self.ua_cache.clear()
+        self.url_cache.clear()
+
     def is_dangerous(self, user_agent_full, url):
+        return self.match(user_agent_full, url) is not None
 
-        ua = user_agent_full.lower() if user_agent_full else ""
-        url_lower = url.lower() if url else ""
-        
-        for pattern in self.ua_patterns:
-            if pattern.search(ua):
-                return True
-        
-        for bad_ua in self.ua_strings:
-            if bad_ua in ua:
-                return True
-        
-        for pattern in self.intent_patterns:
-            if pattern.search(url_lower):
-                return True
-        
-        for bad_intent in self.intent_strings:
-            if bad_intent in url_lower:
-                return True
-        
-        return False
-    
     def get_stats(self):
+        ua_stats = self.ua_set.get_stats()
+        intent_stats = self.intent_set.get_stats()
         return {
-            'ua_regex_patterns': len(self.ua_patterns),
-            'ua_string_patterns': len(self.ua_strings),
-            'intent_regex_patterns': len(self.intent_patterns),
-            'intent_string_patterns': len(self.intent_strings),
-            'cache_info': self.is_dangerous.cache_info()._asdict()
+            'ua_regex_patterns': ua_stats["regex_patterns"],
+            'ua_string_patterns': ua_stats["literal_patterns"],
+            'intent_regex_patterns': intent_stats["regex_patterns"],
+            'intent_string_patterns': intent_stats["literal_patterns"],
+            'literal_backend': ua_stats["literal_backend"],
+            'ua_cache': self.ua_cache.get_stats(),
+            'url_cache': self.url_cache.get_stats(),
         }
 
 
-def load_blacklists_once(user_agent_blacklist, intent_blacklist, npm_debug_log):
+def load_blacklists_once(
+    user_agent_blacklist,
+    intent_blacklist,
+    npm_debug_log,
+    rejected=None,
+    cache_size=DANGER_CACHE_SIZE,
+    cache_ttl=DANGER_CACHE_TTL,
+):
 
     user_agents_blacklist = set()
     intent_blacklist_set = set()
 
     try:
-        with open(user_agent_blacklist, "r", encoding="utf-8") as ua_file:
-            for line in ua_file:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    data = json.loads(line)
-                    pattern = data.get("pattern", "").lower()
-                    if pattern:
-                        user_agents_blacklist.add(pattern)
-                except json.JSONDecodeError:
-                    debug_log(f"Errore parsing JSON user agent: {line}", npm_debug_log)
+        entries, invalid = read_pattern_entries(user_agent_blacklist, allow_plain=False)
+        for _, data in entries:
+            pattern = data.get("pattern", "").lower()
+            if pattern:
+                user_agents_blacklist.add(pattern)
+        for _, line in invalid:
+            if rejected is not None:
+                rejected.append(line)
+            debug_log(f"Errore parsing JSON user agent: {line}", npm_debug_log)
         debug_log(
             f"Blacklist User-Agent caricata: {len(user_agents_blacklist)} voci",
             npm_debug_log,
@@ -88,18 +133,15 @@ def load_blacklists_once(user_agent_blacklist, intent_blacklist, npm_debug_log):
         debug_log("Blacklist User-Agent non trovata", npm_debug_log)
 
     try:
-        with open(intent_blacklist, "r", encoding="utf-8") as intent_file:
-            for line in intent_file:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    data = json.loads(line)
-                    pattern = data.get("pattern", "").lower()
-                    if pattern:
-                        intent_blacklist_set.add(pattern)
-                except json.JSONDecodeError:
-                    debug_log(f"Errore parsing JSON intent: {line}", npm_debug_log)
+        entries, invalid = read_pattern_entries(intent_blacklist, allow_plain=False)
+        for _, data in entries:
+            pattern = data.get("pattern", "").lower()
+            if pattern:
+                intent_blacklist_set.add(pattern)
+        for _, line in invalid:
+            if rejected is not None:
+                rejected.append(line)
+            debug_log(f"Errore parsing JSON intent: {line}", npm_debug_log)
         debug_log(
             f"Blacklist Intenti caricata: {len(intent_blacklist_set)} voci",
             npm_debug_log,
@@ -108,7 +150,9 @@ def load_blacklists_once(user_agent_blacklist, intent_blacklist, npm_debug_log):
         intent_blacklist_set = set()
         debug_log("Blacklist Intenti non trovata", npm_debug_log)
 
-    detector = DangerDetector(user_agents_blacklist, intent_blacklist_set)
+    detector = DangerDetector(
+        user_agents_blacklist, intent_blacklist_set, cache_size, cache_ttl
+    )
     
     stats = detector.get_stats()
     debug_log(
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from .debug_log import debug_log
+
+CHECKPOINT_FLUSH_INTERVAL = 2.0
+
+
+def line_hash(raw_line):
+    return hashlib.blake2b(raw_line, digest_size=8).hexdigest()
+
+
+class CheckpointStore:
+    """
+    Checkpoint persistenti (inode, offset, hash ultima riga) per file di log.
+
+    Gli aggiornamenti restano in memoria e vengono scritti su disco a
+    blocchi, al massimo ogni flush_interval secondi, con scrittura atomica.
+    """
+
+    def __init__(self, path, npm_debug_log, flush_interval=CHECKPOINT_FLUSH_INTERVAL):
+        self.path = path
+        self.npm_debug_log = npm_debug_log
+        self.flush_interval = flush_interval
+        self.checkpoints = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.last_flush = time.monotonic()
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            debug_log(f"Nessun checkpoint trovato in {self.path}", self.npm_debug_log)
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.checkpoints = {
+                path: {
+                    "inode": int(cp["inode"]),
+                    "offset": int(cp["offset"]),
+                    "line_hash": cp.get("line_hash"),
+                }
+                for path, cp in data.items()
+            }
+            debug_log(
+                f"Checkpoint caricati per {len(self.checkpoints)} file da {self.path}",
+                self.npm_debug_log,
+            )
+        except Exception as e:
+            self.checkpoints = {}
+            debug_log(
+                f"Errore caricamento checkpoint {self.path}: {e}", self.npm_debug_log
+            )
+
+    def get(self, path):
+        with self.lock:
+            cp = self.checkpoints.get(path)
+            return dict(cp) if cp else None
+
+    def update(self, path, inode, offset, last_line_hash):
+        with self.lock:
+            self.checkpoints[path] = {
+                "inode": inode,
+                "offset": offset,
+                "line_hash": last_line_hash,
+            }
+            self.dirty = True
+
+    def remove(self, path):
+        with self.lock:
+            if self.checkpoints.pop(path, None) is not None:
+                self.dirty = True
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        with self.lock:
+            if not self.dirty:
+                return
+            if not force and now - self.last_flush < self.flush_interval:
+                return
+            snapshot = json.dumps(self.checkpoints)
+            self.dirty = False
+            self.last_flush = now
+
+        tmp_path = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            with self.lock:
+                self.dirty = True
+            debug_log(
+                f"Errore scrittura checkpoint {self.path}: {e}", self.npm_debug_log
+            )
@@ -0,0 +1,97 @@
+import re
+from collections import namedtuple
+
+ErrorRecord = namedtuple(
+    "ErrorRecord",
+    ["ip", "level", "category", "host", "request", "upstream", "time", "message"],
+)
+
+# Riga standard dell'error log nginx:
+# 2026/10/17 10:00:00 [error] 12#12: *345 <messaggio>, client: 1.2.3.4,
+# server: example.com, request: "GET / HTTP/1.1", upstream: "...", host: "..."
+ERROR_LINE_REGEX = re.compile(
+    r"^(?P<time>\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}) \[(?P<level>\w+)\] \S+ "
+    r"(?:\*\d+ )?(?P<message>.*?), client: (?P<client>[^,\s]+)"
+    r"(?:, server: (?P<server>[^,]*))?"
+    r'(?:, request: "(?P<request>[^"]*)")?'
+    r'(?:, subrequest: "[^"]*")?'
+    r'(?:, upstream: "(?P<upstream>[^"]*)")?'
+    r'(?:, host: "(?P<host>[^"]*)")?'
+)
+ERROR_KEY_REGEX = re.compile(rb", client: ([^,\s]+)")
+
+# Categorie in ordine di priorita': a parita' di posizione vince la prima
+ERROR_CATEGORIES = (
+    ("limit_req", r"limiting requests"),
+    ("limit_conn", r"limiting connections"),
+    ("ssl_handshake", r"SSL_do_handshake\(\) failed|while SSL handshaking"),
+    ("access_forbidden", r"access forbidden by rule|is forbidden"),
+    ("not_found", r"\(2: No such file or directory\)"),
+    (
+        "bad_request",
+        r"client sent invalid|client intended to send too large|invalid host",
+    ),
+    ("upstream_timeout", r"upstream timed out"),
+    (
+        "upstream_error",
+        r"connect\(\) failed|upstream prematurely closed|no live upstreams"
+        r"|host not found",
+    ),
+)
+ERROR_CATEGORY_REGEX = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern in ERROR_CATEGORIES),
+    re.IGNORECASE,
+)
+
+# Errori aggiunti al contatore dell'IP per ogni evento; 0 = solo statistica.
+# Gli errori dell'upstream dipendono dal backend e non dal client.
+DEFAULT_ERROR_CATEGORY_WEIGHTS = {
+    "limit_req": 1,
+    "limit_conn": 1,
+    "ssl_handshake": 0.5,
+    "access_forbidden": 1,
+    "not_found": 1,
+    "bad_request": 1,
+    "upstream_timeout": 0.25,
+    "upstream_error": 0,
+    "other": 0,
+}
+
+
+def classify_error(message):
+    m = ERROR_CATEGORY_REGEX.search(message)
+    return m.lastgroup if m else "other"
+
+
+def extract_error_fields(line):
+    """
+    Estrae un ErrorRecord da una riga dell'error log con una sola regex
+    ancorata. Le righe senza client (avvio, reload, ...) ritornano None.
+    """
+    m = ERROR_LINE_REGEX.match(line)
+    if m is None:
+        return None
+    time_str, level, message, ip, server, request, upstream, host = m.group(
+        "time", "level", "message", "client", "server", "request", "upstream", "host"
+    )
+    return ErrorRecord(
+        ip,
+        level,
+        classify_error(message),
+        host or server or "NON RILEVATO",
+        request or "-",
+        upstream or "-",
+        time_str,
+        message,
+    )
+
+
+def extract_error_fields_raw(line, skip_codes=()):
+    # Stessa interfaccia di CompiledFormat.extract_raw; l'error log non ha
+    # codici HTTP e ha volumi bassi, quindi si decodifica l'intera riga
+    return extract_error_fields(line.decode("utf-8", errors="replace"))
+
+
+def error_key_raw(line):
+    m = ERROR_KEY_REGEX.search(line)
+    return m.group(1) if m else None
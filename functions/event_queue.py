@@ -0,0 +1,190 @@
+import time
+import threading
+from queue import Empty
+from collections import deque
+from .debug_log import debug_log
+
+QUEUE_POLICIES = ("block", "drop_oldest", "coalesce")
+
+
+class BoundedEventQueue:
+    """
+    Coda limitata per ban e log con politica di overflow configurabile.
+
+    - block: il produttore attende spazio (al massimo put_timeout secondi,
+      None = senza limite), poi l'elemento nuovo viene scartato
+    - drop_oldest: scarta l'elemento piu' vecchio per far posto al nuovo
+    - coalesce: un elemento la cui chiave e' gia' in coda sostituisce quello
+      in attesa (mantenendone la posizione) senza occupare altro spazio; a
+      coda piena una chiave nuova attende come con block
+
+    key_fn estrae la chiave (IP) di ogni elemento. Con dedupe=True un
+    elemento la cui chiave e' gia' in coda non viene reinserito (con
+    coalesce prevale la sostituzione).
+    """
+
+    def __init__(
+        self,
+        name,
+        maxsize,
+        npm_debug_log,
+        policy="block",
+        key_fn=None,
+        dedupe=False,
+        put_timeout=None,
+    ):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(
+                f"Politica coda non valida: {policy} (valide: {', '.join(QUEUE_POLICIES)})"
+            )
+
+        self.name = name
+        self.maxsize = maxsize
+        self.npm_debug_log = npm_debug_log
+        self.policy = policy
+        self.key_fn = key_fn
+        self.dedupe = dedupe and key_fn is not None
+        self.put_timeout = put_timeout
+
+        # Elementi come [chiave, elemento]: con coalesce vengono aggiornati sul posto
+        self.items = deque()
+        self.key_counts = {}
+        # Con coalesce: chiave -> elemento in coda, al massimo uno per chiave
+        self.queued = {}
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+
+        self.metrics = {
+            "enqueued": 0,
+            "dequeued": 0,
+            "dropped": 0,
+            "deduplicated": 0,
+            "coalesced": 0,
+            "high_water": 0,
+            "enqueue_latency_total_ms": 0.0,
+            "enqueue_latency_max_ms": 0.0,
+        }
+
+    def put(self, item):
+        start = time.monotonic()
+        key = self.key_fn(item) if self.key_fn else None
+        merge = key is not None and (self.policy == "coalesce" or self.dedupe)
+        deadline = None if self.put_timeout is None else start + self.put_timeout
+
+        with self.lock:
+            timed_out = False
+            while True:
+                # Ricontrollato dopo ogni attesa: mentre il lock era libero
+                # un altro produttore puo' aver accodato la stessa chiave
+                if self.policy == "coalesce" and key is not None:
+                    entry = self.queued.get(key)
+                    if entry is not None:
+                        entry[1] = item
+                        self.metrics["coalesced"] += 1
+                        self._record_latency(start)
+                        return True
+                elif self.dedupe and key in self.key_counts:
+                    self.metrics["deduplicated"] += 1
+                    return True
+
+                if len(self.items) < self.maxsize or timed_out:
+                    break
+                timed_out = not self._make_room(key if merge else None, deadline)
+
+            if len(self.items) >= self.maxsize:
+                self.metrics["dropped"] += 1
+                self._record_latency(start)
+                dropped = True
+            else:
+                entry = [key, item]
+                self.items.append(entry)
+                if key is not None:
+                    self.key_counts[key] = self.key_counts.get(key, 0) + 1
+                    if self.policy == "coalesce":
+                        self.queued[key] = entry
+
+                self.metrics["enqueued"] += 1
+                if len(self.items) > self.metrics["high_water"]:
+                    self.metrics["high_water"] = len(self.items)
+                self._record_latency(start)
+                self.not_empty.notify()
+                if merge and len(self.items) >= self.maxsize:
+                    # Chi attende spazio con la stessa chiave ora puo' fondersi
+                    self.not_full.notify_all()
+                dropped = False
+
+        if dropped:
+            debug_log(f"Coda {self.name} piena: elemento scartato", self.npm_debug_log)
+        return not dropped
+
+    def get(self, timeout=None):
+        with self.lock:
+            if not self.items and not self.not_empty.wait_for(
+                lambda: self.items, timeout
+            ):
+                raise Empty
+            item = self._pop_left()
+            self.metrics["dequeued"] += 1
+            self.not_full.notify()
+            return item
+
+    def qsize(self):
+        with self.lock:
+            return len(self.items)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+            stats["depth"] = len(self.items)
+
+        enqueued = stats["enqueued"] + stats["dropped"]
+        stats["enqueue_latency_avg_ms"] = (
+            stats["enqueue_latency_total_ms"] / enqueued if enqueued else 0.0
+        )
+        stats["capacity"] = self.maxsize
+        stats["policy"] = self.policy
+        return stats
+
+    def _make_room(self, key, deadline):
+        # Chiamata con self.lock acquisito e coda piena. Con coalesce i
+        # duplicati sono gia' stati fusi in put: la chiave e' nuova e,
+        # come con block, si attende spazio invece di perdere l'elemento.
+        # L'attesa finisce anche se un altro produttore accoda key, che
+        # put allora fonde. False se la scadenza e' passata.
+        if self.policy == "drop_oldest":
+            self._pop_left()
+            self.metrics["dropped"] += 1
+            return True
+
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return False
+        return self.not_full.wait_for(
+            lambda: len(self.items) < self.maxsize or key in self.key_counts,
+            timeout,
+        )
+
+    def _pop_left(self):
+        entry = self.items.popleft()
+        key, item = entry
+        if key is not None:
+            self._forget_key(key)
+            if self.queued.get(key) is entry:
+                del self.queued[key]
+        return item
+
+    def _forget_key(self, key):
+        count = self.key_counts.get(key, 0) - 1
+        if count > 0:
+            self.key_counts[key] = count
+        else:
+            self.key_counts.pop(key, None)
+
+    def _record_latency(self, start):
+        latency_ms = (time.monotonic() - start) * 1000
+        self.metrics["enqueue_latency_total_ms"] += latency_ms
+        if latency_ms > self.metrics["enqueue_latency_max_ms"]:
+            self.metrics["enqueue_latency_max_ms"] = latency_ms
@@ -1,52 +1,608 @@
 import os
 import glob
+import fnmatch
 import time
+import ctypes
+import ctypes.util
+import select
+import struct
 import threading
-import subprocess
 from .debug_log import debug_log
+from .checkpoint_store import line_hash
 
+READ_CHUNK_SIZE = 1024 * 1024
+BATCH_MAX_LINES = 500
+BATCH_MAX_DELAY = 0.05
+CHECKPOINT_PROBE_SIZE = 64 * 1024
+POLL_INTERVAL = 0.5
+FULL_SCAN_INTERVAL = 5.0
 
-def tail_file(path, callback, stop_event, tail_processes, npm_debug_log):
-    try:
-        debug_log(f"Inizio tail su file: {path}", npm_debug_log)
-        with subprocess.Popen(
-            ["tail", "-F", "--lines=0", path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        ) as proc:
-            tail_processes.append(proc)
-            while not stop_event.is_set():
-                line = proc.stdout.readline()
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+# Eventi di un file nuovo: solo questi vengono letti dall'inizio
+CREATED_MASK = IN_CREATE | IN_MOVED_TO
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """Wrapper minimale su inotify(7) via ctypes, un watch per directory."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._add_watch.restype = ctypes.c_int
+
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        self.fd = fd
+        self.watch_dirs = {}
+        self.dir_watches = {}
+
+    def add_dir(self, directory):
+        if directory in self.dir_watches:
+            return
+        wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), directory)
+        self.watch_dirs[wd] = directory
+        self.dir_watches[directory] = wd
+
+    def read_events(self, timeout):
+        """
+        Ritorna ({path: maschera eventi}, overflow) attendendo al massimo
+        timeout secondi; le maschere di piu' eventi sullo stesso file si sommano.
+        """
+        try:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+        except InterruptedError:
+            return {}, False
+        if not ready:
+            return {}, False
+
+        paths = {}
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+
+            pos = 0
+            while pos + INOTIFY_EVENT_HEADER.size <= len(data):
+                wd, mask, _, name_len = INOTIFY_EVENT_HEADER.unpack_from(data, pos)
+                pos += INOTIFY_EVENT_HEADER.size
+                name = data[pos: pos + name_len].rstrip(b"\0")
+                pos += name_len
+
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                if mask & IN_IGNORED:
+                    directory = self.watch_dirs.pop(wd, None)
+                    if directory is not None:
+                        self.dir_watches.pop(directory, None)
+                    continue
+
+                directory = self.watch_dirs.get(wd)
+                if directory is not None and name:
+                    path = os.path.join(directory, os.fsdecode(name))
+                    paths[path] = paths.get(path, 0) | mask
+
+        return paths, overflow
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class TailedFile:
+    __slots__ = (
+        "path",
+        "callback",
+        "fh",
+        "inode",
+        "offset",
+        "partial",
+        "catchup_target",
+        "pending",
+        "pending_since",
+        "pending_offset",
+        "pending_hash",
+        "discovered",
+        "raw",
+        "lines",
+        "attached_at",
+    )
+
+    def __init__(self, path, callback, discovered=False, raw=False):
+        self.path = path
+        self.callback = callback
+        self.discovered = discovered
+        self.raw = raw
+        self.fh = None
+        self.inode = None
+        self.offset = 0
+        self.partial = b""
+        self.catchup_target = None
+        self.pending = []
+        self.pending_since = None
+        self.pending_offset = 0
+        self.pending_hash = None
+        self.lines = 0
+        self.attached_at = time.monotonic()
+
+
+class LogTailer:
+    """
+    Tail in-process di piu' file di log in un singolo thread.
+
+    Usa inotify sulle directory dei file (fallback su polling se non
+    disponibile), traccia inode e offset per file, gestisce rotazione e
+    troncamento e legge a blocchi di READ_CHUNK_SIZE byte.
+
+    Le righe vengono consegnate alla callback come liste: un batch parte
+    quando raggiunge batch_max_lines righe o quando la riga piu' vecchia
+    in attesa supera batch_max_delay secondi.
+
+    Con un CheckpointStore la posizione di lettura viene salvata a ogni
+    blocco: al riavvio il tail riprende dal checkpoint (se inode e hash
+    dell'ultima riga coincidono) e recupera l'arretrato alla massima
+    velocita', fino a catchup_max_bytes, prima di tornare in modalita' live.
+
+    Con watch_pattern i file che corrispondono a un glob vengono agganciati
+    appena creati e sganciati (risorse e checkpoint liberati) quando vengono
+    rimossi o rinominati altrove.
+
+    Con raw=True le righe arrivano alla callback come bytes, senza
+    decodifica UTF-8: la decodifica resta a carico di chi le analizza.
+    """
+
+    def __init__(
+        self,
+        stop_event,
+        npm_debug_log,
+        read_chunk_size=READ_CHUNK_SIZE,
+        poll_interval=POLL_INTERVAL,
+        checkpoint_store=None,
+        catchup_max_bytes=None,
+        batch_max_lines=BATCH_MAX_LINES,
+        batch_max_delay=BATCH_MAX_DELAY,
+    ):
+        self.stop_event = stop_event
+        self.npm_debug_log = npm_debug_log
+        self.read_chunk_size = read_chunk_size
+        self.poll_interval = poll_interval
+        self.checkpoint_store = checkpoint_store
+        self.catchup_max_bytes = catchup_max_bytes
+        self.batch_max_lines = batch_max_lines
+        self.batch_max_delay = batch_max_delay
+        self.pending_files = set()
+
+        self.files = {}
+        self.files_lock = threading.Lock()
+        self.patterns = []
+        self.thread = None
+
+        try:
+            self.inotify = Inotify()
+            debug_log("LogTailer: inotify attivo", npm_debug_log)
+        except Exception as e:
+            self.inotify = None
+            debug_log(
+                f"LogTailer: inotify non disponibile ({e}), uso polling ogni {poll_interval}s",
+                npm_debug_log,
+            )
+
+    def add_file(self, path, callback, from_start=False, discovered=False, raw=False):
+        with self.files_lock:
+            if path in self.files:
+                return
+
+        self._watch_dir(os.path.dirname(path) or ".")
+
+        tailed = TailedFile(path, callback, discovered=discovered, raw=raw)
+        if self._open(tailed, from_end=not from_start):
+            if not from_start:
+                self._resume_from_checkpoint(tailed)
+            debug_log(
+                f"Inizio tail su file: {path} (offset {tailed.offset})",
+                self.npm_debug_log,
+            )
+        else:
+            debug_log(
+                f"File {path} non ancora presente, in attesa di creazione",
+                self.npm_debug_log,
+            )
+
+        with self.files_lock:
+            if path in self.files:
+                self._close(tailed)
+                return
+            self.files[path] = tailed
+
+    def remove_file(self, path):
+        with self.files_lock:
+            tailed = self.files.pop(path, None)
+        if tailed is not None:
+            self.pending_files.discard(tailed)
+            self._close(tailed)
+            if self.checkpoint_store is not None:
+                self.checkpoint_store.remove(path)
+            debug_log(f"Tail terminato su file: {path}", self.npm_debug_log)
+
+    def watch_pattern(self, pattern, callback, raw=False):
+        self._watch_dir(os.path.dirname(pattern) or ".")
+        for path in sorted(glob.glob(pattern)):
+            debug_log(f"Nuovo file trovato per tail: {path}", self.npm_debug_log)
+            self.add_file(path, callback, discovered=True, raw=raw)
+        # Solo ora il thread puo' scoprire file del pattern: quelli gia'
+        # presenti sono agganciati sopra, da checkpoint o dalla fine
+        self.patterns.append((pattern, callback, raw))
+
+    def watched_files(self):
+        with self.files_lock:
+            return sorted(self.files)
+
+    def file_stats(self):
+        now = time.monotonic()
+        with self.files_lock:
+            tailed_files = list(self.files.values())
+        return {
+            tailed.path: {
+                "lines": tailed.lines,
+                "lines_per_second": tailed.lines / max(now - tailed.attached_at, 1e-6),
+            }
+            for tailed in tailed_files
+        }
+
+    def start(self, name="log_tailer"):
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def run(self):
+        debug_log("LogTailer avviato", self.npm_debug_log)
+        last_full_scan = 0.0
+
+        try:
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                full_scan = (
+                    self.inotify is None or now - last_full_scan >= FULL_SCAN_INTERVAL
+                )
+
+                if full_scan:
+                    last_full_scan = now
+                    self._check_files(self._snapshot())
+                    self._scan_patterns()
+
+                self._flush_due()
+
+                if self.checkpoint_store is not None:
+                    self.checkpoint_store.flush()
+
+                wait_timeout = (
+                    self.batch_max_delay if self.pending_files else self.poll_interval
+                )
+
+                if self.inotify is None:
+                    self.stop_event.wait(wait_timeout)
+                    continue
+
+                paths, overflow = self.inotify.read_events(wait_timeout)
+                if overflow:
+                    debug_log(
+                        "LogTailer: overflow coda inotify, scansione completa",
+                        self.npm_debug_log,
+                    )
+                    last_full_scan = 0.0
+                    continue
+                if paths:
+                    with self.files_lock:
+                        touched = [self.files[p] for p in paths if p in self.files]
+                        unknown = [p for p in paths if p not in self.files]
+                    self._check_files(touched)
+                    self._discover(
+                        [p for p in unknown if paths[p] & CREATED_MASK], created=True
+                    )
+                    self._discover([p for p in unknown if not paths[p] & CREATED_MASK])
+        except Exception as e:
+            debug_log(f"Errore critico nel LogTailer: {e}", self.npm_debug_log)
+        finally:
+            for tailed in self._snapshot():
+                self._close(tailed)
+            if self.checkpoint_store is not None:
+                self.checkpoint_store.flush(force=True)
+            if self.inotify is not None:
+                self.inotify.close()
+            debug_log("LogTailer terminato", self.npm_debug_log)
+
+    def _scan_patterns(self):
+        for pattern, _, _ in self.patterns:
+            with self.files_lock:
+                new_paths = [p for p in glob.glob(pattern) if p not in self.files]
+            self._discover(new_paths)
+
+    def _discover(self, paths, created=False):
+        """
+        Aggancia i file che corrispondono a un pattern. Dall'inizio solo se
+        appena creati (IN_CREATE/IN_MOVED_TO); quelli trovati dalla scansione
+        periodica o da IN_MODIFY possono essere vecchi log e ripartono dal
+        checkpoint o dalla fine, per non rianalizzare traffico storico.
+        """
+        for path in paths:
+            for pattern, callback, raw in self.patterns:
+                if fnmatch.fnmatchcase(path, pattern) and os.path.isfile(path):
+                    debug_log(f"Nuovo file trovato per tail: {path}", self.npm_debug_log)
+                    self.add_file(
+                        path, callback, from_start=created, discovered=True, raw=raw
+                    )
+                    # Le scritture arrivate insieme alla creazione non
+                    # genereranno altri eventi: si legge subito
+                    with self.files_lock:
+                        tailed = self.files.get(path)
+                    if tailed is not None:
+                        self._check_files([tailed])
+                    break
+
+    def _snapshot(self):
+        with self.files_lock:
+            return list(self.files.values())
+
+    def _watch_dir(self, directory):
+        if self.inotify is None:
+            return
+        try:
+            self.inotify.add_dir(directory)
+        except OSError as e:
+            debug_log(
+                f"LogTailer: impossibile osservare {directory} ({e}), resta il polling",
+                self.npm_debug_log,
+            )
+
+    def _open(self, tailed, from_end):
+        try:
+            fh = open(tailed.path, "rb", buffering=0)
+        except OSError:
+            return False
+
+        st = os.fstat(fh.fileno())
+        tailed.fh = fh
+        tailed.inode = st.st_ino
+        tailed.offset = st.st_size if from_end else 0
+        tailed.partial = b""
+        fh.seek(tailed.offset)
+        return True
+
+    def _resume_from_checkpoint(self, tailed):
+        if self.checkpoint_store is None:
+            return
+
+        size = tailed.offset
+        cp = self.checkpoint_store.get(tailed.path)
+        if cp is None:
+            return
+
+        if cp["inode"] != tailed.inode:
+            start = 0
+            reason = "inode cambiato (rotazione durante il fermo)"
+        elif cp["offset"] > size:
+            start = 0
+            reason = "file troncato durante il fermo"
+        elif self._checkpoint_matches(tailed, cp):
+            start = cp["offset"]
+            reason = "checkpoint valido"
+        else:
+            start = 0
+            reason = "hash ultima riga diverso (file riscritto)"
+
+        if self.catchup_max_bytes is not None and size - start > self.catchup_max_bytes:
+            skipped_to = self._align_to_line(tailed, size - self.catchup_max_bytes)
+            debug_log(
+                f"Catch-up {tailed.path}: arretrato di {size - start} byte oltre il limite "
+                f"di {self.catchup_max_bytes}, salto {skipped_to - start} byte",
+                self.npm_debug_log,
+            )
+            start = skipped_to
+
+        tailed.fh.seek(start)
+        tailed.offset = start
+        if start < size:
+            tailed.catchup_target = size
+        debug_log(
+            f"Ripresa {tailed.path} da offset {start}/{size}: {reason}",
+            self.npm_debug_log,
+        )
+
+    def _checkpoint_matches(self, tailed, cp):
+        offset = cp["offset"]
+        if offset == 0:
+            return True
+        start = max(0, offset - CHECKPOINT_PROBE_SIZE)
+        tailed.fh.seek(start)
+        data = tailed.fh.read(offset - start)
+        if not data.endswith(b"\n"):
+            return False
+        last_line = data[:-1].rsplit(b"\n", 1)[-1]
+        return line_hash(last_line) == cp["line_hash"]
+
+    def _align_to_line(self, tailed, position):
+        tailed.fh.seek(max(0, position - 1))
+        while True:
+            data = tailed.fh.read(CHECKPOINT_PROBE_SIZE)
+            if not data:
+                return tailed.fh.tell()
+            newline = data.find(b"\n")
+            if newline != -1:
+                return tailed.fh.tell() - len(data) + newline + 1
+
+    def _close(self, tailed):
+        if tailed.fh is not None:
+            try:
+                tailed.fh.close()
+            except OSError:
+                pass
+        tailed.fh = None
+        tailed.partial = b""
+        tailed.pending = []
+        tailed.pending_since = None
+
+    def _check_files(self, tailed_files):
+        for tailed in tailed_files:
+            if self.stop_event.is_set():
+                return
+            try:
+                self._check(tailed)
+            except Exception as e:
+                debug_log(f"Errore tail su file {tailed.path}: {e}", self.npm_debug_log)
+
+    def _check(self, tailed):
+        if tailed.fh is None:
+            if self._open(tailed, from_end=False):
+                debug_log(f"File {tailed.path} creato, tail avviato", self.npm_debug_log)
+                self._drain(tailed)
+            return
+
+        if os.fstat(tailed.fh.fileno()).st_size < tailed.offset:
+            debug_log(f"File {tailed.path} troncato, riparto da 0", self.npm_debug_log)
+            tailed.fh.seek(0)
+            tailed.offset = 0
+            tailed.partial = b""
+
+        self._drain(tailed)
+
+        try:
+            current_inode = os.stat(tailed.path).st_ino
+        except FileNotFoundError:
+            current_inode = None
+
+        if current_inode != tailed.inode:
+            self._flush_partial(tailed)
+            self._flush_pending(tailed)
+            self._close(tailed)
+            if current_inode is None and tailed.discovered:
+                debug_log(
+                    f"File {tailed.path} rimosso o rinominato, tail sganciato",
+                    self.npm_debug_log,
+                )
+                self.remove_file(tailed.path)
+            elif current_inode is None:
+                debug_log(
+                    f"File {tailed.path} rimosso, in attesa di ricreazione",
+                    self.npm_debug_log,
+                )
+            elif self._open(tailed, from_end=False):
+                debug_log(
+                    f"Rotazione rilevata su {tailed.path}, nuovo inode {tailed.inode}",
+                    self.npm_debug_log,
+                )
+                self._drain(tailed)
+
+    def _drain(self, tailed):
+        chunk_size = self.read_chunk_size
+        while not self.stop_event.is_set():
+            data = tailed.fh.read(chunk_size)
+            if not data:
+                return
+
+            tailed.offset += len(data)
+            lines = (tailed.partial + data).split(b"\n")
+            tailed.partial = lines.pop()
+            self._enqueue(tailed, lines)
+
+            if (
+                tailed.catchup_target is not None
+                and tailed.offset >= tailed.catchup_target
+            ):
+                self._flush_pending(tailed)
+                debug_log(
+                    f"Catch-up completato su {tailed.path}, passaggio a tail live",
+                    self.npm_debug_log,
+                )
+                tailed.catchup_target = None
+
+            if len(data) < chunk_size:
+                return
+
+    def _flush_partial(self, tailed):
+        if tailed.partial:
+            lines = [tailed.partial]
+            tailed.partial = b""
+            self._enqueue(tailed, lines)
+
+    def _enqueue(self, tailed, raw_lines):
+        if not raw_lines:
+            return
+
+        pending = tailed.pending
+        before = len(pending)
+        if tailed.raw:
+            for raw in raw_lines:
+                line = raw.strip()
+                if line:
+                    pending.append(line)
+        else:
+            for raw in raw_lines:
+                line = raw.decode("utf-8", errors="replace").strip()
                 if line:
-                    callback(line.strip())
-    except Exception as e:
-        debug_log(f"Errore tail su file {path}: {e}", npm_debug_log)
-
-
-def monitor_pattern(
-    pattern,
-    callback,
-    stop_event,
-    monitored_files,
-    tail_threads,
-    tail_processes,
-    npm_debug_log,
-):
-    while not stop_event.is_set():
-        current_files = set(glob.glob(pattern))
-        new_files = current_files - monitored_files
-        for file in new_files:
-            debug_log(f"Nuovo file trovato per tail: {file}", npm_debug_log)
-            thread = threading.Thread(
-                target=tail_file,
-                args=(file, callback, stop_event, tail_processes, npm_debug_log),
-                daemon=True,
+                    pending.append(line)
+        tailed.lines += len(pending) - before
+
+        tailed.pending_offset = tailed.offset - len(tailed.partial)
+        tailed.pending_hash = line_hash(raw_lines[-1])
+        if tailed.pending_since is None:
+            tailed.pending_since = time.monotonic()
+            self.pending_files.add(tailed)
+
+        if len(pending) >= self.batch_max_lines:
+            self._flush_pending(tailed)
+
+    def _flush_due(self):
+        if not self.pending_files:
+            return
+        deadline = time.monotonic() - self.batch_max_delay
+        for tailed in list(self.pending_files):
+            if tailed.pending_since is not None and tailed.pending_since <= deadline:
+                self._flush_pending(tailed)
+
+    def _flush_pending(self, tailed):
+        pending = tailed.pending
+        batch_max_lines = self.batch_max_lines
+
+        for start in range(0, len(pending), batch_max_lines):
+            try:
+                tailed.callback(pending[start: start + batch_max_lines])
+            except Exception as e:
+                debug_log(
+                    f"Errore callback su file {tailed.path}: {e}", self.npm_debug_log
+                )
+
+        if tailed.pending_since is not None and self.checkpoint_store is not None:
+            self.checkpoint_store.update(
+                tailed.path, tailed.inode, tailed.pending_offset, tailed.pending_hash
             )
-            thread.start()
-            tail_threads.append(thread)
-            monitored_files.add(file)
-        time.sleep(5)
+
+        tailed.pending = []
+        tailed.pending_since = None
+        self.pending_files.discard(tailed)
 
 
 def check_log_rotation(f, last_position, banhammer_scrapper_file):
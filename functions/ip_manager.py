@@ -1,22 +1,38 @@
 import time
+import heapq
 import threading
 from datetime import datetime
 from collections import deque
 from .debug_log import debug_log
+from .ip_table import (
+    IPTable,
+    pack_ipv4,
+    FLAG_BANNED,
+    LIST_CLEAN,
+    LIST_WATCHED,
+)
 
 MEMORY_CLEANUP_INTERVAL = 600
 IP_INACTIVITY_THRESHOLD = 3600
-MAX_IP_ENTRIES = 10000
+# Con la tabella a colonne (~60 byte per IP) un milione di IP sta in ~60MB
+MAX_IP_ENTRIES = 1000000
 CLEANUP_BATCH_SIZE = 100
+# Scadenze extra per aggiornamento nel batch: recupera l'arretrato dopo
+# una pausa senza bloccare a lungo i thread di tail
+EXPIRE_PER_UPDATE = 2
+EVICTION_LOG_EVERY = 10000
 
 
 class IPDataManager:
-    def __init__(self, time_frame, max_requests, npm_debug_log):
-        self.ip_data = {}
+    def __init__(self, time_frame, max_requests, npm_debug_log, max_entries=MAX_IP_ENTRIES):
+        self.table = IPTable()
         self.ip_data_lock = threading.RLock()
         self.time_frame = time_frame
         self.max_requests = max_requests
         self.npm_debug_log = npm_debug_log
+        self.max_entries = max_entries
+        # IP senza errori ne' ban: rimossi dopo 2 finestre di inattivita'
+        self.clean_ttl = min(IP_INACTIVITY_THRESHOLD, time_frame * 2)
 
         self.cleanup_stats = {
             "total_cleanups": 0,
@@ -25,6 +41,9 @@ class IPDataManager:
             "current_size": 0,
             "avg_cleanup_time": 0,
             "max_size_reached": 0,
+            "last_cleanup_duration": 0,
+            "total_expired": 0,
+            "total_evicted": 0,
         }
 
         self.performance_stats = {
@@ -35,136 +54,191 @@ class IPDataManager:
 
         self.cleanup_queue = deque(maxlen=1000)
 
-    def update_ip_data(self, ip, code, allowed_codes):
+        # Orologio degli eventi: ultimo timestamp di log visto e istante reale
+        # in cui e' stato visto, per confrontare last_activity nel cleanup
+        self.event_clock = None
+        self.event_clock_wall = None
+
+    def update_ip_data(self, ip, code, allowed_codes, event_ts=None):
+        return self.update_ip_data_batch([(ip, code, event_ts)], allowed_codes)[0]
+
+    def update_ip_data_batch(self, entries, allowed_codes):
+        return self.update_ip_weights_batch(
+            [
+                (ip, 0 if code in allowed_codes else 1, event_ts)
+                for ip, code, event_ts in entries
+            ]
+        )
+
+    def update_ip_weights_batch(self, entries):
+        """
+        Aggiorna gli IP con entry (ip, peso, event_ts): il peso si somma agli
+        errori della finestra (0 = richiesta senza errore). Usata anche per
+        gli eventi dell'error log, con pesi per categoria.
+        """
 
         start_time = time.time()
         now_ts = time.time()
 
         with self.ip_data_lock:
+            # Slot gia' risolti nel batch: le richieste di uno stesso client
+            # arrivano a gruppi e si evita di ricalcolare chiave e hash
+            slots = {}
+            results = [
+                self._update_locked(ip, weight, event_ts or now_ts, slots)
+                for ip, weight, event_ts in entries
+            ]
 
-            if ip not in self.ip_data and len(self.ip_data) >= MAX_IP_ENTRIES:
-                debug_log(
-                    f"Limite massimo IP raggiunto ({MAX_IP_ENTRIES}), cleanup forzato",
-                    self.npm_debug_log,
+            latest = max((entry[2] or now_ts) for entry in entries) if entries else None
+            if latest is not None and (
+                self.event_clock is None or latest > self.event_clock
+            ):
+                self.event_clock = latest
+                self.event_clock_wall = now_ts
+
+            if self.event_clock is not None:
+                self._expire_locked(
+                    self.event_clock,
+                    CLEANUP_BATCH_SIZE + EXPIRE_PER_UPDATE * len(entries),
                 )
-                self._emergency_cleanup()
-
-            if ip not in self.ip_data:
-                self.ip_data[ip] = {
-                    "errors": 0,
-                    "first_error_time": now_ts,
-                    "last_activity": now_ts,
-                    "banned": False,
-                    "total_requests": 0,
-                    "created_at": now_ts,
-                }
-
-            ip_info = self.ip_data[ip]
-            ip_info["last_activity"] = now_ts
-            ip_info["total_requests"] += 1
-
-            elapsed = now_ts - ip_info["first_error_time"]
-            if elapsed > self.time_frame:
-                total_errors = ip_info["errors"]
-                ip_info["errors"] = 0
-                ip_info["first_error_time"] = now_ts
-                ip_info["banned"] = False
-
-                if total_errors > 0:
-                    debug_log(
-                        f"IP: {ip}, Reset contatore errori, totali nel period precedente: {total_errors}",
-                        self.npm_debug_log,
-                    )
-
-            if code not in allowed_codes:
-                ip_info["errors"] += 1
-
-            result = (ip_info["errors"], ip_info["banned"])
 
         elapsed_ms = (time.time() - start_time) * 1000
-        self.performance_stats["total_updates"] += 1
+        self.performance_stats["total_updates"] += len(entries)
 
         alpha = 0.1
         current_avg = self.performance_stats["avg_update_time_ms"]
         self.performance_stats["avg_update_time_ms"] = (
-            alpha * elapsed_ms + (1 - alpha) * current_avg
+            alpha * (elapsed_ms / max(1, len(entries))) + (1 - alpha) * current_avg
         )
 
-        return result
+        return results
+
+    def _update_locked(self, ip, weight, now_ts, slots):
+        table = self.table
+        slot = slots.get(ip)
+
+        if slot is None:
+            key = pack_ipv4(ip)
+            slot = table.find(ip, key)
+            if slot < 0:
+                if len(table) >= self.max_entries:
+                    evicted_ip = self._evict_locked()
+                    # Lo slot liberato sta per essere riassegnato
+                    slots.pop(evicted_ip, None)
+                slot = table.insert(ip, now_ts, key)
+            slots[ip] = slot
+
+        # Timestamp al secondo, come nei log
+        now_ts = int(now_ts)
+        # Righe fuori ordine (piu' file, scritture ritardate) non riportano
+        # indietro il tempo dell'IP
+        last_activity = table.last_activity
+        if now_ts < last_activity[slot]:
+            now_ts = last_activity[slot]
+        last_activity[slot] = now_ts
+        table.add_request(slot)
+
+        errors = table.errors
+        elapsed = now_ts - table.first_error_time[slot]
+        if elapsed > self.time_frame:
+            total_errors = table.error_count(slot)
+            table.reset_errors(slot)
+            table.first_error_time[slot] = now_ts
+            table.set_banned(slot, False)
+
+            if total_errors > 0:
+                debug_log(
+                    f"IP: {ip}, Reset contatore errori, totali nel period precedente: {total_errors}",
+                    self.npm_debug_log,
+                )
 
-    def _emergency_cleanup(self):
+        if weight:
+            table.add_errors(slot, weight)
 
-        cleanup_start = time.time()
-        debug_log("Avvio cleanup di emergenza", self.npm_debug_log)
+        error_count = errors[slot]
+        if error_count.is_integer():
+            error_count = int(error_count)
+        banned = table.flags[slot] & FLAG_BANNED
+        table.touch(slot, error_count or banned)
+        return (error_count, bool(banned))
 
-        sorted_ips = sorted(self.ip_data.items(), key=lambda x: x[1]["last_activity"])
+    def _evict_locked(self):
+        """Con la tabella piena libera l'IP meno recente; ritorna l'IP rimosso."""
+        table = self.table
+        slot = table.oldest()
+        ip = table.ip_of(slot)
+        idle = int(self.event_clock or time.time()) - table.last_activity[slot]
+        table.remove_slot(slot)
 
-        remove_count = max(1, len(sorted_ips) // 5)
+        stats = self.cleanup_stats
+        stats["total_evicted"] += 1
+        stats["total_removed"] += 1
+        stats["max_size_reached"] = max(stats["max_size_reached"], len(table) + 1)
+        if stats["total_evicted"] % EVICTION_LOG_EVERY == 1:
+            debug_log(
+                f"Limite massimo IP raggiunto ({self.max_entries}): rimosso il meno "
+                f"recente {ip} (inattivo da {idle}s), {stats['total_evicted']} "
+                f"rimozioni per limite finora",
+                self.npm_debug_log,
+            )
+        return ip
+
+    def _expire_locked(self, now_ts, limit):
+        """
+        Rimuove dalla testa delle liste gli IP inattivi oltre la soglia, al
+        massimo limit; ritorna quanti. Le liste sono in ordine di attivita',
+        quindi ci si ferma al primo IP ancora attivo.
+        """
+        table = self.table
+        last_activity = table.last_activity
         removed = 0
-
-        for ip, _ in sorted_ips[:remove_count]:
-            del self.ip_data[ip]
-            removed += 1
-
-        elapsed = time.time() - cleanup_start
-        debug_log(
-            f"Cleanup emergenza completato: {removed} IP rimossi in {elapsed:.3f}s",
-            self.npm_debug_log,
-        )
-
-        self.cleanup_stats["total_removed"] += removed
-        self.cleanup_stats["max_size_reached"] = max(
-            self.cleanup_stats["max_size_reached"], len(self.ip_data)
-        )
+        for lst, ttl in (
+            (LIST_CLEAN, self.clean_ttl),
+            (LIST_WATCHED, IP_INACTIVITY_THRESHOLD),
+        ):
+            cutoff = now_ts - ttl
+            slot = table.head(lst)
+            while slot >= 0 and removed < limit and last_activity[slot] < cutoff:
+                table.remove_slot(slot)
+                removed += 1
+                slot = table.head(lst)
+
+        if removed:
+            self.cleanup_stats["total_expired"] += removed
+            self.cleanup_stats["total_removed"] += removed
+        return removed
+
+    def current_time(self):
+        """Ora nel tempo degli eventi: ultimo timestamp visto + tempo reale trascorso."""
+        with self.ip_data_lock:
+            if self.event_clock is None:
+                return time.time()
+            return self.event_clock + (time.time() - self.event_clock_wall)
 
     def periodic_cleanup(self):
 
+        # Le scadenze avvengono gia' ad ogni batch: qui si recuperano solo
+        # gli IP scaduti mentre non arrivavano righe, dalla testa delle liste
         cleanup_start = time.time()
         debug_log("Avvio cleanup periodico IP inattivi", self.npm_debug_log)
 
-        current_time = time.time()
+        current_time = self.current_time()
         removed_count = 0
-        processed_count = 0
-        ips_to_remove = []
-
-        with self.ip_data_lock:
-            for ip, data in list(self.ip_data.items()):
-                processed_count += 1
-
-                time_since_activity = current_time - data["last_activity"]
-                time_since_creation = current_time - data.get(
-                    "created_at", current_time
-                )
-
-                if time_since_activity > IP_INACTIVITY_THRESHOLD:
-                    ips_to_remove.append((ip, "inattività"))
-
-                elif (
-                    not data["banned"]
-                    and data["errors"] == 0
-                    and time_since_activity > (self.time_frame * 2)
-                ):
-                    ips_to_remove.append((ip, "pulito vecchio"))
-
-        batch_size = CLEANUP_BATCH_SIZE
-        for i in range(0, len(ips_to_remove), batch_size):
-            batch = ips_to_remove[i: i + batch_size]
 
+        while True:
             with self.ip_data_lock:
-                for ip, reason in batch:
-                    if ip in self.ip_data:
-                        del self.ip_data[ip]
-                        removed_count += 1
-
-            if i + batch_size < len(ips_to_remove):
-                time.sleep(0.001)
+                removed = self._expire_locked(current_time, CLEANUP_BATCH_SIZE)
+            removed_count += removed
+            if removed < CLEANUP_BATCH_SIZE:
+                break
+            time.sleep(0.001)
 
         cleanup_elapsed = time.time() - cleanup_start
 
         self.cleanup_stats["total_cleanups"] += 1
-        self.cleanup_stats["total_removed"] += removed_count
         self.cleanup_stats["last_cleanup"] = datetime.now()
-        self.cleanup_stats["current_size"] = len(self.ip_data)
+        self.cleanup_stats["current_size"] = len(self.table)
+        self.cleanup_stats["last_cleanup_duration"] = cleanup_elapsed
 
         current_avg = self.cleanup_stats["avg_cleanup_time"]
         alpha = 0.2
@@ -173,8 +247,8 @@ class IPDataManager:
         )
 
         debug_log(
-            f"Cleanup completato: {removed_count} IP rimossi su {processed_count} processati "
-            f"in {cleanup_elapsed:.3f}s, {len(self .ip_data)} IP rimanenti",
+            f"Cleanup completato: {removed_count} IP rimossi "
+            f"in {cleanup_elapsed:.3f}s, {len(self.table)} IP rimanenti",
             self.npm_debug_log,
         )
 
@@ -189,6 +263,10 @@ class IPDataManager:
         debug_log("=== STATISTICHE MEMORIA IP_DATA ===", self.npm_debug_log)
         debug_log(f"Cleanup totali: {stats['total_cleanups']}", self.npm_debug_log)
         debug_log(f"IP rimossi totali: {stats['total_removed']}", self.npm_debug_log)
+        debug_log(
+            f"  di cui scaduti: {stats['total_expired']}, per limite: {stats['total_evicted']}",
+            self.npm_debug_log,
+        )
         debug_log(f"Dimensione attuale: {stats['current_size']}", self.npm_debug_log)
         debug_log(
             f"Massima dimensione raggiunta: {stats['max_size_reached']}",
@@ -196,10 +274,15 @@ class IPDataManager:
         )
         debug_log(f"Ultimo cleanup: {stats['last_cleanup']}", self.npm_debug_log)
         debug_log(
-            f"Utilizzo memoria: {stats['current_size']}/{MAX_IP_ENTRIES} "
-            f"({(stats['current_size']/MAX_IP_ENTRIES)*100:.1f}%)",
+            f"Utilizzo memoria: {stats['current_size']}/{self.max_entries} "
+            f"({(stats['current_size']/self.max_entries)*100:.1f}%)",
             self.npm_debug_log,
         )
+        with self.ip_data_lock:
+            table_bytes = self.table.memory_bytes()
+        debug_log(
+            f"Memoria tabella IP: {table_bytes / 1024 / 1024:.1f}MB", self.npm_debug_log
+        )
         debug_log(
             f"Tempo medio cleanup: {stats['avg_cleanup_time']:.3f}s", self.npm_debug_log
         )
@@ -213,56 +296,62 @@ class IPDataManager:
         debug_log("=" * 60, self.npm_debug_log)
 
     def get_ip_info(self, ip):
+        """Copia dello stato dell'IP (dict), o None."""
         with self.ip_data_lock:
-            return self.ip_data.get(ip, None)
+            slot = self.table.find(ip)
+            return self.table.row(slot) if slot >= 0 else None
 
     def mark_as_banned(self, ip):
         with self.ip_data_lock:
-            if ip in self.ip_data:
-                self.ip_data[ip]["banned"] = True
+            slot = self.table.find(ip)
+            if slot >= 0:
+                self.table.set_banned(slot, True)
+                # Il ban segue l'aggiornamento dell'IP, che e' gia' in coda
+                self.table.touch(slot, True)
 
     def remove_ip(self, ip):
         with self.ip_data_lock:
-            if ip in self.ip_data:
-                del self.ip_data[ip]
-                return True
-            return False
+            return self.table.remove(ip)
 
     def get_stats(self):
         with self.ip_data_lock:
-            active_ips = len(self.ip_data)
-            banned_ips = sum(1 for data in self.ip_data.values() if data["banned"])
-            total_requests = sum(
-                data["total_requests"] for data in self.ip_data.values()
-            )
-            total_errors = sum(data["errors"] for data in self.ip_data.values())
+            table = self.table
+            # Totali tenuti aggiornati dalla tabella: O(1), niente scansioni
+            # delle colonne con il lock preso a ogni scrape
+            active_ips = len(table)
+            banned_ips = table.banned_total
+            total_requests = table.requests_total
+            total_errors = table.errors_total
+            table_bytes = table.memory_bytes()
 
         return {
             "active_ips": active_ips,
             "banned_ips": banned_ips,
             "total_requests": total_requests,
-            "total_errors": total_errors,
+            "total_errors": int(total_errors) if total_errors.is_integer() else total_errors,
+            "table_bytes": table_bytes,
             "cleanup_stats": self.cleanup_stats.copy(),
             "performance_stats": self.performance_stats.copy(),
         }
 
     def get_top_offenders(self, limit=10):
         with self.ip_data_lock:
-            sorted_ips = sorted(
-                self.ip_data.items(), key=lambda x: x[1]["errors"], reverse=True
+            table = self.table
+            top_slots = heapq.nlargest(
+                limit, table.live_slots(), key=table.errors.__getitem__
             )
 
             return [
                 {
-                    "ip": ip,
-                    "errors": data["errors"],
-                    "total_requests": data["total_requests"],
+                    "ip": table.ip_of(slot),
+                    "errors": table.error_count(slot),
+                    "total_requests": table.total_requests[slot],
                     "first_error_time": datetime.fromtimestamp(
-                        data["first_error_time"]
+                        table.first_error_time[slot]
                     ),
-                    "banned": data["banned"],
+                    "banned": table.is_banned(slot),
                 }
-                for ip, data in sorted_ips[:limit]
+                for slot in top_slots
             ]
 
 
@@ -0,0 +1,357 @@
+import socket
+from array import array
+
+INITIAL_CAPACITY_BITS = 10
+# Bit della colonna flags; 0 = slot libero
+FLAG_LIVE = 1
+FLAG_BANNED = 2
+# Slot nella lista degli IP con errori o bannati (LIST_WATCHED)
+FLAG_WATCHED = 4
+UINT32_MAX = 0xFFFFFFFF
+# Fine lista nelle colonne prev/next
+NIL = UINT32_MAX
+LIST_CLEAN = 0
+LIST_WATCHED = 1
+UINT64_MAX = 0xFFFFFFFFFFFFFFFF
+# Hash di Fibonacci a 64 bit: con la variante a 32 bit gli indirizzi della
+# stessa subnet finivano in gruppi contigui (3-4 sondaggi invece di ~1.3)
+FIBONACCI_64 = 0x9E3779B97F4A7C15
+
+
+def pack_ipv4(ip, _inet_pton=socket.inet_pton, _af_inet=socket.AF_INET):
+    """IPv4 come intero a 32 bit, o 0 per IPv6, 0.0.0.0 e stringhe non valide."""
+    try:
+        return int.from_bytes(_inet_pton(_af_inet, ip), "big")
+    except (OSError, TypeError):
+        return 0
+
+
+class IPTable:
+    """
+    Stato per IP in colonne parallele (array) indicizzate da uno slot,
+    invece di un dict di dict: circa 50-60 byte per IP contro i circa 370
+    di un dict per IP con chiave stringa.
+
+    Gli IPv4 sono interi a 32 bit in una tabella hash ad indirizzamento
+    aperto (anch'essa due array) che li mappa allo slot; gli altri
+    indirizzi (IPv6, valori non validi) finiscono in un dict ordinario.
+
+    Colonne: errori (float32), timestamp in secondi (uint32), richieste
+    (uint32, saturano), flag (vivo/bannato). Gli slot liberati vengono
+    azzerati e riusati.
+
+    Gli slot vivi stanno anche in due liste doppiamente collegate (colonne
+    prev/next), dal meno al piu' recente: IP puliti (LIST_CLEAN) e IP con
+    errori o bannati (LIST_WATCHED). touch() sposta uno slot in coda,
+    quindi le teste sono i primi candidati a scadenza ed eviction, in O(1)
+    senza ordinare ne' scorrere la tabella.
+
+    Non e' thread-safe: il chiamante tiene il lock (IPDataManager).
+    """
+
+    def __init__(self):
+        self.errors = array("f")
+        self.first_error_time = array("I")
+        self.last_activity = array("I")
+        self.created_at = array("I")
+        self.total_requests = array("I")
+        self.flags = bytearray()
+        self.ipv4 = array("I")
+        self.prev = array("I")
+        self.next = array("I")
+        self.heads = [NIL, NIL]
+        self.tails = [NIL, NIL]
+        self.other_ips = {}
+        self.free = array("I")
+        self.count = 0
+        # Somme sugli IP vivi, aggiornate da chi modifica le colonne
+        # (insert, remove_slot, add_request, add_errors, reset_errors, set_banned)
+        self.requests_total = 0
+        self.errors_total = 0.0
+        self.banned_total = 0
+
+        self.other = {}
+        self._allocate_index(INITIAL_CAPACITY_BITS)
+
+    def _allocate_index(self, bits):
+        capacity = 1 << bits
+        self.bits = bits
+        self.mask = capacity - 1
+        self.index_keys = array("I", bytes(4 * capacity))
+        self.index_slots = array("I", bytes(4 * capacity))
+        self.index_used = 0
+
+    def _home(self, key):
+        return ((key * FIBONACCI_64) & UINT64_MAX) >> (64 - self.bits)
+
+    def _index_find(self, key):
+        keys = self.index_keys
+        mask = self.mask
+        h = self._home(key)
+        while True:
+            k = keys[h]
+            if k == key:
+                return h
+            if not k:
+                return -1
+            h = (h + 1) & mask
+
+    def _index_insert(self, key, slot):
+        if (self.index_used + 1) * 3 > len(self.index_keys) * 2:
+            self._grow_index()
+        keys = self.index_keys
+        mask = self.mask
+        h = self._home(key)
+        while keys[h]:
+            h = (h + 1) & mask
+        keys[h] = key
+        self.index_slots[h] = slot
+        self.index_used += 1
+
+    def _index_delete(self, h):
+        # Cancellazione con spostamento all'indietro: niente lapidi, le
+        # ricerche successive restano corte
+        keys = self.index_keys
+        slots = self.index_slots
+        mask = self.mask
+        j = h
+        while True:
+            j = (j + 1) & mask
+            k = keys[j]
+            if not k:
+                break
+            home = self._home(k)
+            if (h < j and (home <= h or home > j)) or (
+                h > j and home <= h and home > j
+            ):
+                keys[h] = k
+                slots[h] = slots[j]
+                h = j
+        keys[h] = 0
+        slots[h] = 0
+        self.index_used -= 1
+
+    def _grow_index(self):
+        old_keys = self.index_keys
+        old_slots = self.index_slots
+        self._allocate_index(self.bits + 1)
+        keys = self.index_keys
+        slots = self.index_slots
+        mask = self.mask
+        for key, slot in zip(old_keys, old_slots):
+            if key:
+                h = self._home(key)
+                while keys[h]:
+                    h = (h + 1) & mask
+                keys[h] = key
+                slots[h] = slot
+        self.index_used = sum(1 for key in old_keys if key)
+
+    def find(self, ip, key=None):
+        """Slot dell'IP, o -1 se non presente. key: pack_ipv4(ip) se gia' calcolato."""
+        if key is None:
+            key = pack_ipv4(ip)
+        if not key:
+            return self.other.get(ip, -1)
+        # Come _index_find, ripetuta qui: e' il percorso di ogni riga di log
+        keys = self.index_keys
+        mask = self.mask
+        h = ((key * FIBONACCI_64) & UINT64_MAX) >> (64 - self.bits)
+        while True:
+            k = keys[h]
+            if k == key:
+                return self.index_slots[h]
+            if not k:
+                return -1
+            h = (h + 1) & mask
+
+    def insert(self, ip, now_ts, key=None):
+        """Nuovo slot per un IP non presente, con i timestamp a now_ts."""
+        if self.free:
+            slot = self.free.pop()
+        else:
+            slot = len(self.flags)
+            self.errors.append(0.0)
+            self.first_error_time.append(0)
+            self.last_activity.append(0)
+            self.created_at.append(0)
+            self.total_requests.append(0)
+            self.flags.append(0)
+            self.ipv4.append(0)
+            self.prev.append(NIL)
+            self.next.append(NIL)
+
+        if key is None:
+            key = pack_ipv4(ip)
+        if key:
+            self._index_insert(key, slot)
+            self.ipv4[slot] = key
+        else:
+            self.other[ip] = slot
+            self.other_ips[slot] = ip
+
+        now = int(now_ts)
+        self.first_error_time[slot] = now
+        self.last_activity[slot] = now
+        self.created_at[slot] = now
+        self.flags[slot] = FLAG_LIVE
+        self._link(slot, LIST_CLEAN)
+        self.count += 1
+        return slot
+
+    def remove_slot(self, slot):
+        self._unlink(slot, self._list_of(slot))
+        self.requests_total -= self.total_requests[slot]
+        self.errors_total -= self.errors[slot]
+        if self.flags[slot] & FLAG_BANNED:
+            self.banned_total -= 1
+        key = self.ipv4[slot]
+        if key:
+            self._index_delete(self._index_find(key))
+        else:
+            del self.other[self.other_ips.pop(slot)]
+
+        self.errors[slot] = 0.0
+        self.first_error_time[slot] = 0
+        self.last_activity[slot] = 0
+        self.created_at[slot] = 0
+        self.total_requests[slot] = 0
+        self.flags[slot] = 0
+        self.ipv4[slot] = 0
+        self.free.append(slot)
+        self.count -= 1
+        if not self.count:
+            # Niente errori di arrotondamento accumulati a tabella vuota
+            self.errors_total = 0.0
+
+    def _list_of(self, slot):
+        return LIST_WATCHED if self.flags[slot] & FLAG_WATCHED else LIST_CLEAN
+
+    def _link(self, slot, lst):
+        tail = self.tails[lst]
+        self.prev[slot] = tail
+        self.next[slot] = NIL
+        if tail == NIL:
+            self.heads[lst] = slot
+        else:
+            self.next[tail] = slot
+        self.tails[lst] = slot
+
+    def _unlink(self, slot, lst):
+        prev = self.prev[slot]
+        nxt = self.next[slot]
+        if prev == NIL:
+            self.heads[lst] = nxt
+        else:
+            self.next[prev] = nxt
+        if nxt == NIL:
+            self.tails[lst] = prev
+        else:
+            self.prev[nxt] = prev
+
+    def touch(self, slot, watched):
+        """Slot in coda (il piu' recente) della lista scelta da watched."""
+        lst = LIST_WATCHED if watched else LIST_CLEAN
+        current = self._list_of(slot)
+        if lst == current and self.tails[lst] == slot:
+            return
+        self._unlink(slot, current)
+        if lst != current:
+            self.flags[slot] ^= FLAG_WATCHED
+        self._link(slot, lst)
+
+    def head(self, lst):
+        """Slot meno recente della lista, o -1 se vuota."""
+        slot = self.heads[lst]
+        return -1 if slot == NIL else slot
+
+    def oldest(self):
+        """Slot con l'attivita' piu' vecchia tra le teste delle due liste, o -1."""
+        clean = self.head(LIST_CLEAN)
+        watched = self.head(LIST_WATCHED)
+        if clean < 0 or watched < 0:
+            return max(clean, watched)
+        if self.last_activity[watched] < self.last_activity[clean]:
+            return watched
+        return clean
+
+    def remove(self, ip):
+        slot = self.find(ip)
+        if slot < 0:
+            return False
+        self.remove_slot(slot)
+        return True
+
+    def ip_of(self, slot):
+        key = self.ipv4[slot]
+        if key:
+            return socket.inet_ntop(socket.AF_INET, key.to_bytes(4, "big"))
+        return self.other_ips[slot]
+
+    def live_slots(self):
+        flags = self.flags
+        return [slot for slot in range(len(flags)) if flags[slot]]
+
+    def is_banned(self, slot):
+        return bool(self.flags[slot] & FLAG_BANNED)
+
+    def set_banned(self, slot, banned):
+        flags = self.flags[slot]
+        if banned and not flags & FLAG_BANNED:
+            self.flags[slot] = flags | FLAG_BANNED
+            self.banned_total += 1
+        elif not banned and flags & FLAG_BANNED:
+            self.flags[slot] = flags & ~FLAG_BANNED
+            self.banned_total -= 1
+
+    def add_request(self, slot):
+        if self.total_requests[slot] < UINT32_MAX:
+            self.total_requests[slot] += 1
+            self.requests_total += 1
+
+    def add_errors(self, slot, weight):
+        errors = self.errors
+        before = errors[slot]
+        errors[slot] = before + weight
+        # Differenza del valore memorizzato (float32), non del peso
+        self.errors_total += errors[slot] - before
+
+    def reset_errors(self, slot):
+        self.errors_total -= self.errors[slot]
+        self.errors[slot] = 0.0
+
+    def row(self, slot):
+        return {
+            "errors": self.error_count(slot),
+            "first_error_time": self.first_error_time[slot],
+            "last_activity": self.last_activity[slot],
+            "banned": self.is_banned(slot),
+            "total_requests": self.total_requests[slot],
+            "created_at": self.created_at[slot],
+        }
+
+    def error_count(self, slot):
+        errors = self.errors[slot]
+        # Con soli pesi interi il contatore resta un intero ("Errori: 3")
+        return int(errors) if errors.is_integer() else errors
+
+    def memory_bytes(self):
+        columns = (
+            self.errors,
+            self.first_error_time,
+            self.last_activity,
+            self.created_at,
+            self.total_requests,
+            self.ipv4,
+            self.prev,
+            self.next,
+            self.free,
+            self.index_keys,
+            self.index_slots,
+        )
+        return sum(column.buffer_info()[1] * column.itemsize for column in columns) + len(
+            self.flags
+        )
+
+    def __len__(self):
+        return self.count
@@ -23,6 +23,36 @@ def load_config(CONFIG_PATH, NPM_DEBUG_LOG):
         "JAIL_NAME": "npm-docker"
     }
 
+    OPTIONAL_DEFAULTS = {
+        "CATCHUP_MAX_BYTES": 64 * 1024 * 1024,
+        "CHECKPOINT_FLUSH_INTERVAL": 2,
+        "BATCH_MAX_LINES": 500,
+        "BATCH_MAX_DELAY_MS": 50,
+        "ANALYSIS_EXECUTOR": "thread",
+        "ANALYSIS_WORKERS": 0,
+        "WORK_QUEUE_SIZE": 1000,
+        "WORK_QUEUE_PUT_TIMEOUT": 0,
+        "USE_EVENT_TIME": True,
+        "EVENT_TIME_MAX_SKEW": 60,
+        "BAN_QUEUE_SIZE": 1000,
+        "BAN_QUEUE_POLICY": "coalesce",
+        "LOG_QUEUE_SIZE": 5000,
+        "LOG_QUEUE_POLICY": "drop_oldest",
+        "EVENT_QUEUE_PUT_TIMEOUT": 1,
+        "METRICS_ENABLED": True,
+        "METRICS_HOST": "127.0.0.1",
+        "METRICS_PORT": 9877,
+        "LOG_FORMATS": {},
+        "PREFILTER_ALLOWED_CODES": True,
+        "ERROR_CATEGORY_WEIGHTS": {},
+        "PATTERN_RELOAD_INTERVAL": 2,
+        "DANGER_CACHE_SIZE": 10000,
+        "DANGER_CACHE_TTL": 3600,
+        "PATTERN_PROFILE_SAMPLE_EVERY": 1000,
+        "PATTERN_PROFILE_TOP_N": 20,
+        "MAX_IP_ENTRIES": 1000000,
+    }
+
     if not os.path.isfile(CONFIG_PATH):
         try:
             config_dir = os.path.dirname(CONFIG_PATH)
@@ -44,7 +74,13 @@ def load_config(CONFIG_PATH, NPM_DEBUG_LOG):
         debug_log(f"[ERRORE] Errore caricando JSON config: {e}", NPM_DEBUG_LOG)
         exit(f"[ERRORE FATALE] Errore caricando JSON config: {e}")
 
-    for bool_key in ["ENABLE_WHITELIST_LOG", "IGNORE_WHITELIST"]:
+    for bool_key in [
+        "ENABLE_WHITELIST_LOG",
+        "IGNORE_WHITELIST",
+        "USE_EVENT_TIME",
+        "METRICS_ENABLED",
+        "PREFILTER_ALLOWED_CODES",
+    ]:
         if bool_key in config and not isinstance(config[bool_key], bool):
             val = str(config[bool_key]).lower()
             config[bool_key] = val == "true"
@@ -56,7 +92,26 @@ def load_config(CONFIG_PATH, NPM_DEBUG_LOG):
             debug_log(f"[ERRORE] 'CODES_TO_ALLOW' deve essere una lista", NPM_DEBUG_LOG)
             exit(f"[ERRORE FATALE] 'CODES_TO_ALLOW' deve essere una lista")
 
-    for int_key in ["TIME_FRAME", "MAX_REQUESTS"]:
+    for key, default in OPTIONAL_DEFAULTS.items():
+        config.setdefault(key, default)
+
+    for int_key in [
+        "TIME_FRAME",
+        "MAX_REQUESTS",
+        "CATCHUP_MAX_BYTES",
+        "BATCH_MAX_LINES",
+        "BATCH_MAX_DELAY_MS",
+        "ANALYSIS_WORKERS",
+        "WORK_QUEUE_SIZE",
+        "EVENT_TIME_MAX_SKEW",
+        "BAN_QUEUE_SIZE",
+        "LOG_QUEUE_SIZE",
+        "METRICS_PORT",
+        "DANGER_CACHE_SIZE",
+        "PATTERN_PROFILE_SAMPLE_EVERY",
+        "PATTERN_PROFILE_TOP_N",
+        "MAX_IP_ENTRIES",
+    ]:
         if int_key in config:
             try:
                 config[int_key] = int(config[int_key])
@@ -64,6 +119,53 @@ def load_config(CONFIG_PATH, NPM_DEBUG_LOG):
                 debug_log(f"[ERRORE] '{int_key}' deve essere un intero", NPM_DEBUG_LOG)
                 exit(f"[ERRORE FATALE] '{int_key}' deve essere un intero")
 
+    for float_key in [
+        "CHECKPOINT_FLUSH_INTERVAL",
+        "WORK_QUEUE_PUT_TIMEOUT",
+        "EVENT_QUEUE_PUT_TIMEOUT",
+        "PATTERN_RELOAD_INTERVAL",
+        "DANGER_CACHE_TTL",
+    ]:
+        try:
+            config[float_key] = float(config[float_key])
+        except Exception:
+            debug_log(f"[ERRORE] '{float_key}' deve essere un numero", NPM_DEBUG_LOG)
+            exit(f"[ERRORE FATALE] '{float_key}' deve essere un numero")
+
+    if config["ANALYSIS_EXECUTOR"] not in ("thread", "process"):
+        debug_log(
+            f"[ERRORE] 'ANALYSIS_EXECUTOR' deve essere 'thread' o 'process'",
+            NPM_DEBUG_LOG,
+        )
+        exit(f"[ERRORE FATALE] 'ANALYSIS_EXECUTOR' deve essere 'thread' o 'process'")
+
+    for policy_key in ["BAN_QUEUE_POLICY", "LOG_QUEUE_POLICY"]:
+        if config[policy_key] not in ("block", "drop_oldest", "coalesce"):
+            debug_log(
+                f"[ERRORE] '{policy_key}' deve essere 'block', 'drop_oldest' o 'coalesce'",
+                NPM_DEBUG_LOG,
+            )
+            exit(
+                f"[ERRORE FATALE] '{policy_key}' deve essere 'block', 'drop_oldest' o 'coalesce'"
+            )
+
+    weights = config["ERROR_CATEGORY_WEIGHTS"]
+    if not isinstance(weights, dict) or not all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) and v >= 0
+        for v in weights.values()
+    ):
+        debug_log(
+            f"[ERRORE] 'ERROR_CATEGORY_WEIGHTS' deve essere un oggetto categoria -> peso (>= 0)",
+            NPM_DEBUG_LOG,
+        )
+        exit(
+            f"[ERRORE FATALE] 'ERROR_CATEGORY_WEIGHTS' deve essere un oggetto categoria -> peso (>= 0)"
+        )
+
+    if not isinstance(config["LOG_FORMATS"], dict):
+        debug_log(f"[ERRORE] 'LOG_FORMATS' deve essere un oggetto glob -> formato", NPM_DEBUG_LOG)
+        exit(f"[ERRORE FATALE] 'LOG_FORMATS' deve essere un oggetto glob -> formato")
+
     for key in REQUIRED_KEYS:
         if key not in config:
             debug_log(f"[ERRORE] Config: parametro mancante '{key}'", NPM_DEBUG_LOG)
@@ -4,16 +4,19 @@ import json
 from functions.debug_log import debug_log
 
 
-def load_pattern_file(filepath, log_path):
-    debug_log(f"Caricamento dei pattern da: {filepath}", log_path)
-    pattern_map = {}
+def read_pattern_entries(filepath, allow_plain=True):
+    """
+    Voci di un file di pattern JSONL nell'ordine del file.
 
-    if not os.path.isfile(filepath):
-        debug_log(f"File pattern non trovato: {filepath}", log_path)
-        return pattern_map
+    Il backend scrive i file come log di sole aggiunte: una riga con un
+    "id" gia' visto sostituisce la voce precedente (mantenendone la
+    posizione), {"id": ..., "deleted": true} la rimuove. Con allow_plain
+    sono accettate anche righe "pattern = descrizione".
 
-    total_patterns = 0
-    valid_patterns = 0
+    Ritorna (voci, righe non valide) come liste di (numero riga, ...).
+    """
+    entries = {}
+    invalid = []
 
     with open(filepath, "r", encoding="utf-8") as f:
         for line_num, line in enumerate(f, start=1):
@@ -21,42 +24,55 @@ def load_pattern_file(filepath, log_path):
             if not line or line.startswith("#"):
                 continue
 
-            total_patterns += 1
-
             try:
                 entry = json.loads(line)
-                pattern = entry.get("pattern", "")
-                description = entry.get("description", "")
-
-                if pattern:
-                    try:
-                        re.compile(pattern)
-                        valid_patterns += 1
-                        pattern_map[pattern] = description
-                    except re.error as e:
-                        debug_log(
-                            f"Regex non valida al rigo {line_num} in {filepath}: {pattern} - Errore: {e}",
-                            log_path,
-                        )
             except json.JSONDecodeError:
+                entry = None
+            if not isinstance(entry, dict):
+                if not allow_plain or "=" not in line:
+                    invalid.append((line_num, line))
+                    continue
+                pattern, description = line.split("=", 1)
+                entry = {"pattern": pattern.strip(), "description": description.strip()}
+
+            key = entry.get("id", line_num)
+            if entry.get("deleted"):
+                entries.pop(key, None)
+                continue
+            entries[key] = (line_num, entry)
+
+    return list(entries.values()), invalid
+
+
+def load_pattern_file(filepath, log_path, rejected=None):
+    debug_log(f"Caricamento dei pattern da: {filepath}", log_path)
+    pattern_map = {}
+
+    if not os.path.isfile(filepath):
+        debug_log(f"File pattern non trovato: {filepath}", log_path)
+        return pattern_map
+
+    entries, invalid = read_pattern_entries(filepath)
+    if rejected is not None:
+        rejected.extend(line for _, line in invalid)
 
-                if "=" in line:
-                    pattern, description = line.split("=", 1)
-                    pattern = pattern.strip()
-                    description = description.strip()
-
-                    try:
-                        re.compile(pattern)
-                        valid_patterns += 1
-                        pattern_map[pattern] = description
-                    except re.error as e:
-                        debug_log(
-                            f"Regex non valida al rigo {line_num} in {filepath}: {pattern} - Errore: {e}",
-                            log_path,
-                        )
+    for line_num, entry in entries:
+        pattern = entry.get("pattern", "")
+        if not pattern:
+            continue
+        try:
+            re.compile(pattern)
+            pattern_map[pattern] = entry.get("description", "")
+        except re.error as e:
+            if rejected is not None:
+                rejected.append(pattern)
+            debug_log(
+                f"Regex non valida al rigo {line_num} in {filepath}: {pattern} - Errore: {e}",
+                log_path,
+            )
 
     debug_log(
-        f"{valid_patterns}/{total_patterns} pattern validi caricati da {filepath}",
+        f"{len(pattern_map)}/{len(entries) + len(invalid)} pattern validi caricati da {filepath}",
         log_path,
     )
     return pattern_map
@@ -0,0 +1,388 @@
+import os
+import re
+import json
+import fnmatch
+from collections import namedtuple
+from .debug_log import debug_log
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+    JSON_DECODER = "orjson"
+except ImportError:
+    json_loads = json.loads
+    JSON_DECODER = "json"
+
+LogRecord = namedtuple(
+    "LogRecord", ["ip", "status", "host", "method", "url", "user_agent", "time"]
+)
+
+PRESETS = {
+    # Formato "proxy" di Nginx Proxy Manager (proxy-host-*_access.log)
+    "npm_proxy": (
+        "[$time_local] $upstream_cache_status $upstream_status $status - "
+        '$request_method $scheme $host "$request_uri" [Client $remote_addr] '
+        "[Length $body_bytes_sent] [Gzip $gzip_ratio] [Sent-to $server] "
+        '"$http_user_agent" "$http_referer"'
+    ),
+    # Formato "standard" di Nginx Proxy Manager
+    "npm_standard": (
+        '[$time_local] $status - $request_method $scheme $host "$request_uri" '
+        "[Client $remote_addr] [Length $body_bytes_sent] [Gzip $gzip_ratio] "
+        '"$http_user_agent" "$http_referer"'
+    ),
+    # Formato combined di nginx (fallback e default host)
+    "combined": (
+        '$remote_addr - $remote_user [$time_local] "$request" $status '
+        '$body_bytes_sent "$http_referer" "$http_user_agent"'
+    ),
+    # Log JSON con chiavi uguali ai nomi delle variabili nginx
+    "json": "json",
+}
+
+DEFAULT_LOG_FORMATS = {
+    "fallback_access.log": "combined",
+    "default-host_access.log": "combined",
+    "proxy-host-*_access.log": "npm_proxy",
+}
+
+VARIABLE_REGEX = re.compile(r"\$(?:\{(\w+)\}|(\w+))")
+JSON_FIELD_REGEX = re.compile(r'"([^"]+)"\s*:\s*"?\$\{?(\w+)\}?')
+REQUEST_REGEX = re.compile(r'(\w+)\s+([^\s]+)\s+HTTP/[\d.]"?')
+
+VARIABLE_PATTERNS = {
+    "status": r"\d{3}",
+    "time_local": r"\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2} [+-]\d{4}",
+    "upstream_status": r"\S+(?:, \S+)*",
+    "upstream_addr": r"\S+(?:, \S+)*",
+    "upstream_response_time": r"\S+(?:, \S+)*",
+}
+
+FIELD_SOURCES = {
+    "ip": ("remote_addr",),
+    "status": ("status",),
+    "host": ("host", "http_host", "server_name"),
+    "method": ("request_method",),
+    "url": ("request_uri", "uri"),
+    "user_agent": ("http_user_agent",),
+    "time": ("time_local", "time_iso8601"),
+}
+
+MAGIC_CHARS = "*?["
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz")
+ROTATION_SUFFIX_REGEX = re.compile(r"\.\d+$")
+
+
+def _variable_pattern(name, next_char):
+    if name in VARIABLE_PATTERNS:
+        return VARIABLE_PATTERNS[name]
+    if next_char is None:
+        return r".*"
+    return f"[^{re.escape(next_char)}]*"
+
+
+def compile_log_format(log_format):
+    """
+    Converte una stringa log_format nginx in una regex con gruppi nominati
+    per ogni variabile. Ogni variabile cattura fino al carattere letterale
+    che la segue. Ritorna (regex, nomi delle variabili, regex ridotta che
+    si ferma a $remote_addr per estrarre solo l'IP).
+    """
+    parts = []
+    names = []
+    position = 0
+    key_regex = None
+
+    for match in VARIABLE_REGEX.finditer(log_format):
+        name = match.group(1) or match.group(2)
+        parts.append(re.escape(log_format[position : match.start()]))
+        next_char = log_format[match.end()] if match.end() < len(log_format) else None
+
+        pattern = _variable_pattern(name, next_char)
+        if name in names:
+            parts.append(f"(?:{pattern})")
+        else:
+            parts.append(f"(?P<{name}>{pattern})")
+            names.append(name)
+            if name == "remote_addr":
+                key_regex = re.compile("^" + "".join(parts))
+        position = match.end()
+
+    parts.append(re.escape(log_format[position:]))
+
+    if "remote_addr" not in names or "status" not in names:
+        raise ValueError("il log_format deve contenere $remote_addr e $status")
+
+    return re.compile("^" + "".join(parts)), names, key_regex
+
+
+def _first_present(names, candidates):
+    for candidate in candidates:
+        if candidate in names:
+            return candidate
+    return None
+
+
+class CompiledFormat:
+    """
+    Estrattore compilato per un formato di log.
+
+    extract(riga) ritorna un LogRecord o None; key(riga) ritorna l'IP
+    client, usato per il partizionamento tra processi.
+
+    extract_raw e key_raw lavorano sulle righe in bytes lette dal tail:
+    con skip_codes le righe con quei codici HTTP vengono riconosciute
+    senza decodificare nulla e extract_raw ritorna solo il codice (int).
+    """
+
+    def __init__(self, name, spec, fallback=None):
+        self.name = name
+        self.spec = spec
+        self.fallback = fallback
+
+        if spec == "json" or spec.lstrip().startswith("{"):
+            self.regex = None
+            self.fetch = self._json_keys(spec)
+            self.key_regex = re.compile(
+                rf'"{re.escape(self.fetch[0])}"\s*:\s*"([^"]*)"'
+            )
+            self.raw_key_regex = re.compile(self.key_regex.pattern.encode("utf-8"))
+            self.extract = self._extract_json
+            self.extract_raw = self._extract_json_raw
+            self.key = self._key_json
+            self.key_raw = self._key_json_raw
+            return
+
+        regex, names, self.key_regex = compile_log_format(spec)
+
+        groups = {
+            field: _first_present(names, candidates)
+            for field, candidates in FIELD_SOURCES.items()
+        }
+        groups["request"] = None
+        if "request" in names and (groups["method"] is None or groups["url"] is None):
+            groups["request"] = "request"
+
+        # I campi assenti dal formato diventano gruppi vuoti in coda alla
+        # regex, cosi' un'unica chiamata group() restituisce sempre tutto
+        missing = [field for field, group in groups.items() if group is None]
+        self.regex = re.compile(
+            regex.pattern + "".join(f"(?P<_missing_{field}>)" for field in missing)
+        )
+        self.fetch = tuple(
+            group if group is not None else f"_missing_{field}"
+            for field, group in groups.items()
+        )
+
+        self.raw_regex = re.compile(self.regex.pattern.encode("utf-8"))
+        self.raw_key_regex = re.compile(self.key_regex.pattern.encode("utf-8"))
+
+        self.extract = self._extract_regex
+        self.extract_raw = self._extract_regex_raw
+        if spec.startswith("$remote_addr "):
+            self.key = self._key_leading
+            self.key_raw = self._key_leading_raw
+        else:
+            self.key = self._key_regex
+            self.key_raw = self._key_regex_raw
+
+    def _json_keys(self, spec):
+        """Chiavi JSON da leggere, nell'ordine dei campi di LogRecord + request."""
+        if spec == "json":
+            variables = {
+                candidate: candidate
+                for candidates in FIELD_SOURCES.values()
+                for candidate in candidates
+            }
+            variables["request"] = "request"
+        else:
+            variables = {var: key for key, var in JSON_FIELD_REGEX.findall(spec)}
+
+        keys = {
+            field: next(
+                (variables[c] for c in candidates if c in variables), None
+            )
+            for field, candidates in FIELD_SOURCES.items()
+        }
+        # request serve solo se mancano metodo o URL nella singola riga
+        keys["request"] = variables.get("request")
+        if keys["ip"] is None or keys["status"] is None:
+            raise ValueError("il formato JSON deve contenere remote_addr e status")
+        # Le chiavi assenti diventano "" e data.get("") restituisce None
+        return tuple(key or "" for key in keys.values())
+
+    def _extract_regex(self, line):
+        m = self.regex.match(line)
+        if m is None:
+            return self.fallback(line) if self.fallback else None
+        return self._make_record(m.group(*self.fetch))
+
+    def _extract_regex_raw(self, line, skip_codes=()):
+        m = self.raw_regex.match(line)
+        if m is None:
+            # Anche il parser di fallback deve scartare i codici permessi
+            record = self._extract_regex(line.decode("utf-8", errors="replace"))
+            if record is not None and record.status in skip_codes:
+                return record.status
+            return record
+        values = m.group(*self.fetch)
+        if skip_codes:
+            try:
+                status = int(values[1])
+            except ValueError:
+                return None
+            if status in skip_codes:
+                return status
+        return self._make_record(
+            [value.decode("utf-8", errors="replace") for value in values]
+        )
+
+    def _extract_json(self, line):
+        # orjson e json accettano sia str che bytes
+        try:
+            data = json_loads(line)
+        except ValueError:
+            return None
+        if type(data) is not dict:
+            return None
+        return self._make_record(tuple(map(data.get, self.fetch)))
+
+    def _extract_json_raw(self, line, skip_codes=()):
+        record = self._extract_json(line)
+        if record is not None and record.status in skip_codes:
+            return record.status
+        return record
+
+    def _make_record(self, values):
+        ip, status, host, method, url, user_agent, time_str, request = values
+        if not ip:
+            return None
+        try:
+            status = int(status)
+        except (TypeError, ValueError):
+            return None
+
+        if request and (not method or not url):
+            method, url = "-", "-"
+            req_match = REQUEST_REGEX.match(request)
+            if req_match:
+                method = req_match.group(1)
+                url = req_match.group(2)
+
+        return LogRecord(
+            ip,
+            status,
+            host or "NON RILEVATO",
+            method or None,
+            url or None,
+            user_agent or None,
+            time_str or None,
+        )
+
+    def _key_leading(self, line):
+        return line.split(" ", 1)[0]
+
+    def _key_leading_raw(self, line):
+        return line.split(b" ", 1)[0]
+
+    def _key_regex(self, line):
+        m = self.key_regex.match(line)
+        if m is None:
+            return self._key_from_record(line)
+        return m.group("remote_addr")
+
+    def _key_regex_raw(self, line):
+        m = self.raw_key_regex.match(line)
+        if m is None:
+            return self._key_from_record(line.decode("utf-8", errors="replace"))
+        return m.group("remote_addr")
+
+    def _key_json(self, line):
+        m = self.key_regex.search(line)
+        if m is None:
+            return self._key_from_record(line)
+        return m.group(1)
+
+    def _key_json_raw(self, line):
+        m = self.raw_key_regex.search(line)
+        if m is None:
+            return self._key_from_record(line)
+        return m.group(1)
+
+    def _key_from_record(self, line):
+        record = self.extract(line)
+        return record.ip if record else None
+
+
+class LogFormatRegistry:
+    """
+    Formati di log configurati per glob di file (chiave LOG_FORMATS in
+    conf.local). Il valore puo' essere il nome di un preset, una stringa
+    log_format nginx o un template JSON; null disattiva un glob di default.
+    Ogni formato viene compilato una sola volta e condiviso tra i glob.
+    """
+
+    def __init__(self, log_formats, npm_debug_log, fallbacks=None):
+        self.npm_debug_log = npm_debug_log
+        self.fallbacks = fallbacks or {}
+        self.formats = {}
+        self.globs = []
+        self._by_spec = {}
+
+        for preset in PRESETS:
+            self.compile(preset)
+
+        configured = dict(DEFAULT_LOG_FORMATS)
+        configured.update(log_formats or {})
+
+        for pattern, spec in configured.items():
+            if not spec:
+                continue
+            try:
+                compiled = self.compile(spec, pattern)
+            except (ValueError, re.error) as e:
+                debug_log(
+                    f"Formato di log non valido per {pattern}: {e}", npm_debug_log
+                )
+                continue
+            self.globs.append((pattern, compiled.name))
+            debug_log(
+                f"Formato log per {pattern}: {compiled.name}", npm_debug_log
+            )
+
+    def compile(self, spec, pattern=None):
+        compiled = self._by_spec.get(spec)
+        if compiled is not None:
+            return compiled
+
+        if spec in PRESETS:
+            name = spec
+            log_format = PRESETS[spec]
+        else:
+            name = pattern or f"custom_{len(self._by_spec)}"
+            log_format = spec
+
+        compiled = CompiledFormat(name, log_format, self.fallbacks.get(name))
+        self._by_spec[spec] = compiled
+        self.formats[name] = compiled
+        return compiled
+
+    def get(self, name):
+        return self.formats[name]
+
+    def match(self, path):
+        """Formato per un file, ignorando suffissi di compressione e rotazione."""
+        name = os.path.basename(path)
+        if name.endswith(COMPRESSED_SUFFIXES):
+            name = os.path.splitext(name)[0]
+        name = ROTATION_SUFFIX_REGEX.sub("", name)
+
+        for pattern, format_name in self.globs:
+            if fnmatch.fnmatch(name, os.path.basename(pattern)):
+                return format_name
+        return None
+
+
+def has_magic(pattern):
+    return any(char in pattern for char in MAGIC_CHARS)
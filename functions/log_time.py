@@ -0,0 +1,78 @@
+import time
+from functools import lru_cache
+from datetime import datetime, timezone, timedelta
+
+LOG_TIME_CACHE_SIZE = 4096
+
+MONTHS = {
+    "Jan": 1,
+    "Feb": 2,
+    "Mar": 3,
+    "Apr": 4,
+    "May": 5,
+    "Jun": 6,
+    "Jul": 7,
+    "Aug": 8,
+    "Sep": 9,
+    "Oct": 10,
+    "Nov": 11,
+    "Dec": 12,
+}
+
+
+@lru_cache(maxsize=LOG_TIME_CACHE_SIZE)
+def parse_log_time(value):
+    """
+    Converte un timestamp nginx $time_local ("17/Oct/2026:10:00:00 +0200")
+    o $time_iso8601 ("2026-10-17T10:00:00+02:00") in epoch (float); accetta
+    anche l'ora locale dell'error log ("2026/10/17 10:00:00").
+    Ritorna None se il formato non e' riconosciuto.
+
+    La granularita' e' al secondo, quindi le righe consecutive condividono
+    la stessa stringa e la cache evita quasi tutte le conversioni.
+    """
+    try:
+        if value[4:5] == "-":
+            return datetime.fromisoformat(value).timestamp()
+        if value[4:5] == "/":
+            return datetime(
+                int(value[0:4]),
+                int(value[5:7]),
+                int(value[8:10]),
+                int(value[11:13]),
+                int(value[14:16]),
+                int(value[17:19]),
+            ).timestamp()
+
+        day = int(value[0:2])
+        month = MONTHS[value[3:6]]
+        year = int(value[7:11])
+        hour = int(value[12:14])
+        minute = int(value[15:17])
+        second = int(value[18:20])
+
+        offset = value[21:26]
+        if offset:
+            sign = -1 if offset[0] == "-" else 1
+            tz = timezone(
+                sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+            )
+        else:
+            tz = timezone.utc
+
+        return datetime(year, month, day, hour, minute, second, tzinfo=tz).timestamp()
+    except (KeyError, ValueError, IndexError):
+        return None
+
+
+def resolve_event_time(value, max_skew):
+    """
+    Tempo evento di una riga: timestamp del log se valido, altrimenti ora.
+    Timestamp nel futuro oltre max_skew secondi (orologi disallineati)
+    vengono riportati all'ora corrente.
+    """
+    now = time.time()
+    event_ts = parse_log_time(value) if value else None
+    if event_ts is None or event_ts > now + max_skew:
+        return now
+    return event_ts
@@ -0,0 +1,281 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .debug_log import debug_log
+
+METRICS_PREFIX = "nginx_shield"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class MetricsWriter:
+    """Costruisce il testo in formato Prometheus, campioni raggruppati per famiglia."""
+
+    def __init__(self):
+        self.families = {}
+
+    def _family(self, full_name, metric_type, help_text):
+        lines = self.families.get(full_name)
+        if lines is None:
+            lines = [f"# HELP {full_name} {help_text}", f"# TYPE {full_name} {metric_type}"]
+            self.families[full_name] = lines
+        return lines
+
+    def sample(self, name, metric_type, help_text, value, labels=None):
+        full_name = f"{METRICS_PREFIX}_{name}"
+        lines = self._family(full_name, metric_type, help_text)
+        lines.append(f"{full_name}{_labels(labels)} {float(value)}")
+
+    def histogram(self, name, help_text, hist, labels=None):
+        full_name = f"{METRICS_PREFIX}_{name}"
+        lines = self._family(full_name, "histogram", help_text)
+
+        labels = labels or {}
+        for bound, count in hist["buckets_ms"].items():
+            le = bound if bound == "+Inf" else str(float(bound) / 1000)
+            lines.append(
+                f"{full_name}_bucket{_labels({**labels, 'le': le})} {float(count)}"
+            )
+        lines.append(f"{full_name}_sum{_labels(labels)} {hist['sum_seconds']}")
+        lines.append(f"{full_name}_count{_labels(labels)} {float(hist['count'])}")
+
+    def render(self):
+        return "".join(
+            "\n".join(lines) + "\n" for lines in self.families.values()
+        )
+
+
+def render_metrics(stats, ip_stats):
+    w = MetricsWriter()
+
+    w.sample("uptime_seconds", "gauge", "Secondi dall'avvio", stats["uptime_seconds"])
+    w.sample(
+        "lines_processed_total",
+        "counter",
+        "Righe di log lette",
+        stats["lines_processed"],
+    )
+    for stage, lines in stats["stages"].items():
+        w.sample(
+            "stage_lines_total",
+            "counter",
+            "Righe fermate da ciascuna fase della pipeline (logged: arrivate al log)",
+            lines,
+            {"stage": stage},
+        )
+    w.sample("bans_total", "counter", "Ban eseguiti", stats["bans_executed"])
+
+    for path, file_stats in stats["files"].items():
+        w.sample(
+            "file_lines_total",
+            "counter",
+            "Righe lette per file",
+            file_stats["lines"],
+            {"file": path},
+        )
+        w.sample(
+            "file_lines_per_second",
+            "gauge",
+            "Righe al secondo per file (media dall'apertura)",
+            file_stats["lines_per_second"],
+            {"file": path},
+        )
+
+    for category, events in stats["error_events"].items():
+        w.sample(
+            "error_events_total",
+            "counter",
+            "Eventi dell'error log per categoria",
+            events,
+            {"category": category},
+        )
+
+    pattern_reload = stats["pattern_reload"]
+    w.sample(
+        "pattern_reloads_total",
+        "counter",
+        "Reload a caldo di pattern e blacklist",
+        pattern_reload["reloads"],
+    )
+    w.sample(
+        "pattern_reload_failures_total",
+        "counter",
+        "Reload di pattern falliti (restano i matcher precedenti)",
+        pattern_reload["failures"],
+    )
+    w.sample(
+        "pattern_compile_seconds",
+        "gauge",
+        "Durata dell'ultima compilazione dei pattern",
+        pattern_reload["last_compile_seconds"],
+    )
+    w.sample(
+        "pattern_rejected",
+        "gauge",
+        "Voci scartate all'ultimo reload dei pattern",
+        pattern_reload["last_rejected"],
+    )
+    if pattern_reload["store_version"] is not None:
+        w.sample(
+            "pattern_store_version",
+            "gauge",
+            "Versione del pattern store del backend vista dall'ultimo controllo",
+            pattern_reload["store_version"],
+        )
+
+    for source, failures in stats["parse_failures"].items():
+        w.sample(
+            "parse_failures_total",
+            "counter",
+            "Righe non riconosciute dal parser",
+            failures,
+            {"source": source},
+        )
+
+    for cache_name, cache in stats["caches"].items():
+        labels = {"cache": cache_name}
+        w.sample("cache_hits_total", "counter", "Hit delle cache", cache["hits"], labels)
+        w.sample(
+            "cache_misses_total", "counter", "Miss delle cache", cache["misses"], labels
+        )
+        w.sample("cache_size", "gauge", "Elementi in cache", cache["size"], labels)
+
+    for queue_name in ("work_queue", "ban_queue", "log_queue"):
+        queue_stats = stats[queue_name]
+        labels = {"queue": queue_name}
+        w.sample("queue_depth", "gauge", "Elementi in coda", queue_stats["depth"], labels)
+        w.sample(
+            "queue_capacity", "gauge", "Capacita' della coda", queue_stats["capacity"], labels
+        )
+        w.sample(
+            "queue_dropped_total",
+            "counter",
+            "Elementi scartati per coda piena",
+            queue_stats.get("dropped", queue_stats.get("batches_dropped", 0)),
+            labels,
+        )
+
+    for name, hist in stats["stage_latency"].items():
+        if name == "ban_latency":
+            w.histogram(
+                "ban_latency_seconds",
+                "Tempo tra rilevamento e ban completato su fail2ban",
+                hist,
+            )
+        elif name.startswith("regex:"):
+            w.histogram(
+                "regex_seconds",
+                "Tempo di matching regex per file di pattern (solo cache miss)",
+                hist,
+                {"pattern_file": name.split(":", 1)[1]},
+            )
+        else:
+            w.histogram(
+                "stage_latency_seconds",
+                "Latenza per batch delle fasi di analisi",
+                hist,
+                {"stage": name},
+            )
+
+    cleanup_stats = ip_stats["cleanup_stats"]
+    w.sample("ip_table_size", "gauge", "IP tracciati in memoria", ip_stats["active_ips"])
+    w.sample(
+        "ip_table_bytes",
+        "gauge",
+        "Memoria delle colonne della tabella IP",
+        ip_stats["table_bytes"],
+    )
+    w.sample(
+        "ip_cleanup_total", "counter", "Cleanup periodici", cleanup_stats["total_cleanups"]
+    )
+    w.sample(
+        "ip_cleanup_removed_total",
+        "counter",
+        "IP rimossi dai cleanup",
+        cleanup_stats["total_removed"],
+    )
+    w.sample(
+        "ip_expired_total",
+        "counter",
+        "IP rimossi per inattivita'",
+        cleanup_stats["total_expired"],
+    )
+    w.sample(
+        "ip_evicted_total",
+        "counter",
+        "IP meno recenti rimossi per il limite MAX_IP_ENTRIES",
+        cleanup_stats["total_evicted"],
+    )
+    w.sample(
+        "ip_cleanup_duration_seconds",
+        "gauge",
+        "Durata dell'ultimo cleanup",
+        cleanup_stats.get("last_cleanup_duration", 0),
+    )
+
+    return w.render()
+
+
+class MetricsServer:
+    """
+    Endpoint HTTP /metrics in formato Prometheus.
+
+    collect() viene chiamata ad ogni richiesta e deve restituire il testo
+    delle metriche; il server ascolta di default solo su localhost.
+    """
+
+    def __init__(self, host, port, collect, npm_debug_log):
+        self.host = host
+        self.port = port
+        self.collect = collect
+        self.npm_debug_log = npm_debug_log
+        self.httpd = None
+
+    def start(self):
+        collect = self.collect
+        npm_debug_log = self.npm_debug_log
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                try:
+                    body = collect().encode("utf-8")
+                except Exception as e:
+                    debug_log(f"Errore generazione metriche: {e}", npm_debug_log)
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        thread = threading.Thread(
+            target=self.httpd.serve_forever, name="metrics_server", daemon=True
+        )
+        thread.start()
+        debug_log(
+            f"Endpoint metriche attivo su http://{self.host}:{self.port}/metrics",
+            self.npm_debug_log,
+        )
+        return thread
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
@@ -0,0 +1,307 @@
+import re
+from collections import deque
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+REGEX_META = set(".^$*+?{}[]|()")
+# Sotto queste soglie il ciclo su "in" e' piu' veloce dell'automa
+# (in Python puro e in C, misurate su user agent di ~120 caratteri)
+AHOCORASICK_MIN_WORDS = 160
+PYAHOCORASICK_MIN_WORDS = 8
+# Atomi piu' corti filtrano troppo poco: la regex viene provata sempre
+MIN_ATOM_LENGTH = 2
+
+
+def literal_of(pattern):
+    """
+    Testo letterale equivalente alla regex, o None se usa metacaratteri.
+    Gli escape di punteggiatura ("robots\\.txt") restano letterali.
+    """
+    chars = []
+    escaped = False
+    for char in pattern:
+        if escaped:
+            if char.isalnum():
+                return None
+            chars.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char in REGEX_META:
+            return None
+        else:
+            chars.append(char)
+    if escaped or not chars:
+        return None
+    return "".join(chars)
+
+
+class AhoCorasick:
+    """
+    Automa Aho-Corasick in Python puro.
+
+    search(testo) ritorna la prima parola trovata (o None), finditer(testo)
+    tutte le parole trovate in ordine di posizione.
+    """
+
+    def __init__(self, words):
+        goto = [{}]
+        fail = [0]
+        output = [()]
+
+        for word in words:
+            node = 0
+            for char in word:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    fail.append(0)
+                    output.append(())
+                node = next_node
+            if word not in output[node]:
+                output[node] += (word,)
+
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in goto[node].items():
+                queue.append(next_node)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[next_node] = goto[state].get(char, 0)
+                output[next_node] += output[fail[next_node]]
+
+        self.goto = goto
+        self.fail = fail
+        self.output = output
+
+    def search(self, text):
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                return output[node][0]
+        return None
+
+    def finditer(self, text):
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                yield from output[node]
+
+
+class LiteralSet:
+    """
+    Ricerca di sottostringhe su molte parole in una sola scansione.
+
+    Usa pyahocorasick se installato, altrimenti l'automa in Python puro;
+    con poche parole resta il semplice ciclo su "in".
+    """
+
+    def __init__(self, words):
+        self.words = tuple(dict.fromkeys(words))
+
+        if ahocorasick is not None and len(self.words) >= PYAHOCORASICK_MIN_WORDS:
+            self.backend = "pyahocorasick"
+            self.automaton = ahocorasick.Automaton()
+            for word in self.words:
+                self.automaton.add_word(word, word)
+            self.automaton.make_automaton()
+            self.search = self._search_pyahocorasick
+            self.finditer = self._finditer_pyahocorasick
+        elif len(self.words) >= AHOCORASICK_MIN_WORDS:
+            self.backend = "aho-corasick"
+            automaton = AhoCorasick(self.words)
+            self.search = automaton.search
+            self.finditer = automaton.finditer
+        else:
+            self.backend = "loop"
+            self.search = self._search_loop
+            self.finditer = self._finditer_loop
+
+    def _search_loop(self, text):
+        for word in self.words:
+            if word in text:
+                return word
+        return None
+
+    def _finditer_loop(self, text):
+        return [word for word in self.words if word in text]
+
+    def _search_pyahocorasick(self, text):
+        for _, word in self.automaton.iter(text):
+            return word
+        return None
+
+    def _finditer_pyahocorasick(self, text):
+        return (word for _, word in self.automaton.iter(text))
+
+    def __len__(self):
+        return len(self.words)
+
+
+def _required_atoms(items):
+    """
+    Insieme di sottostringhe di cui almeno una deve comparire in ogni match
+    (dall'albero di sre_parse), o None se non se ne ricava nessuna.
+    """
+    candidates = []
+    run = []
+
+    def flush():
+        if run:
+            candidates.append({"".join(run)})
+            run.clear()
+
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        flush()
+        if op is sre_parse.SUBPATTERN:
+            atoms = _required_atoms(av[-1])
+            if atoms:
+                candidates.append(atoms)
+        elif op is sre_parse.BRANCH:
+            branches = [_required_atoms(branch) for branch in av[1]]
+            if all(branches):
+                candidates.append(set().union(*branches))
+    flush()
+
+    best = None
+    for atoms in candidates:
+        if best is None or min(map(len, atoms)) > min(map(len, best)):
+            best = atoms
+    return best
+
+
+def required_atoms(pattern, flags=0):
+    try:
+        atoms = _required_atoms(sre_parse.parse(pattern, flags))
+    except Exception:
+        return None
+    if not atoms or min(map(len, atoms)) < MIN_ATOM_LENGTH:
+        return None
+    return atoms
+
+
+class RegexSet:
+    """
+    Molte regex con una sola scansione del testo, con prefiltro come nei
+    set di RE2/Hyperscan: per ogni regex si ricavano le sottostringhe
+    obbligatorie (atomi), cercate tutte insieme con Aho-Corasick; solo le
+    regex dei cui atomi almeno uno compare vengono eseguite.
+
+    Le regex senza atomi utilizzabili vengono provate sempre, una per una.
+    """
+
+    def __init__(self, patterns, flags=0):
+        self.lowercase = bool(flags & re.IGNORECASE)
+        self.by_atom = {}
+        self.unfiltered = []
+        # (pattern, regex) nell'ordine originale, per il profilo per pattern
+        self.compiled = []
+
+        for pattern in dict.fromkeys(patterns):
+            compiled = re.compile(pattern, flags)
+            self.compiled.append((pattern, compiled))
+            atoms = required_atoms(pattern, flags)
+            if atoms is None:
+                self.unfiltered.append((compiled, pattern))
+                continue
+            for atom in atoms:
+                if self.lowercase:
+                    atom = atom.lower()
+                self.by_atom.setdefault(atom, []).append((compiled, pattern))
+
+        self.count = len(self.compiled)
+        self.atoms = LiteralSet(self.by_atom)
+
+    def search(self, text):
+        if self.by_atom:
+            seen = set()
+            key = text.lower() if self.lowercase else text
+            for atom in self.atoms.finditer(key):
+                if atom in seen:
+                    continue
+                seen.add(atom)
+                for compiled, pattern in self.by_atom[atom]:
+                    if compiled.search(text):
+                        return pattern
+        for compiled, pattern in self.unfiltered:
+            if compiled.search(text):
+                return pattern
+        return None
+
+    def __len__(self):
+        return self.count
+
+
+class PatternSet:
+    """
+    Insieme di pattern (regex o testo) con una sola ricerca:
+    prima i letterali (Aho-Corasick), poi le regex con prefiltro (RegexSet).
+    Le regex non valide vengono trattate come testo. Con re.IGNORECASE
+    letterali e testo vengono confrontati in minuscolo.
+    """
+
+    def __init__(self, patterns, flags=0):
+        self.lowercase = bool(flags & re.IGNORECASE)
+        self.sources = {}
+        regexes = []
+        for pattern in patterns:
+            literal = literal_of(pattern)
+            if literal is None:
+                try:
+                    re.compile(pattern, flags)
+                except re.error:
+                    literal = pattern
+            if literal is None:
+                regexes.append(pattern)
+                continue
+            if self.lowercase:
+                literal = literal.lower()
+            self.sources.setdefault(literal, pattern)
+
+        self.literals = LiteralSet(self.sources)
+        self.regexes = RegexSet(regexes, flags)
+
+    def search(self, text):
+        """Ritorna il pattern trovato nel testo (letterale o regex) o None."""
+        if self.literals.words:
+            found = self.literals.search(text.lower() if self.lowercase else text)
+            if found is not None:
+                return self.sources[found]
+        if self.regexes.count:
+            return self.regexes.search(text)
+        return None
+
+    def get_stats(self):
+        return {
+            "literal_patterns": len(self.literals),
+            "literal_backend": self.literals.backend,
+            "regex_patterns": len(self.regexes),
+            "unfiltered_regex_patterns": len(self.regexes.unfiltered),
+        }
@@ -1,10 +1,77 @@
 import re
 from .debug_log import debug_log
+from .multi_pattern import LiteralSet, required_atoms
+
+
+class PatternClassifier:
+    """
+    Mappa pattern -> descrizione compilata una sola volta al caricamento.
+
+    classify(testo) ritorna la descrizione del primo pattern, nell'ordine
+    del file, che trova il testo (stessa priorita' del ciclo di
+    match_pattern). Le sottostringhe obbligatorie dei pattern vengono
+    cercate in un'unica scansione e si provano solo le regex candidate.
+    """
+
+    def __init__(
+        self, mapping, flags=re.IGNORECASE, label="pattern", npm_debug_log=None
+    ):
+        self.lowercase = bool(flags & re.IGNORECASE)
+        self.entries = []
+        self.by_atom = {}
+        self.rejected = []
+        unfiltered = []
+
+        for pattern, descrizione in mapping.items():
+            try:
+                compiled = re.compile(pattern, flags)
+            except re.error as e:
+                self.rejected.append(pattern)
+                if npm_debug_log:
+                    debug_log(
+                        f"Regex non valida in {label}: {pattern} - Errore: {e}",
+                        npm_debug_log,
+                    )
+                continue
+
+            index = len(self.entries)
+            self.entries.append((compiled, descrizione))
+            atoms = required_atoms(pattern, flags)
+            if atoms is None:
+                unfiltered.append(index)
+                continue
+            for atom in atoms:
+                if self.lowercase:
+                    atom = atom.lower()
+                self.by_atom.setdefault(atom, []).append(index)
+
+        self.unfiltered = tuple(unfiltered)
+        self.atoms = LiteralSet(self.by_atom)
+        self.compiled = [(compiled.pattern, compiled) for compiled, _ in self.entries]
+
+    def classify(self, testo, default=None):
+        candidates = set(self.unfiltered)
+        if self.by_atom:
+            key = testo.lower() if self.lowercase else testo
+            for atom in self.atoms.finditer(key):
+                candidates.update(self.by_atom[atom])
+
+        entries = self.entries
+        for index in sorted(candidates):
+            compiled, descrizione = entries[index]
+            if compiled.search(testo):
+                return descrizione
+        return default
+
+    def __len__(self):
+        return len(self.entries)
 
 
 def match_pattern(stringa, mapping, default, label="pattern", npm_debug_log=None):
     if not stringa:
         return None if "user agent" in label.lower() else default
+    if isinstance(mapping, PatternClassifier):
+        return mapping.classify(stringa, default)
     for pattern, descrizione in mapping.items():
         try:
             if re.search(pattern, stringa, re.IGNORECASE):
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import itertools
+import threading
+from .debug_log import debug_log
+
+PROFILE_SAMPLE_EVERY = 1000
+PROFILE_TOP_N = 20
+PROFILE_FLUSH_INTERVAL = 30
+SAMPLE_TEXT_LENGTH = 200
+
+
+class PatternProfiler:
+    """
+    Profilo per pattern sul traffico reale, a campione.
+
+    Una ricerca su sample_every (tra quelle non servite dalle cache) viene
+    ripetuta provando una per una tutte le regex dell'insieme, misurando
+    il tempo di ciascuna. Il costo resta quindi limitato ai campioni e il
+    prefiltro degli atomi non nasconde le regex lente.
+
+    flush() scrive i top_n pattern piu' lenti (tempo medio) in un file
+    JSON letto dal backend per /api/patterns/stats.
+    """
+
+    def __init__(
+        self,
+        path,
+        npm_debug_log,
+        sample_every=PROFILE_SAMPLE_EVERY,
+        top_n=PROFILE_TOP_N,
+    ):
+        self.path = path
+        self.npm_debug_log = npm_debug_log
+        self.sample_every = sample_every
+        self.top_n = top_n
+        self.calls = itertools.count(1)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.samples = 0
+        self.started = time.time()
+
+    def sample(self, kind, compiled, text):
+        """compiled: sequenza di (pattern, regex compilata) del file `kind`."""
+        if not compiled or next(self.calls) % self.sample_every:
+            return
+
+        timings = []
+        perf_counter = time.perf_counter
+        for pattern, regex in compiled:
+            start = perf_counter()
+            regex.search(text)
+            timings.append((pattern, perf_counter() - start))
+
+        with self.lock:
+            self.samples += 1
+            for pattern, elapsed in timings:
+                entry = self.stats.get((kind, pattern))
+                if entry is None:
+                    entry = self.stats[(kind, pattern)] = [0, 0.0, 0.0, ""]
+                entry[0] += 1
+                entry[1] += elapsed
+                if elapsed > entry[2]:
+                    entry[2] = elapsed
+                    entry[3] = text[:SAMPLE_TEXT_LENGTH]
+
+    def reset(self):
+        # Dopo un reload i pattern possono essere cambiati
+        with self.lock:
+            self.stats.clear()
+            self.samples = 0
+            self.started = time.time()
+
+    def top(self, n=None):
+        with self.lock:
+            items = [
+                (kind, pattern, count, total, worst, worst_text)
+                for (kind, pattern), (count, total, worst, worst_text) in self.stats.items()
+            ]
+        items.sort(key=lambda item: item[3] / item[2], reverse=True)
+        return [
+            {
+                "type": kind,
+                "pattern": pattern,
+                "samples": count,
+                "avg_us": total / count * 1e6,
+                "max_us": worst * 1e6,
+                "slowest_input": worst_text,
+            }
+            for kind, pattern, count, total, worst, worst_text in items[: n or self.top_n]
+        ]
+
+    def snapshot(self):
+        return {
+            "pid": os.getpid(),
+            "updated": time.time(),
+            "started": self.started,
+            "sample_every": self.sample_every,
+            "samples": self.samples,
+            "patterns": self.top(),
+        }
+
+    def flush(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            debug_log(
+                f"Errore scrittura profilo pattern {self.path}: {e}", self.npm_debug_log
+            )
+
+    def monitor(self, interval=PROFILE_FLUSH_INTERVAL, stop_event=None):
+        debug_log(
+            f"Profilo pattern attivo: 1 ricerca su {self.sample_every}, file {self.path}",
+            self.npm_debug_log,
+        )
+        while not stop_event.wait(interval):
+            self.flush()
+        self.flush()
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import threading
+from .debug_log import debug_log
+
+# Con il file di versione del backend, controllo completo dei file
+# (modifiche a mano) solo una volta ogni FULL_SCAN_EVERY giri
+FULL_SCAN_EVERY = 15
+
+
+class PatternReloader:
+    """
+    Ricarica a caldo dei file di pattern e blacklist, senza riavviare
+    l'analyzer (e senza perdere i contatori degli IP).
+
+    Il monitor confronta mtime, dimensione e inode dei file ogni `interval`
+    secondi. Se qualcosa cambia, build() compila i nuovi matcher nel thread
+    del monitor, fuori dal percorso delle righe, e swap() li pubblica con un
+    solo assegnamento: le righe in corso finiscono con i matcher vecchi.
+
+    Con version_path (il contatore scritto dal PatternStore del backend a
+    ogni modifica) ogni giro costa una sola stat; i file vengono comunque
+    controllati tutti ogni full_scan_every giri.
+
+    build() ritorna (matcher, voci scartate).
+    """
+
+    def __init__(
+        self,
+        paths,
+        build,
+        swap,
+        npm_debug_log,
+        version_path=None,
+        full_scan_every=FULL_SCAN_EVERY,
+    ):
+        self.paths = tuple(paths)
+        self.build = build
+        self.swap = swap
+        self.npm_debug_log = npm_debug_log
+        self.version_path = version_path
+        self.full_scan_every = full_scan_every
+        self.polls = 0
+        self.rescan = False
+        self.version_signature = self._stat(version_path)
+        self.version = self._read_version()
+        self.signature = self._signature()
+        self.lock = threading.Lock()
+        self.reloads = 0
+        self.failures = 0
+        self.last_compile_seconds = 0.0
+        self.last_rejected = 0
+
+    def _stat(self, path):
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _signature(self):
+        return tuple(self._stat(path) for path in self.paths)
+
+    def _read_version(self):
+        if self.version_path is None:
+            return None
+        try:
+            with open(self.version_path, "r", encoding="utf-8") as f:
+                return int(json.load(f)["version"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def check(self):
+        """Ricarica se un file e' cambiato; ritorna True se i matcher sono stati sostituiti."""
+        with self.lock:
+            self.polls += 1
+            if self.version_path is not None:
+                version_signature = self._stat(self.version_path)
+                if version_signature != self.version_signature:
+                    self.version_signature = version_signature
+                    self.version = self._read_version()
+                elif self.polls % self.full_scan_every and not self.rescan:
+                    return False
+
+            signature = self._signature()
+            if signature == self.signature:
+                return False
+            return self._reload(signature)
+
+    def reload(self):
+        with self.lock:
+            return self._reload(self._signature())
+
+    def _reload(self, signature):
+        start = time.perf_counter()
+        try:
+            matchers, rejected = self.build()
+        except Exception as e:
+            # Restano attivi i matcher precedenti; si riprova alla prossima modifica
+            self.failures += 1
+            self.signature = signature
+            debug_log(f"Reload pattern fallito, restano i precedenti: {e}", self.npm_debug_log)
+            return False
+        elapsed = time.perf_counter() - start
+
+        # File riscritto durante la lettura: si ricarica anche al prossimo giro
+        self.rescan = self._signature() != signature
+        if not self.rescan:
+            self.signature = signature
+
+        self.swap(matchers)
+        self.reloads += 1
+        self.last_compile_seconds = elapsed
+        self.last_rejected = len(rejected)
+
+        debug_log(
+            f"Pattern ricaricati in {elapsed * 1000:.1f}ms, "
+            f"voci scartate: {len(rejected)}",
+            self.npm_debug_log,
+        )
+        for entry in rejected:
+            debug_log(f"  Voce scartata: {entry}", self.npm_debug_log)
+        return True
+
+    def monitor(self, interval=2, stop_event=None):
+        debug_log("Monitor reload pattern avviato", self.npm_debug_log)
+        while not stop_event.wait(interval):
+            self.check()
+
+    def get_stats(self):
+        return {
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_compile_seconds": self.last_compile_seconds,
+            "last_rejected": self.last_rejected,
+            "store_version": self.version,
+        }
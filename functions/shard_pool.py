@@ -0,0 +1,95 @@
+import zlib
+import multiprocessing
+from queue import Empty
+from .debug_log import debug_log
+
+SHARD_QUEUE_SIZE = 1000
+SHARD_JOIN_TIMEOUT = 5
+
+
+def shard_index(key, num_shards):
+    if not key:
+        return 0
+    if isinstance(key, str):
+        key = key.encode("utf-8", errors="replace")
+    return zlib.crc32(key) % num_shards
+
+
+class ShardPool:
+    """
+    Pool di processi worker con partizionamento per chiave (IP client).
+
+    Ogni worker riceve solo le righe degli IP assegnati al proprio shard,
+    quindi possiede in esclusiva la sua parte di stato e non servono lock
+    tra processi. I risultati (ban e log) tornano su un'unica coda di
+    uscita consumata dal processo principale.
+    """
+
+    def __init__(self, num_workers, worker_target, npm_debug_log):
+        self.num_workers = num_workers
+        self.worker_target = worker_target
+        self.npm_debug_log = npm_debug_log
+
+        ctx = multiprocessing.get_context("fork")
+        self.input_queues = [
+            ctx.Queue(maxsize=SHARD_QUEUE_SIZE) for _ in range(num_workers)
+        ]
+        self.output_queue = ctx.Queue()
+        self.processes = [
+            ctx.Process(
+                target=worker_target,
+                args=(index, self.input_queues[index], self.output_queue),
+                name=f"shard_worker_{index}",
+                daemon=True,
+            )
+            for index in range(num_workers)
+        ]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        debug_log(
+            f"ShardPool avviato con {self.num_workers} processi worker",
+            self.npm_debug_log,
+        )
+
+    def dispatch(self, source, lines, key_fn):
+        shards = [[] for _ in range(self.num_workers)]
+        for line in lines:
+            shards[shard_index(key_fn(line), self.num_workers)].append(line)
+
+        for index, shard_lines in enumerate(shards):
+            if shard_lines:
+                self.input_queues[index].put(("lines", source, shard_lines))
+
+    def send_to_owner(self, key, message):
+        self.input_queues[shard_index(key, self.num_workers)].put(message)
+
+    def collect(self, handler, stop_event, timeout=0.5):
+        debug_log("Collector risultati shard avviato", self.npm_debug_log)
+        while not stop_event.is_set():
+            try:
+                result = self.output_queue.get(timeout=timeout)
+            except Empty:
+                continue
+            try:
+                handler(result)
+            except Exception as e:
+                debug_log(f"Errore gestione risultato shard: {e}", self.npm_debug_log)
+        debug_log("Collector risultati shard terminato", self.npm_debug_log)
+
+    def stop(self):
+        for input_queue in self.input_queues:
+            try:
+                input_queue.put(None, timeout=1)
+            except Exception:
+                pass
+
+        for process in self.processes:
+            process.join(timeout=SHARD_JOIN_TIMEOUT)
+            if process.is_alive():
+                debug_log(
+                    f"Worker {process.name} ancora vivo dopo join, terminazione forzata",
+                    self.npm_debug_log,
+                )
+                process.terminate()
@@ -0,0 +1,134 @@
+import threading
+from numbers import Number
+
+# Limiti superiori (ms) dei bucket degli istogrammi di latenza
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class ThreadCounters:
+    """
+    Contatori e istogrammi per thread, senza lock sul percorso caldo.
+
+    Ogni thread scrive solo nei propri dizionari (threading.local); la
+    somma tra thread viene calcolata solo in lettura da snapshot().
+    """
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self.local = threading.local()
+        self.shards = []
+        self.shards_lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = ({}, {})
+            self.local.shard = shard
+            with self.shards_lock:
+                self.shards.append(shard)
+            return shard
+
+    def add(self, name, value=1):
+        counters = self._shard()[0]
+        counters[name] = counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        histograms = self._shard()[1]
+        hist = histograms.get(name)
+        if hist is None:
+            # bucket..., +Inf, somma (secondi), conteggio
+            hist = [0] * (len(self.buckets_ms) + 3)
+            histograms[name] = hist
+
+        elapsed_ms = seconds * 1000
+        index = 0
+        for bound in self.buckets_ms:
+            if elapsed_ms <= bound:
+                break
+            index += 1
+        hist[index] += 1
+        hist[-2] += seconds
+        hist[-1] += 1
+
+    def raw_snapshot(self):
+        """Somme tra thread non formattate: (contatori, istogrammi come liste)."""
+        with self.shards_lock:
+            shards = list(self.shards)
+
+        counters = {}
+        histograms = {}
+        for shard_counters, shard_histograms in shards:
+            _merge_raw(counters, histograms, shard_counters.copy(), shard_histograms.copy())
+        return counters, histograms
+
+    def snapshot(self, extra=()):
+        """
+        Contatori e istogrammi formattati; extra: altri raw_snapshot() da
+        sommare (es. quelli dei processi shard).
+        """
+        counters, histograms = self.raw_snapshot()
+        for extra_counters, extra_histograms in extra:
+            _merge_raw(counters, histograms, extra_counters, extra_histograms)
+
+        return counters, {
+            name: self._format_histogram(hist) for name, hist in histograms.items()
+        }
+
+    def _format_histogram(self, hist):
+        count = hist[-1]
+        buckets = {}
+        cumulative = 0
+        for bound, value in zip(self.buckets_ms + ("+Inf",), hist[:-2]):
+            cumulative += value
+            buckets[str(bound)] = cumulative
+        return {
+            "buckets_ms": buckets,
+            "sum_seconds": hist[-2],
+            "count": count,
+            "avg_ms": hist[-2] * 1000 / count if count else 0.0,
+        }
+
+
+def _merge_raw(counters, histograms, other_counters, other_histograms):
+    for name, value in other_counters.items():
+        counters[name] = counters.get(name, 0) + value
+    for name, hist in other_histograms.items():
+        total = histograms.get(name)
+        if total is None:
+            histograms[name] = list(hist)
+        else:
+            for i, value in enumerate(hist):
+                total[i] += value
+
+
+def merge_stats(stats_list, max_keys=()):
+    """
+    Somma campo per campo dizionari di statistiche con la stessa forma (anche
+    annidati), es. quelle dei processi shard. I campi in max_keys (medie,
+    durate, TTL) prendono il massimo; quelli non numerici l'ultimo valore non
+    None. hit_rate viene ricalcolato da hits e misses.
+    """
+    merged = {}
+    nested = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            if isinstance(value, dict):
+                nested.setdefault(key, []).append(value)
+            elif isinstance(value, Number) and not isinstance(value, bool):
+                if key not in merged:
+                    merged[key] = value
+                elif key in max_keys:
+                    merged[key] = max(merged[key], value)
+                else:
+                    merged[key] += value
+            elif value is not None or key not in merged:
+                merged[key] = value
+
+    for key, values in nested.items():
+        merged[key] = merge_stats(values, max_keys)
+
+    if "hit_rate" in merged and "hits" in merged and "misses" in merged:
+        total = merged["hits"] + merged["misses"]
+        merged["hit_rate"] = merged["hits"] / total if total else 0.0
+    return merged
@@ -0,0 +1,71 @@
+import time
+import threading
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache LRU con scadenza: al massimo maxsize voci, ognuna valida per ttl
+    secondi dall'inserimento (ttl <= 0: nessuna scadenza).
+
+    get() ritorna MISSING se la chiave non c'e' o e' scaduta, cosi' anche
+    None puo' essere messo in cache.
+    """
+
+    def __init__(self, maxsize, ttl=0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key, MISSING)
+            if item is MISSING:
+                self.misses += 1
+                return MISSING
+            value, expires = item
+            if expires and expires <= self.clock():
+                del self.data[key]
+                self.expired += 1
+                self.misses += 1
+                return MISSING
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        expires = self.clock() + self.ttl if self.ttl > 0 else 0
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "size": len(self.data),
+            "capacity": self.maxsize,
+            "ttl": self.ttl,
+        }
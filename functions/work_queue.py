@@ -0,0 +1,205 @@
+import time
+import threading
+import multiprocessing
+from queue import Queue, Empty, Full
+from concurrent.futures import ProcessPoolExecutor
+from .debug_log import debug_log
+from .shard_pool import shard_index
+
+WORK_QUEUE_SIZE = 1000
+# Di default il tail non attende mai: e' un solo thread per tutti i file,
+# quindi una partizione piena bloccherebbe la lettura di ogni host
+WORK_QUEUE_PUT_TIMEOUT = 0.0
+EXECUTOR_KINDS = ("thread", "process")
+
+
+class AnalysisWorkQueue:
+    """
+    Coda limitata tra il tail dei file e l'analisi delle righe.
+
+    Il tail inserisce batch (source, righe); num_workers thread consumer
+    li estraggono ed eseguono prepare(source, righe) seguito da
+    apply(source, preparato). Con executor "process" la fase prepare
+    (pura, senza stato condiviso) gira in un ProcessPoolExecutor, mentre
+    apply resta nei thread del processo principale.
+
+    Ogni consumer ha la sua coda: submit() divide il batch per hash della
+    chiave di ogni riga (l'IP client, come ShardPool), quindi le righe di
+    uno stesso IP vengono applicate da un solo thread e nell'ordine del
+    file. Le finestre di errore per IP non vedono mai eventi fuori ordine;
+    tra IP diversi l'ordine non conta.
+
+    Se la coda di una partizione e' piena il batch di quella partizione
+    viene scartato e conteggiato nelle metriche; con put_timeout > 0 il
+    produttore prima attende fino a put_timeout secondi, fermando nel
+    frattempo il tail di tutti i file.
+    """
+
+    def __init__(
+        self,
+        prepare,
+        apply,
+        num_workers,
+        npm_debug_log,
+        executor="thread",
+        maxsize=WORK_QUEUE_SIZE,
+        put_timeout=WORK_QUEUE_PUT_TIMEOUT,
+    ):
+        if executor not in EXECUTOR_KINDS:
+            raise ValueError(
+                f"Executor non valido: {executor} (validi: {', '.join(EXECUTOR_KINDS)})"
+            )
+
+        self.prepare = prepare
+        self.apply = apply
+        self.num_workers = num_workers
+        self.npm_debug_log = npm_debug_log
+        self.executor_kind = executor
+        self.put_timeout = put_timeout
+
+        self.capacity = maxsize
+        partition_size = max(1, maxsize // num_workers)
+        self.queues = [Queue(maxsize=partition_size) for _ in range(num_workers)]
+        self.process_pool = None
+        self.threads = []
+
+        self.metrics_lock = threading.Lock()
+        self.metrics = {
+            "batches_enqueued": 0,
+            "lines_enqueued": 0,
+            "batches_dropped": 0,
+            "lines_dropped": 0,
+            "blocked_time_seconds": 0.0,
+            "max_depth": 0,
+        }
+
+    def start_pool(self):
+        """
+        Crea i processi dell'executor "process". Va chiamato prima di avviare
+        qualsiasi thread: un fork con altri thread attivi puo' copiare nei
+        figli lock gia' presi (logging, stdio, code) e bloccarli per sempre.
+        """
+        if self.executor_kind != "process" or self.process_pool is not None:
+            return
+
+        self.process_pool = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context("fork"),
+        )
+        # I processi nascono alla prima submit: la forziamo ora, finche'
+        # il processo ha un solo thread
+        self.process_pool.submit(int).result()
+
+    def start(self, stop_event):
+        self.start_pool()
+
+        for index in range(self.num_workers):
+            thread = threading.Thread(
+                target=self._consume,
+                args=(self.queues[index], stop_event),
+                name=f"analysis_worker_{index}",
+                daemon=True,
+            )
+            thread.start()
+            self.threads.append(thread)
+
+        debug_log(
+            f"Coda di analisi avviata: {self.num_workers} worker ({self.executor_kind}), "
+            f"capacita' {self.capacity} batch",
+            self.npm_debug_log,
+        )
+        return self.threads
+
+    def submit(self, source, lines, key_fn=None):
+        """
+        Accoda le righe; key_fn(riga) da' la chiave di partizione (IP client).
+        Senza key_fn il batch resta intero e va alla coda scelta da source.
+        """
+        num_queues = len(self.queues)
+        if key_fn is None or num_queues == 1:
+            batches = {shard_index(source, num_queues): lines}
+        else:
+            batches = {}
+            for line in lines:
+                batches.setdefault(shard_index(key_fn(line), num_queues), []).append(
+                    line
+                )
+
+        accepted = True
+        for index, batch in batches.items():
+            if not self._put(self.queues[index], source, batch):
+                accepted = False
+        return accepted
+
+    def _put(self, queue, source, lines):
+        item = (source, lines)
+        try:
+            queue.put_nowait(item)
+            blocked = 0.0
+        except Full:
+            start = time.monotonic()
+            dropped = True
+            if self.put_timeout > 0:
+                try:
+                    queue.put(item, timeout=self.put_timeout)
+                    dropped = False
+                except Full:
+                    pass
+            blocked = time.monotonic() - start
+
+            if dropped:
+                with self.metrics_lock:
+                    self.metrics["batches_dropped"] += 1
+                    self.metrics["lines_dropped"] += len(lines)
+                    self.metrics["blocked_time_seconds"] += blocked
+                debug_log(
+                    f"Coda di analisi piena: scartato batch di {len(lines)} righe ({source})",
+                    self.npm_debug_log,
+                )
+                return False
+
+        depth = self.depth()
+        with self.metrics_lock:
+            self.metrics["batches_enqueued"] += 1
+            self.metrics["lines_enqueued"] += len(lines)
+            self.metrics["blocked_time_seconds"] += blocked
+            if depth > self.metrics["max_depth"]:
+                self.metrics["max_depth"] = depth
+        return True
+
+    def depth(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+    def get_stats(self):
+        with self.metrics_lock:
+            stats = dict(self.metrics)
+        stats["depth"] = self.depth()
+        stats["capacity"] = self.capacity
+        stats["executor"] = self.executor_kind
+        stats["workers"] = self.num_workers
+        return stats
+
+    def shutdown(self):
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _consume(self, queue, stop_event):
+        while not stop_event.is_set():
+            try:
+                source, lines = queue.get(timeout=0.5)
+            except Empty:
+                continue
+
+            try:
+                if self.process_pool is not None:
+                    prepared = self.process_pool.submit(
+                        self.prepare, source, lines
+                    ).result()
+                else:
+                    prepared = self.prepare(source, lines)
+                self.apply(source, prepared)
+            except Exception as e:
+                debug_log(
+                    f"Errore nell'analisi di un batch ({source}): {e}",
+                    self.npm_debug_log,
+                )
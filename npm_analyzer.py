@@ -1,26 +1,44 @@
 import os
 import sys
 import time
+import glob
+import gzip
+import bz2
+import lzma
 import signal
 import threading
-import re
+import argparse
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
-from queue import Queue, Empty
+from queue import Empty
 from functools import lru_cache
-from collections import deque
+from collections import namedtuple
 
 from functions.debug_log import debug_log
 from functions.load_config import load_config
 from functions.load_pattern_file import load_pattern_file
 from functions.whitelist_manager import WhitelistManager
-from functions.pattern_matcher import get_status_meaning
-from functions.log_writer import log_event
+from functions.pattern_matcher import get_status_meaning, PatternClassifier
 from functions.ip_manager import IPDataManager, start_memory_cleanup_thread
 from functions.ban_manager import should_ban_ip, ban_and_reset, setup_db
-from functions.file_monitor import tail_file, monitor_pattern
+from functions.file_monitor import LogTailer
+from functions.checkpoint_store import CheckpointStore
+from functions.shard_pool import ShardPool
+from functions.work_queue import AnalysisWorkQueue
+from functions.event_queue import BoundedEventQueue
+from functions.stats_counters import ThreadCounters, merge_stats
+from functions.metrics_server import MetricsServer, render_metrics
 from functions.blacklist_manager import load_blacklists_once
+from functions.pattern_reloader import PatternReloader
+from functions.pattern_profiler import PatternProfiler, PROFILE_FLUSH_INTERVAL
 from functions.signal_handler import handle_signal
+from functions.log_time import resolve_event_time, parse_log_time
+from functions.log_parsers import extract_proxy_fields_legacy, format_error_entry
+from functions.error_log import (
+    DEFAULT_ERROR_CATEGORY_WEIGHTS,
+    extract_error_fields_raw,
+    error_key_raw,
+)
+from functions.log_formats import LogFormatRegistry, has_magic
 
 APPLICATION_ROOT = os.path.dirname(os.path.abspath(__file__))
 
@@ -38,12 +56,19 @@ NPM_DEBUG_LOG = os.path.join(ANALYSIS_LOG_DIR, "npm_debug.log")
 SUSPICIOUS_IP_LOG = os.path.join(ANALYSIS_LOG_DIR, "suspicious.log")
 
 BLOCKLIST_DB_PATH = os.path.join(APPLICATION_ROOT, "data", "db", "banned_ips.db")
+TAIL_CHECKPOINT_PATH = os.path.join(
+    APPLICATION_ROOT, "data", "db", "tail_checkpoints.json"
+)
+# Letto dal backend per /api/patterns/stats (uno per processo: *.shardN.json)
+PATTERN_PROFILE_PATH = os.path.join(ANALYSIS_LOG_DIR, "pattern_profile.json")
 
 PATTERN_DEFINITION_DIR = os.path.join(APPLICATION_ROOT, "patterns")
 URL_PATTERN_PATH = os.path.join(PATTERN_DEFINITION_DIR, "url.pattern")
 STATUS_MEANING_PATH = os.path.join(PATTERN_DEFINITION_DIR, "status_http.pattern")
 NGINX_ERROR_PATTERN_PATH = os.path.join(PATTERN_DEFINITION_DIR, "nginx_error.pattern")
 USER_AGENT_PATTERN_PATH = os.path.join(PATTERN_DEFINITION_DIR, "user_agent.pattern")
+# Contatore di versione scritto dal backend a ogni modifica dei pattern
+PATTERN_VERSION_PATH = os.path.join(PATTERN_DEFINITION_DIR, "store.version")
 
 THREAT_INTELLIGENCE_DIR = os.path.join(APPLICATION_ROOT, "dangerous")
 MALICIOUS_USER_AGENTS = os.path.join(THREAT_INTELLIGENCE_DIR, "user_agents.dangerous")
@@ -56,25 +81,14 @@ LOG_BATCH_SIZE = 50
 LOG_BATCH_TIMEOUT = 1.0
 CACHE_SIZE = 10000
 
-TAIL_PROCESS_HANDLERS = []
 MONITORING_THREADS = []
 SHUTDOWN_SIGNAL = threading.Event()
-monitored_files = set()
-
-ban_queue = Queue(maxsize=1000)
-log_queue = Queue(maxsize=5000)
 
 ban_lock = threading.Lock()
 log_write_lock = threading.Lock()
-stats_lock = threading.Lock()
-
-processing_stats = {
-    "lines_processed": 0,
-    "bans_executed": 0,
-    "cache_hits": 0,
-    "cache_misses": 0,
-    "start_time": time.time(),
-}
+
+pipeline_counters = ThreadCounters()
+START_TIME = time.time()
 
 debug_log("=== NPM ANALYZER v3.0 - AVVIATO ===", NPM_DEBUG_LOG)
 debug_log(f"Worker threads configurati: {NUM_WORKERS}", NPM_DEBUG_LOG)
@@ -88,86 +102,310 @@ debug_log(
 config = load_config(CONFIG_FILE, NPM_DEBUG_LOG)
 
 LOG_DIR = config["LOG_DIR"]
-FALLBACK_LOG = os.path.join(LOG_DIR, "fallback_access.log")
-DEFAULT_LOG = os.path.join(LOG_DIR, "default-host_access.log")
-PROXY_PATTERN = os.path.join(LOG_DIR, "proxy-host-*_access.log")
 
 ENABLE_WHITELIST_LOG = config["ENABLE_WHITELIST_LOG"]
 CODES_TO_ALLOW = config["CODES_TO_ALLOW"]
 TIME_FRAME = config["TIME_FRAME"]
 MAX_REQUESTS = config["MAX_REQUESTS"]
 JAIL_NAME = config["JAIL_NAME"]
+CATCHUP_MAX_BYTES = config["CATCHUP_MAX_BYTES"]
+CHECKPOINT_FLUSH_INTERVAL = config["CHECKPOINT_FLUSH_INTERVAL"]
+BATCH_MAX_LINES = config["BATCH_MAX_LINES"]
+BATCH_MAX_DELAY_MS = config["BATCH_MAX_DELAY_MS"]
+ANALYSIS_EXECUTOR = config["ANALYSIS_EXECUTOR"]
+ANALYSIS_WORKERS = config["ANALYSIS_WORKERS"] or (
+    NUM_WORKERS if ANALYSIS_EXECUTOR == "thread" else (os.cpu_count() or 1)
+)
+WORK_QUEUE_SIZE = config["WORK_QUEUE_SIZE"]
+WORK_QUEUE_PUT_TIMEOUT = config["WORK_QUEUE_PUT_TIMEOUT"]
+USE_EVENT_TIME = config["USE_EVENT_TIME"]
+EVENT_TIME_MAX_SKEW = config["EVENT_TIME_MAX_SKEW"]
+METRICS_ENABLED = config["METRICS_ENABLED"]
+METRICS_HOST = config["METRICS_HOST"]
+METRICS_PORT = config["METRICS_PORT"]
+PATTERN_RELOAD_INTERVAL = config["PATTERN_RELOAD_INTERVAL"]
+DANGER_CACHE_SIZE = config["DANGER_CACHE_SIZE"]
+DANGER_CACHE_TTL = config["DANGER_CACHE_TTL"]
+PATTERN_PROFILE_SAMPLE_EVERY = config["PATTERN_PROFILE_SAMPLE_EVERY"]
+MAX_IP_ENTRIES = config["MAX_IP_ENTRIES"]
+# Errori sommati al contatore dell'IP per ogni evento dell'error log
+ERROR_CATEGORY_WEIGHTS = {
+    **DEFAULT_ERROR_CATEGORY_WEIGHTS,
+    **config["ERROR_CATEGORY_WEIGHTS"],
+}
+# Fasi della pipeline in ordine: righe fermate da ciascuna fase
+# (code_filter, whitelist, banned, danger) e righe arrivate al log
+PIPELINE_STAGES = ("code_filter", "whitelist", "banned", "danger", "logged")
+# Codici scartati gia' in fase di parsing, senza decodificare la riga
+PREFILTER_CODES = (
+    frozenset(CODES_TO_ALLOW) if config["PREFILTER_ALLOWED_CODES"] else frozenset()
+)
 
-STATUS_MEANING_MAP = load_pattern_file(STATUS_MEANING_PATH, NPM_DEBUG_LOG)
-NGINX_ERROR_MAP = load_pattern_file(NGINX_ERROR_PATTERN_PATH, NPM_DEBUG_LOG)
-USER_AGENT_MAP = load_pattern_file(USER_AGENT_PATTERN_PATH, NPM_DEBUG_LOG)
-URL_PATTERN_MAP = load_pattern_file(URL_PATTERN_PATH, NPM_DEBUG_LOG)
 
-whitelist_manager = WhitelistManager(WHITELIST_DB_PATH, NPM_DEBUG_LOG)
+def log_entry_key(entry):
+    # Le entry del log sospetti iniziano con "IP: <ip>,"
+    return entry.split(",", 1)[0]
 
-ip_manager = IPDataManager(TIME_FRAME, MAX_REQUESTS, NPM_DEBUG_LOG)
 
-danger_detector = load_blacklists_once(
-    MALICIOUS_USER_AGENTS, MALICIOUS_INTENTS, NPM_DEBUG_LOG
+ban_queue = BoundedEventQueue(
+    "ban",
+    config["BAN_QUEUE_SIZE"],
+    NPM_DEBUG_LOG,
+    policy=config["BAN_QUEUE_POLICY"],
+    key_fn=lambda ban_data: ban_data[0],
+    dedupe=True,
+    put_timeout=config["EVENT_QUEUE_PUT_TIMEOUT"],
+)
+log_queue = BoundedEventQueue(
+    "log",
+    config["LOG_QUEUE_SIZE"],
+    NPM_DEBUG_LOG,
+    policy=config["LOG_QUEUE_POLICY"],
+    key_fn=log_entry_key,
+    put_timeout=config["EVENT_QUEUE_PUT_TIMEOUT"],
 )
 
-FALLBACK_REGEX = re.compile(
-    r'^(\d+\.\d+\.\d+\.\d+) - - \[[^\]]+\] "(.*?)" (\d{3}) \d+ "-" "([^"]*)"$'
+# Tutti i matcher compilati dai file di pattern e blacklist: vengono
+# sostituiti insieme, con un solo assegnamento di MATCHERS, al reload.
+# Chi li usa legge MATCHERS una volta per batch.
+Matchers = namedtuple(
+    "Matchers",
+    ["generation", "status_meaning", "url", "user_agent", "nginx_error", "danger"],
 )
-DEFAULT_REGEX = re.compile(
-    r'^(\d+\.\d+\.\d+\.\d+) - - \[[^\]]+\] "(.*?)" (\d{3}) \d+ "-" "([^"]*)"$'
+PATTERN_FILES = (
+    STATUS_MEANING_PATH,
+    NGINX_ERROR_PATTERN_PATH,
+    USER_AGENT_PATTERN_PATH,
+    URL_PATTERN_PATH,
+    MALICIOUS_USER_AGENTS,
+    MALICIOUS_INTENTS,
 )
-REQUEST_REGEX = re.compile(r'(\w+)\s+([^\s]+)\s+HTTP/[\d.]"?')
-PROXY_CODE_REGEX = re.compile(r"\s(\d{3})\s")
-PROXY_DOMAIN_REGEX = re.compile(r"\bhttps? (\S+)")
-PROXY_IP_REGEX = re.compile(r"\[Client\s([\d.:a-fA-F]+)\]")
-PROXY_METHOD_URL_REGEX = re.compile(
-    r"\] - \d{3} \d{3} - (\w+) https? [^ ]+ \"([^\"]+)\""
+
+
+pattern_profiler = (
+    PatternProfiler(
+        PATTERN_PROFILE_PATH,
+        NPM_DEBUG_LOG,
+        sample_every=PATTERN_PROFILE_SAMPLE_EVERY,
+        top_n=config["PATTERN_PROFILE_TOP_N"],
+    )
+    if PATTERN_PROFILE_SAMPLE_EVERY > 0
+    else None
+)
+
+
+def build_matchers(generation=0):
+    rejected = []
+
+    def classifier(path, label):
+        classifier = PatternClassifier(
+            load_pattern_file(path, NPM_DEBUG_LOG, rejected),
+            label=label,
+            npm_debug_log=NPM_DEBUG_LOG,
+        )
+        rejected.extend(classifier.rejected)
+        return classifier
+
+    danger = load_blacklists_once(
+        MALICIOUS_USER_AGENTS,
+        MALICIOUS_INTENTS,
+        NPM_DEBUG_LOG,
+        rejected,
+        DANGER_CACHE_SIZE,
+        DANGER_CACHE_TTL,
+    )
+    danger.profiler = pattern_profiler
+
+    matchers = Matchers(
+        generation,
+        load_pattern_file(STATUS_MEANING_PATH, NPM_DEBUG_LOG, rejected),
+        classifier(URL_PATTERN_PATH, "URL_PATTERN"),
+        classifier(USER_AGENT_PATTERN_PATH, "USER_AGENT"),
+        classifier(NGINX_ERROR_PATTERN_PATH, "NGINX_ERROR"),
+        danger,
+    )
+    return matchers, rejected
+
+
+def reload_matchers():
+    return build_matchers(MATCHERS.generation + 1)
+
+
+def swap_matchers(matchers):
+    global MATCHERS
+    previous = MATCHERS
+    MATCHERS = matchers
+    # Le voci della generazione precedente non verrebbero piu' lette
+    cached_pattern_match.cache_clear()
+    previous.danger.clear_cache()
+    if pattern_profiler is not None:
+        pattern_profiler.reset()
+
+
+compile_start = time.perf_counter()
+MATCHERS, rejected_patterns = build_matchers()
+debug_log(
+    f"Pattern compilati in {(time.perf_counter() - compile_start) * 1000:.1f}ms, "
+    f"voci scartate: {len(rejected_patterns)}",
+    NPM_DEBUG_LOG,
+)
+
+pattern_reloader = PatternReloader(
+    PATTERN_FILES,
+    reload_matchers,
+    swap_matchers,
+    NPM_DEBUG_LOG,
+    version_path=PATTERN_VERSION_PATH,
+)
+
+whitelist_manager = WhitelistManager(WHITELIST_DB_PATH, NPM_DEBUG_LOG)
+
+ip_manager = IPDataManager(
+    TIME_FRAME, MAX_REQUESTS, NPM_DEBUG_LOG, max_entries=MAX_IP_ENTRIES
+)
+
+checkpoint_store = CheckpointStore(
+    TAIL_CHECKPOINT_PATH, NPM_DEBUG_LOG, flush_interval=CHECKPOINT_FLUSH_INTERVAL
+)
+
+log_tailer = LogTailer(
+    SHUTDOWN_SIGNAL,
+    NPM_DEBUG_LOG,
+    checkpoint_store=checkpoint_store,
+    catchup_max_bytes=CATCHUP_MAX_BYTES,
+    batch_max_lines=BATCH_MAX_LINES,
+    batch_max_delay=BATCH_MAX_DELAY_MS / 1000,
+)
+
+log_formats = LogFormatRegistry(
+    config["LOG_FORMATS"],
+    NPM_DEBUG_LOG,
+    fallbacks={"npm_proxy": extract_proxy_fields_legacy},
 )
-PROXY_METHOD_URL_REGEX_ALT = re.compile(r"- (\w+) https? [^ ]+ \"([^\"]+)\"")
-PROXY_UA_REGEX = re.compile(r'"([^"]+)"')
 
 debug_log("Regex precompilate per parsing ottimizzato", NPM_DEBUG_LOG)
 
 
 @lru_cache(maxsize=CACHE_SIZE)
-def cached_pattern_match(text, pattern_type):
+def cached_pattern_match(text, pattern_type, generation):
+    # generation fa parte della chiave: un risultato calcolato durante un
+    # reload non puo' essere servito per i pattern nuovi
     from functions.pattern_matcher import descrizione_intento, descrizione_user_agent
 
+    matchers = MATCHERS
+    start = time.perf_counter()
     if pattern_type == "url":
-        return descrizione_intento(text, URL_PATTERN_MAP)
+        classifier = matchers.url
+        result = descrizione_intento(text, classifier)
+        pattern_file = os.path.basename(URL_PATTERN_PATH)
     elif pattern_type == "ua":
-        return descrizione_user_agent(text, USER_AGENT_MAP)
-    return "Unknown"
+        classifier = matchers.user_agent
+        result = descrizione_user_agent(text, classifier)
+        pattern_file = os.path.basename(USER_AGENT_PATTERN_PATH)
+    else:
+        return "Unknown"
+    pipeline_counters.observe(f"regex:{pattern_file}", time.perf_counter() - start)
+    if pattern_profiler is not None and text:
+        pattern_profiler.sample(
+            "url" if pattern_type == "url" else "user_agent", classifier.compiled, text
+        )
+    return result
 
 
 def update_stats(stat_name, increment=1):
-    with stats_lock:
-        processing_stats[stat_name] = processing_stats.get(stat_name, 0) + increment
+    pipeline_counters.add(stat_name, increment)
 
 
-def get_stats_summary():
-    with stats_lock:
-        elapsed = time.time() - processing_stats["start_time"]
-        lines_per_sec = (
-            processing_stats["lines_processed"] / elapsed if elapsed > 0 else 0
-        )
-        cache_total = processing_stats["cache_hits"] + processing_stats["cache_misses"]
-        cache_hit_rate = (
-            (processing_stats["cache_hits"] / cache_total * 100)
-            if cache_total > 0
-            else 0
-        )
+def get_counter(stat_name):
+    return pipeline_counters.snapshot()[0].get(stat_name, 0)
+
 
-        return {
-            "uptime_seconds": elapsed,
-            "lines_processed": processing_stats["lines_processed"],
-            "lines_per_second": lines_per_sec,
-            "bans_executed": processing_stats["bans_executed"],
-            "cache_hit_rate": cache_hit_rate,
-            "cache_hits": processing_stats["cache_hits"],
-            "cache_misses": processing_stats["cache_misses"],
+def get_cache_stats():
+    caches = {
+        "pattern_match": cached_pattern_match.cache_info(),
+        "log_time": parse_log_time.cache_info(),
+    }
+    stats = {
+        name: {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "capacity": info.maxsize,
         }
+        for name, info in caches.items()
+    }
+    danger = MATCHERS.danger
+    stats["danger_ua"] = danger.ua_cache.get_stats()
+    stats["danger_url"] = danger.url_cache.get_stats()
+    return stats
+
+
+def collect_shard_stats():
+    """Statistiche di uno shard da inviare al processo principale."""
+    counters, histograms = pipeline_counters.raw_snapshot()
+    return {
+        "counters": counters,
+        "histograms": histograms,
+        "caches": get_cache_stats(),
+        "ip": ip_manager.get_stats(),
+    }
+
+
+def get_ip_stats():
+    # Con --workers lo stato degli IP vive negli shard
+    return merge_stats(
+        [ip_manager.get_stats()] + [stats["ip"] for stats in shard_stats.values()],
+        STATS_MAX_KEYS,
+    )
+
+
+def get_stats_summary():
+    shards = list(shard_stats.values())
+    counters, histograms = pipeline_counters.snapshot(
+        extra=[(stats["counters"], stats["histograms"]) for stats in shards]
+    )
+    elapsed = time.time() - START_TIME
+    lines_processed = counters.get("lines_processed", 0)
+    lines_per_sec = lines_processed / elapsed if elapsed > 0 else 0
+
+    caches = merge_stats(
+        [get_cache_stats()] + [stats["caches"] for stats in shards], STATS_MAX_KEYS
+    )
+    cache_hits = sum(cache["hits"] for cache in caches.values())
+    cache_misses = sum(cache["misses"] for cache in caches.values())
+    cache_total = cache_hits + cache_misses
+    cache_hit_rate = (cache_hits / cache_total * 100) if cache_total > 0 else 0
+
+    summary = {
+        "uptime_seconds": elapsed,
+        "lines_processed": lines_processed,
+        "lines_per_second": lines_per_sec,
+        "stages": {
+            stage: counters.get(f"stage_{stage}", 0) for stage in PIPELINE_STAGES
+        },
+        "error_events": {
+            category: counters.get(f"error_events_{category}", 0)
+            for category in ERROR_CATEGORY_WEIGHTS
+        },
+        "bans_executed": counters.get("bans_executed", 0),
+        "cache_hit_rate": cache_hit_rate,
+        "cache_hits": cache_hits,
+        "cache_misses": cache_misses,
+        "caches": caches,
+        "parse_failures": {
+            source: counters.get(f"parse_failures_{source}", 0)
+            for source in LINE_SOURCES
+        },
+        "stage_latency": histograms,
+        "pattern_reload": pattern_reloader.get_stats(),
+    }
+
+    summary["work_queue"] = analysis_queue.get_stats()
+    summary["ban_queue"] = ban_queue.get_stats()
+    summary["log_queue"] = log_queue.get_stats()
+    summary["watched_files"] = log_tailer.watched_files()
+    summary["files"] = log_tailer.file_stats()
+    return summary
 
 
 def batch_ban_processor():
@@ -195,9 +433,9 @@ def batch_ban_processor():
 
                 with ban_lock:
                     for ban_data in ban_batch:
-                        ip, jail, db_path, log, ua, domain, code, url = ban_data
+                        ip, jail, db_path, log, ua, domain, code, url, detected_at = ban_data
                         try:
-                            ban_and_reset(
+                            banned = ban_and_reset(
                                 ip_manager,
                                 ip,
                                 jail,
@@ -208,6 +446,12 @@ def batch_ban_processor():
                                 http_code=code,
                                 url=url,
                             )
+                            if banned:
+                                pipeline_counters.observe(
+                                    "ban_latency", time.time() - detected_at
+                                )
+                                if shard_pool is not None:
+                                    shard_pool.send_to_owner(ip, ("reset", ip))
                             update_stats("bans_executed")
                         except Exception as e:
                             debug_log(f"Errore ban IP {ip}: {e}", NPM_DEBUG_LOG)
@@ -226,7 +470,7 @@ def batch_ban_processor():
         debug_log(f"Flush finale ban batch: {len(ban_batch)} IP", NPM_DEBUG_LOG)
         with ban_lock:
             for ban_data in ban_batch:
-                ip, jail, db_path, log, ua, domain, code, url = ban_data
+                ip, jail, db_path, log, ua, domain, code, url, detected_at = ban_data
                 try:
                     ban_and_reset(
                         ip_manager,
@@ -316,175 +560,196 @@ def stats_reporter():
         debug_log(
             f"Throughput: {stats['lines_per_second']:.2f} linee/sec", NPM_DEBUG_LOG
         )
+        debug_log(f"Righe per fase: {stats['stages']}", NPM_DEBUG_LOG)
+        debug_log(f"Eventi error log: {stats['error_events']}", NPM_DEBUG_LOG)
         debug_log(f"Ban eseguiti: {stats['bans_executed']}", NPM_DEBUG_LOG)
         debug_log(f"Cache hit rate: {stats['cache_hit_rate']:.1f}%", NPM_DEBUG_LOG)
         debug_log(f"Cache hits: {stats['cache_hits']}", NPM_DEBUG_LOG)
         debug_log(f"Cache misses: {stats['cache_misses']}", NPM_DEBUG_LOG)
-
-    debug_log("Stats reporter terminato", NPM_DEBUG_LOG)
-
-
-def process_and_check_ban_optimized(
-    ip, code, domain, method, url, intent, user_agent_full, user_agent_desc
-):
-
-    if whitelist_manager.is_whitelisted(ip):
-        return
-
-    meaning = get_status_meaning(code, STATUS_MEANING_MAP)
-    error_count, is_banned = ip_manager.update_ip_data(ip, code, CODES_TO_ALLOW)
-
-    base_log = (
-        f"IP: {ip}, Codice HTTP: {code} ({meaning}), Dominio: {domain}, "
-        f"Metodo: {method}, URL: {url}, Intenzioni: {intent}, "
-        f'User-Agent: "{user_agent_full}" ({user_agent_desc}), '
-        f"Errori: {error_count}"
-    )
-
-    if is_banned:
-        return
-
-    if danger_detector.is_dangerous(user_agent_full, url):
-        debug_log(f"IP: {ip}, BLACKLIST. BAN IMMEDIATO.", NPM_DEBUG_LOG)
-        ban_queue.put(
-            (
-                ip,
-                JAIL_NAME,
-                BLOCKLIST_DB_PATH,
+        for cache_name in ("danger_ua", "danger_url"):
+            cache = stats["caches"][cache_name]
+            debug_log(
+                f"Cache {cache_name}: hit rate {cache['hit_rate'] * 100:.1f}%, "
+                f"{cache['size']}/{cache['capacity']} voci, "
+                f"scadute: {cache['expired']}, espulse: {cache['evictions']}",
                 NPM_DEBUG_LOG,
-                user_agent_full,
-                domain,
-                code,
-                url,
             )
+        debug_log(f"Righe non parsate: {stats['parse_failures']}", NPM_DEBUG_LOG)
+        pattern_reload = stats["pattern_reload"]
+        debug_log(
+            f"Reload pattern: {pattern_reload['reloads']} "
+            f"(falliti: {pattern_reload['failures']}), ultima compilazione "
+            f"{pattern_reload['last_compile_seconds'] * 1000:.1f}ms, "
+            f"voci scartate: {pattern_reload['last_rejected']}, "
+            f"versione store: {pattern_reload['store_version']}",
+            NPM_DEBUG_LOG,
         )
-        log_queue.put(base_log + " [BAN IMMEDIATO - BLACKLIST]")
-        return
-
-    log_queue.put(base_log)
-
-    if should_ban_ip(error_count, MAX_REQUESTS, is_banned):
-        debug_log(f"IP: {ip}, Superato limite. BAN in corso...", NPM_DEBUG_LOG)
-        ban_queue.put(
-            (
-                ip,
-                JAIL_NAME,
-                BLOCKLIST_DB_PATH,
+        debug_log(f"File monitorati: {len(stats['watched_files'])}", NPM_DEBUG_LOG)
+        for path, file_stats in stats["files"].items():
+            debug_log(
+                f"  {path}: {file_stats['lines']} righe "
+                f"({file_stats['lines_per_second']:.2f}/s)",
+                NPM_DEBUG_LOG,
+            )
+        for stage, hist in stats["stage_latency"].items():
+            debug_log(
+                f"Latenza {stage}: media {hist['avg_ms']:.3f}ms su {hist['count']} batch",
                 NPM_DEBUG_LOG,
-                user_agent_full,
-                domain,
-                code,
-                url,
             )
+        work_queue = stats["work_queue"]
+        debug_log(
+            f"Coda analisi: {work_queue['depth']}/{work_queue['capacity']} batch "
+            f"(max {work_queue['max_depth']}), righe scartate: {work_queue['lines_dropped']}, "
+            f"tempo bloccato: {work_queue['blocked_time_seconds']:.2f}s",
+            NPM_DEBUG_LOG,
         )
-        log_queue.put(base_log + " [BAN - LIMITE RICHIESTE SUPERATO]")
+        for queue_name in ("ban_queue", "log_queue"):
+            queue_stats = stats[queue_name]
+            debug_log(
+                f"Coda {queue_name}: {queue_stats['depth']}/{queue_stats['capacity']} "
+                f"({queue_stats['policy']}, max {queue_stats['high_water']}), "
+                f"scartati: {queue_stats['dropped']}, duplicati: {queue_stats['deduplicated']}, "
+                f"coalescenti: {queue_stats['coalesced']}, "
+                f"latenza put media/max: {queue_stats['enqueue_latency_avg_ms']:.2f}/"
+                f"{queue_stats['enqueue_latency_max_ms']:.2f}ms",
+                NPM_DEBUG_LOG,
+            )
 
+    debug_log("Stats reporter terminato", NPM_DEBUG_LOG)
 
-def parse_fallback_line_optimized(line):
-    m = FALLBACK_REGEX.match(line)
-    if not m:
-        return None
 
-    ip = m.group(1)
-    request = m.group(2)
-    http_code = int(m.group(3))
-    user_agent = m.group(4)
+def render_analyzer_metrics():
+    return render_metrics(get_stats_summary(), get_ip_stats())
 
-    method = "-"
-    url = "-"
 
-    req_match = REQUEST_REGEX.match(request)
-    if req_match:
-        method = req_match.group(1)
-        url = req_match.group(2)
+def enqueue_ban(ban_data, event_ts=None):
+    ban_queue.put(ban_data)
 
-    domain = "NON RILEVATO"
 
-    if whitelist_manager.is_whitelisted(ip):
-        if ENABLE_WHITELIST_LOG:
-            timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-            intent = cached_pattern_match(url, "url")
-            ua_desc = cached_pattern_match(user_agent, "ua")
-            entry = (
-                f"{timestamp} - IP: {ip}, Codice HTTP: {http_code}, Dominio: {domain}, "
-                f"Metodo: {method}, URL: {url}, Intenzioni: {intent}, "
-                f'User-Agent: "{user_agent}" ({ua_desc})'
-            )
-            with open(LOG_FILE_WHITELISTED, "a") as log_file:
-                log_file.write(entry + "\n")
-        return None
+def enqueue_log(entry):
+    log_queue.put(entry)
 
-    intent = cached_pattern_match(url, "url")
-    ua_desc = cached_pattern_match(user_agent, "ua")
 
-    return (ip, http_code, domain, method, url, intent, user_agent, ua_desc)
+ban_sink = enqueue_ban
+log_sink = enqueue_log
 
 
-def parse_default_line_optimized(line):
-    m = DEFAULT_REGEX.match(line)
-    if not m:
-        return None
+def describe_request(url, user_agent_full, generation):
+    intent = cached_pattern_match(url, "url", generation)
+    user_agent_desc = (
+        cached_pattern_match(user_agent_full, "ua", generation)
+        if user_agent_full != "Unknown"
+        else "Sconosciuto"
+    )
+    return intent, user_agent_desc
 
-    ip = m.group(1)
-    request = m.group(2)
-    http_code = int(m.group(3))
-    user_agent = m.group(4)
 
-    method = "-"
-    url = "-"
+def process_and_check_ban_batch(results):
+    """
+    Fasi dopo il filtro codici e la whitelist, in ordine di costo:
+    aggiornamento contatori IP, controllo blacklist e, solo per le righe
+    che finiscono nel log, classificazione descrittiva di URL e user agent.
+    """
 
-    req_match = REQUEST_REGEX.match(request)
-    if req_match:
-        method = req_match.group(1)
-        url = req_match.group(2)
+    ip_updates = ip_manager.update_ip_data_batch(
+        [(result[0], result[1], result[6]) for result in results], CODES_TO_ALLOW
+    )
+    matchers = MATCHERS
 
-    domain = "NON RILEVATO"
+    banned_lines = 0
+    danger_lines = 0
+    logged_lines = 0
+    classify_seconds = 0.0
 
-    if whitelist_manager.is_whitelisted(ip):
-        if ENABLE_WHITELIST_LOG:
-            timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-            intent = cached_pattern_match(url, "url")
-            ua_desc = cached_pattern_match(user_agent, "ua")
-            entry = (
-                f"{timestamp} - IP: {ip}, Codice HTTP: {http_code}, Dominio: {domain}, "
-                f"Metodo: {method}, URL: {url}, Intenzioni: {intent}, "
-                f'User-Agent: "{user_agent}" ({ua_desc})'
-            )
-            with open(LOG_FILE_WHITELISTED, "a") as log_file:
-                log_file.write(entry + "\n")
-        return None
+    for result, (error_count, is_banned) in zip(results, ip_updates):
+        ip, code, domain, method, url, user_agent_full, event_ts = result
 
-    intent = cached_pattern_match(url, "url")
-    ua_desc = cached_pattern_match(user_agent, "ua")
+        if is_banned:
+            banned_lines += 1
+            continue
 
-    return (ip, http_code, domain, method, url, intent, user_agent, ua_desc)
+        danger = matchers.danger.match(user_agent_full, url)
 
+        start = time.perf_counter()
+        intent, user_agent_desc = describe_request(
+            url, user_agent_full, matchers.generation
+        )
+        meaning = get_status_meaning(code, matchers.status_meaning)
+        classify_seconds += time.perf_counter() - start
+
+        base_log = (
+            f"IP: {ip}, Codice HTTP: {code} ({meaning}), Dominio: {domain}, "
+            f"Metodo: {method}, URL: {url}, Intenzioni: {intent}, "
+            f'User-Agent: "{user_agent_full}" ({user_agent_desc}), '
+            f"Errori: {error_count}"
+        )
 
-def parse_proxy_line_optimized(line):
-    code_match = PROXY_CODE_REGEX.search(line)
-    domain_match = PROXY_DOMAIN_REGEX.search(line)
-    ip_match = PROXY_IP_REGEX.search(line)
-    method_url_match = PROXY_METHOD_URL_REGEX.search(line)
-    if not method_url_match:
-        method_url_match = PROXY_METHOD_URL_REGEX_ALT.search(line)
+        if danger is not None:
+            danger_lines += 1
+            debug_log(
+                f"IP: {ip}, BLACKLIST ({danger[0]}: {danger[1]}). BAN IMMEDIATO.",
+                NPM_DEBUG_LOG,
+            )
+            ban_sink(
+                (
+                    ip,
+                    JAIL_NAME,
+                    BLOCKLIST_DB_PATH,
+                    NPM_DEBUG_LOG,
+                    user_agent_full,
+                    domain,
+                    code,
+                    url,
+                    time.time(),
+                ),
+                event_ts,
+            )
+            log_sink(base_log + f" [BAN IMMEDIATO - BLACKLIST {danger[0]}: {danger[1]}]")
+            continue
+
+        logged_lines += 1
+        log_sink(base_log)
+
+        if should_ban_ip(error_count, MAX_REQUESTS, is_banned):
+            debug_log(f"IP: {ip}, Superato limite. BAN in corso...", NPM_DEBUG_LOG)
+            ban_sink(
+                (
+                    ip,
+                    JAIL_NAME,
+                    BLOCKLIST_DB_PATH,
+                    NPM_DEBUG_LOG,
+                    user_agent_full,
+                    domain,
+                    code,
+                    url,
+                    time.time(),
+                ),
+                event_ts,
+            )
+            log_sink(base_log + " [BAN - LIMITE RICHIESTE SUPERATO]")
 
-    user_agent_match = PROXY_UA_REGEX.findall(line)
-    user_agent = user_agent_match[-2] if len(user_agent_match) >= 2 else None
+    if banned_lines:
+        update_stats("stage_banned", banned_lines)
+    if danger_lines:
+        update_stats("stage_danger", danger_lines)
+    if logged_lines:
+        update_stats("stage_logged", logged_lines)
+    if danger_lines or logged_lines:
+        pipeline_counters.observe("classify", classify_seconds)
 
-    if not (ip_match and code_match):
-        return None
 
-    ip = ip_match.group(1)
-    http_code = int(code_match.group(1))
-    method = method_url_match.group(1) if method_url_match else None
-    url = method_url_match.group(2) if method_url_match else None
-    domain = domain_match.group(1) if domain_match else "NON RILEVATO"
+def finish_parsed_line(ip, http_code, domain, method, url, user_agent, time_str):
 
     if whitelist_manager.is_whitelisted(ip):
         if ENABLE_WHITELIST_LOG:
             timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-            intent = cached_pattern_match(url or "", "url")
-            ua_desc = cached_pattern_match(user_agent, "ua") if user_agent else "N/A"
+            generation = MATCHERS.generation
+            intent = cached_pattern_match(url or "", "url", generation)
+            ua_desc = (
+                cached_pattern_match(user_agent, "ua", generation)
+                if user_agent
+                else "N/A"
+            )
             entry = (
                 f"{timestamp} - IP: {ip}, Codice HTTP: {http_code}, Dominio: {domain}, "
                 f"Metodo: {method}, URL: {url}, Intenzioni: {intent}, "
@@ -494,8 +759,9 @@ def parse_proxy_line_optimized(line):
                 log_file.write(entry + "\n")
         return None
 
-    intent = cached_pattern_match(url or "", "url")
-    ua_desc = cached_pattern_match(user_agent, "ua") if user_agent else "Sconosciuto"
+    event_ts = (
+        resolve_event_time(time_str, EVENT_TIME_MAX_SKEW) if USE_EVENT_TIME else None
+    )
 
     return (
         ip,
@@ -503,97 +769,466 @@ def parse_proxy_line_optimized(line):
         domain,
         method or "GET",
         url or "/",
-        intent,
         user_agent or "Unknown",
-        ua_desc,
+        event_ts,
     )
 
 
-def process_fallback():
-    def callback(line):
-        update_stats("lines_processed")
-        result = parse_fallback_line_optimized(line)
-        if result:
-            process_and_check_ban_optimized(*result)
+# Le righe dei log arrivano come bytes (tail raw e replay)
+ERROR_SOURCE = "nginx_error"
+LINE_SOURCES = {
+    name: (log_format.extract_raw, log_format.key_raw)
+    for name, log_format in log_formats.formats.items()
+}
+LINE_SOURCES[ERROR_SOURCE] = (extract_error_fields_raw, error_key_raw)
+
+
+def apply_error_records(records):
+    """
+    Eventi dell'error log: whitelist, peso per categoria (ERROR_CATEGORY_WEIGHTS)
+    sommato agli errori dell'IP, log e ban al superamento di MAX_REQUESTS.
+    """
+    events = []
+    whitelisted = 0
+    nginx_error = MATCHERS.nginx_error
+    for record in records:
+        if whitelist_manager.is_whitelisted(record.ip):
+            whitelisted += 1
+            if ENABLE_WHITELIST_LOG:
+                timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
+                entry = f"{timestamp} - " + format_error_entry(record, nginx_error)
+                with open(LOG_FILE_WHITELISTED_PROXY, "a") as log_file:
+                    log_file.write(entry + "\n")
+            continue
+
+        update_stats(f"error_events_{record.category}")
+        weight = ERROR_CATEGORY_WEIGHTS.get(record.category, 0)
+        if not weight:
+            continue
+        event_ts = (
+            resolve_event_time(record.time, EVENT_TIME_MAX_SKEW)
+            if USE_EVENT_TIME
+            else None
+        )
+        events.append((record, weight, event_ts))
 
-    tail_file(
-        FALLBACK_LOG, callback, SHUTDOWN_SIGNAL, TAIL_PROCESS_HANDLERS, NPM_DEBUG_LOG
+    if whitelisted:
+        update_stats("stage_whitelist", whitelisted)
+    if not events:
+        return
+
+    ip_updates = ip_manager.update_ip_weights_batch(
+        [(record.ip, weight, event_ts) for record, weight, event_ts in events]
     )
 
+    for (record, _, event_ts), (error_count, is_banned) in zip(events, ip_updates):
+        if is_banned:
+            update_stats("stage_banned")
+            continue
+
+        update_stats("stage_logged")
+        base_log = (
+            format_error_entry(record, nginx_error)
+            + f", Errori: {error_count:g}"
+        )
+        log_sink(base_log)
 
-def process_default():
-    def callback(line):
-        update_stats("lines_processed")
-        result = parse_default_line_optimized(line)
+        if should_ban_ip(error_count, MAX_REQUESTS, is_banned):
+            debug_log(
+                f"IP: {record.ip}, Superato limite (error log). BAN in corso...",
+                NPM_DEBUG_LOG,
+            )
+            ban_sink(
+                (
+                    record.ip,
+                    JAIL_NAME,
+                    BLOCKLIST_DB_PATH,
+                    NPM_DEBUG_LOG,
+                    None,
+                    record.host,
+                    f"error:{record.category}",
+                    record.request,
+                    time.time(),
+                ),
+                event_ts,
+            )
+            log_sink(base_log + " [BAN - LIMITE ERRORI SUPERATO]")
+
+
+def extract_lines(source, lines):
+    extract_fields = LINE_SOURCES[source][0]
+    skip_codes = PREFILTER_CODES
+
+    start = time.perf_counter()
+    parsed = []
+    filtered = 0
+    for line in lines:
+        fields = extract_fields(line, skip_codes)
+        if fields is None:
+            continue
+        if type(fields) is int:
+            filtered += 1
+        else:
+            parsed.append(fields)
+
+    return len(lines), filtered, parsed, time.perf_counter() - start
+
+
+def apply_parsed_lines(source, prepared):
+    line_count, filtered, parsed, parse_seconds = prepared
+    update_stats("lines_processed", line_count)
+    if filtered:
+        update_stats("stage_code_filter", filtered)
+    failures = line_count - filtered - len(parsed)
+    if failures:
+        update_stats(f"parse_failures_{source}", failures)
+    pipeline_counters.observe("parse", parse_seconds)
+
+    if source == ERROR_SOURCE:
+        start = time.perf_counter()
+        apply_error_records(parsed)
+        pipeline_counters.observe("error_check", time.perf_counter() - start)
+        return
+
+    start = time.perf_counter()
+    results = []
+    for fields in parsed:
+        result = finish_parsed_line(*fields)
         if result:
-            process_and_check_ban_optimized(*result)
+            results.append(result)
+    if len(parsed) > len(results):
+        update_stats("stage_whitelist", len(parsed) - len(results))
+    pipeline_counters.observe("whitelist", time.perf_counter() - start)
 
-    tail_file(
-        DEFAULT_LOG, callback, SHUTDOWN_SIGNAL, TAIL_PROCESS_HANDLERS, NPM_DEBUG_LOG
-    )
+    if results:
+        start = time.perf_counter()
+        process_and_check_ban_batch(results)
+        pipeline_counters.observe("ban_check", time.perf_counter() - start)
 
 
-def process_proxy():
-    def callback(line):
-        update_stats("lines_processed")
-        result = parse_proxy_line_optimized(line)
-        if result:
-            process_and_check_ban_optimized(*result)
+def process_lines(source, lines):
+    apply_parsed_lines(source, extract_lines(source, lines))
+
+
+analysis_queue = AnalysisWorkQueue(
+    extract_lines,
+    apply_parsed_lines,
+    ANALYSIS_WORKERS,
+    NPM_DEBUG_LOG,
+    executor=ANALYSIS_EXECUTOR,
+    maxsize=WORK_QUEUE_SIZE,
+    put_timeout=WORK_QUEUE_PUT_TIMEOUT,
+)
+
+shard_pool = None
+# Ultime statistiche ricevute da ciascuno shard (indice -> collect_shard_stats())
+shard_stats = {}
+SHARD_STATS_INTERVAL = 2
+# Campi che tra shard prendono il massimo invece della somma
+STATS_MAX_KEYS = (
+    "ttl",
+    "avg_cleanup_time",
+    "last_cleanup_duration",
+    "avg_update_time_ms",
+    "lock_wait_time_ms",
+)
+
+
+def make_line_callback(source):
+    shard_key = LINE_SOURCES[source][1]
+
+    def callback(lines):
+        if shard_pool is not None:
+            # lines_processed viene contato dagli shard
+            shard_pool.dispatch(source, lines, shard_key)
+        else:
+            analysis_queue.submit(source, lines, shard_key)
+
+    return callback
+
+
+def start_pattern_threads(profile_path=PATTERN_PROFILE_PATH):
+    # Ogni processo (anche ogni shard) ricompila e profila i propri matcher
+    if PATTERN_RELOAD_INTERVAL > 0:
+        threading.Thread(
+            target=pattern_reloader.monitor,
+            args=(PATTERN_RELOAD_INTERVAL, SHUTDOWN_SIGNAL),
+            name="pattern_reloader",
+            daemon=True,
+        ).start()
+    if pattern_profiler is not None:
+        pattern_profiler.path = profile_path
+        threading.Thread(
+            target=pattern_profiler.monitor,
+            args=(PROFILE_FLUSH_INTERVAL, SHUTDOWN_SIGNAL),
+            name="pattern_profiler",
+            daemon=True,
+        ).start()
+
+
+def shard_worker(index, input_queue, output_queue):
+    global ban_sink, log_sink
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    debug_log(f"Shard worker {index} avviato (pid {os.getpid()})", NPM_DEBUG_LOG)
+
+    pending_bans = []
+    pending_logs = []
+    ban_sink = lambda ban_data, event_ts=None: pending_bans.append(ban_data)
+    log_sink = pending_logs.append
 
     threading.Thread(
-        target=monitor_pattern,
-        args=(
-            PROXY_PATTERN,
-            callback,
-            SHUTDOWN_SIGNAL,
-            monitored_files,
-            MONITORING_THREADS,
-            TAIL_PROCESS_HANDLERS,
-            NPM_DEBUG_LOG,
-        ),
+        target=whitelist_manager.whitelist_monitor,
+        args=(1, SHUTDOWN_SIGNAL),
         daemon=True,
     ).start()
+    threading.Thread(
+        target=whitelist_manager.domain_refresh, args=(5, SHUTDOWN_SIGNAL), daemon=True
+    ).start()
+    start_memory_cleanup_thread(ip_manager, SHUTDOWN_SIGNAL, [], NPM_DEBUG_LOG)
+    start_pattern_threads(
+        PATTERN_PROFILE_PATH.replace(".json", f".shard{index}.json")
+    )
+
+    last_stats = 0.0
+    while True:
+        try:
+            message = input_queue.get(timeout=SHARD_STATS_INTERVAL)
+        except Empty:
+            message = ()
+        if message is None:
+            break
 
+        try:
+            if not message:
+                pass
+            elif message[0] == "lines":
+                _, source, lines = message
+                process_lines(source, lines)
+            elif message[0] == "reset":
+                ip_manager.remove_ip(message[1])
+        except Exception as e:
+            debug_log(f"Errore nello shard worker {index}: {e}", NPM_DEBUG_LOG)
 
-def process_proxy_errors():
-    from functions.log_parsers import parse_proxy_error_log
+        if pending_bans or pending_logs:
+            output_queue.put(("results", list(pending_bans), list(pending_logs)))
+            pending_bans.clear()
+            pending_logs.clear()
+
+        # Contatori, cache e tabella IP dello shard per /metrics e i report
+        now = time.monotonic()
+        if now - last_stats >= SHARD_STATS_INTERVAL:
+            last_stats = now
+            output_queue.put(("stats", index, collect_shard_stats()))
+
+    SHUTDOWN_SIGNAL.set()
+    debug_log(f"Shard worker {index} terminato", NPM_DEBUG_LOG)
+
+
+def handle_shard_result(result):
+    if result[0] == "stats":
+        _, index, stats = result
+        shard_stats[index] = stats
+        return
+
+    _, bans, logs = result
+    for ban_data in bans:
+        ban_queue.put(ban_data)
+    for entry in logs:
+        log_queue.put(entry)
+
+
+REPLAY_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
 
-    ERROR_PATTERN = os.path.join(LOG_DIR, "proxy-host-*_error.log")
 
-    def callback(line):
-        parse_proxy_error_log(
-            line,
-            whitelist_manager,
-            LOG_FILE_WHITELISTED_PROXY,
-            None,
-            ENABLE_WHITELIST_LOG,
-            NGINX_ERROR_MAP,
+def open_replay_file(path):
+    opener = REPLAY_OPENERS.get(os.path.splitext(path)[1].lower(), open)
+    return opener(path, "rb")
+
+
+def replay_file(path, source):
+    batch = []
+    with open_replay_file(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            batch.append(line)
+            if len(batch) >= BATCH_MAX_LINES:
+                process_lines(source, batch)
+                batch = []
+    if batch:
+        process_lines(source, batch)
+
+
+def run_replay(patterns, source_override=None):
+    global ban_sink, log_sink, USE_EVENT_TIME, EVENT_TIME_MAX_SKEW
+    global ENABLE_WHITELIST_LOG
+
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        for path in matches:
+            if path not in files:
+                files.append(path)
+
+    USE_EVENT_TIME = True
+    EVENT_TIME_MAX_SKEW = float("inf")
+    ENABLE_WHITELIST_LOG = False
+
+    would_ban = {}
+    log_entries = [0]
+
+    def record_ban(ban_data, event_ts=None):
+        ip = ban_data[0]
+        if ip not in would_ban:
+            would_ban[ip] = (event_ts, ban_data)
+        ip_manager.mark_as_banned(ip)
+
+    def count_log(entry):
+        log_entries[0] += 1
+
+    ban_sink = record_ban
+    log_sink = count_log
+
+    whitelist_manager.update_whitelist()
+
+    debug_log(f"Replay avviato su {len(files)} file", NPM_DEBUG_LOG)
+
+    start = time.time()
+    total_bytes = 0
+    replayed = 0
+
+    for path in files:
+        source = source_override or log_formats.match(path)
+        if source is None and "_error.log" in os.path.basename(path):
+            source = ERROR_SOURCE
+        if source is None:
+            print(f"[SKIP] {path}: formato non riconosciuto (usa --format)")
+            continue
+        if not os.path.isfile(path):
+            print(f"[SKIP] {path}: file non trovato")
+            continue
+
+        file_start = time.time()
+        lines_before = get_counter("lines_processed")
+        try:
+            replay_file(path, source)
+        except (OSError, EOFError, lzma.LZMAError) as e:
+            print(f"[ERRORE] {path}: {e}")
+            continue
+
+        size = os.path.getsize(path)
+        total_bytes += size
+        replayed += 1
+        file_lines = get_counter("lines_processed") - lines_before
+        file_elapsed = max(time.time() - file_start, 1e-6)
+        print(
+            f"[OK] {path} ({source}): {file_lines} righe in {file_elapsed:.2f}s "
+            f"({file_lines / file_elapsed:.0f} righe/s)"
         )
 
-    threading.Thread(
-        target=monitor_pattern,
-        args=(
-            ERROR_PATTERN,
-            callback,
-            SHUTDOWN_SIGNAL,
-            monitored_files,
-            MONITORING_THREADS,
-            TAIL_PROCESS_HANDLERS,
-            NPM_DEBUG_LOG,
-        ),
-        daemon=True,
-    ).start()
+    elapsed = max(time.time() - start, 1e-6)
+    total_lines = get_counter("lines_processed")
+
+    print("=== REPLAY COMPLETATO ===")
+    print(f"File analizzati: {replayed}/{len(files)}")
+    print(f"Righe lette: {total_lines}")
+    print(f"Righe con codice consentito: {get_counter('stage_code_filter')}")
+    print(f"Eventi registrati: {log_entries[0]}")
+    print(f"Durata: {elapsed:.2f}s")
+    print(
+        f"Throughput: {total_lines / elapsed:.0f} righe/s, "
+        f"{total_bytes / elapsed / (1024 * 1024):.2f} MB/s (su disco)"
+    )
+    print(f"IP che sarebbero stati bannati: {len(would_ban)}")
+
+    for ip, (event_ts, ban_data) in sorted(
+        would_ban.items(), key=lambda item: item[1][0] or 0
+    ):
+        when = (
+            datetime.fromtimestamp(event_ts).strftime("%Y-%m-%d %H:%M:%S")
+            if event_ts
+            else "-"
+        )
+        user_agent, domain, code, url = ban_data[4:8]
+        print(
+            f"[WOULD-BAN] {when} IP: {ip}, Codice HTTP: {code}, Dominio: {domain}, "
+            f'URL: {url}, User-Agent: "{user_agent}"'
+        )
+
+    debug_log(
+        f"Replay completato: {total_lines} righe, {len(would_ban)} IP da bannare, "
+        f"{elapsed:.2f}s",
+        NPM_DEBUG_LOG,
+    )
+
+
+def process_access_logs():
+    for pattern, format_name in log_formats.globs:
+        path = os.path.join(LOG_DIR, pattern)
+        if has_magic(pattern):
+            log_tailer.watch_pattern(path, make_line_callback(format_name), raw=True)
+        else:
+            log_tailer.add_file(path, make_line_callback(format_name), raw=True)
+
+
+def process_proxy_errors():
+    ERROR_PATTERN = os.path.join(LOG_DIR, "proxy-host-*_error.log")
+    log_tailer.watch_pattern(
+        ERROR_PATTERN, make_line_callback(ERROR_SOURCE), raw=True
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="NGINX Shield - analizzatore log")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Numero di processi di analisi, partizionati per IP client (default: 1)",
+    )
+    parser.add_argument(
+        "--replay",
+        nargs="+",
+        metavar="FILE",
+        help="Analizza log storici (anche .gz/.bz2/.xz o glob) e riporta i ban che sarebbero stati eseguiti, senza bannare",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(LINE_SOURCES),
+        help="Formato delle righe in replay (default: dedotto dal nome del file)",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
 
+    args = parse_args()
+
+    if args.replay:
+        run_replay(args.replay, args.format)
+        sys.exit(0)
+
+    if args.workers > 1:
+        debug_log(
+            f"Modalita' multi-processo: {args.workers} shard per IP client",
+            NPM_DEBUG_LOG,
+        )
+        shard_pool = ShardPool(args.workers, shard_worker, NPM_DEBUG_LOG)
+        shard_pool.start()
+    else:
+        # Come gli shard: fork dei processi di analisi prima di ogni thread
+        analysis_queue.start_pool()
+
     signal.signal(
         signal.SIGINT,
         lambda s, f: handle_signal(
             s,
             f,
             SHUTDOWN_SIGNAL,
-            TAIL_PROCESS_HANDLERS,
             MONITORING_THREADS,
             NPM_DEBUG_LOG,
         ),
@@ -604,7 +1239,6 @@ if __name__ == "__main__":
             s,
             f,
             SHUTDOWN_SIGNAL,
-            TAIL_PROCESS_HANDLERS,
             MONITORING_THREADS,
             NPM_DEBUG_LOG,
         ),
@@ -628,6 +1262,8 @@ if __name__ == "__main__":
         ip_manager, SHUTDOWN_SIGNAL, MONITORING_THREADS, NPM_DEBUG_LOG
     )
 
+    start_pattern_threads()
+
     debug_log("Avvio batch processors ottimizzati...", NPM_DEBUG_LOG)
 
     ban_processor_thread = threading.Thread(
@@ -648,14 +1284,43 @@ if __name__ == "__main__":
     stats_thread.start()
     MONITORING_THREADS.append(stats_thread)
 
+    metrics_server = None
+    if METRICS_ENABLED:
+        metrics_server = MetricsServer(
+            METRICS_HOST, METRICS_PORT, render_analyzer_metrics, NPM_DEBUG_LOG
+        )
+        try:
+            metrics_server.start()
+        except OSError as e:
+            debug_log(
+                f"Impossibile avviare l'endpoint metriche su {METRICS_HOST}:{METRICS_PORT}: {e}",
+                NPM_DEBUG_LOG,
+            )
+            metrics_server = None
+
+    if shard_pool is None:
+        MONITORING_THREADS.extend(analysis_queue.start(SHUTDOWN_SIGNAL))
+    else:
+        collector_thread = threading.Thread(
+            target=shard_pool.collect,
+            args=(handle_shard_result, SHUTDOWN_SIGNAL),
+            name="shard_collector",
+            daemon=True,
+        )
+        collector_thread.start()
+        MONITORING_THREADS.append(collector_thread)
+
     debug_log("Avvio monitoring log files...", NPM_DEBUG_LOG)
-    threading.Thread(target=process_fallback, daemon=True).start()
-    threading.Thread(target=process_default, daemon=True).start()
-    process_proxy()
+    # Pattern e file esistenti registrati prima del thread del tail, che
+    # altrimenti potrebbe agganciarli per primo leggendoli dall'inizio
+    process_access_logs()
     process_proxy_errors()
+    MONITORING_THREADS.append(log_tailer.start())
 
     debug_log("=== SISTEMA OPERATIVO ===", NPM_DEBUG_LOG)
-    debug_log(f"- {NUM_WORKERS} worker threads disponibili", NPM_DEBUG_LOG)
+    debug_log(
+        f"- {ANALYSIS_WORKERS} worker di analisi ({ANALYSIS_EXECUTOR})", NPM_DEBUG_LOG
+    )
     debug_log("- Batch processing attivo per ban e log", NPM_DEBUG_LOG)
     debug_log("- Cache LRU attiva per pattern matching", NPM_DEBUG_LOG)
     debug_log("- Regex precompilate per parsing veloce", NPM_DEBUG_LOG)
@@ -665,6 +1330,12 @@ if __name__ == "__main__":
 
     debug_log("=== SHUTDOWN IN CORSO ===", NPM_DEBUG_LOG)
 
+    if shard_pool is not None:
+        shard_pool.stop()
+    analysis_queue.shutdown()
+    if metrics_server is not None:
+        metrics_server.stop()
+
     final_stats = get_stats_summary()
     debug_log("=== STATISTICHE FINALI ===", NPM_DEBUG_LOG)
     debug_log(f"Uptime totale: {final_stats['uptime_seconds']:.1f}s", NPM_DEBUG_LOG)
@@ -0,0 +1,115 @@
+import time
+import threading
+
+from functions.event_queue import BoundedEventQueue
+
+
+def make_ban_queue(maxsize, put_timeout=0.05):
+    # Come la coda dei ban dell'analyzer: chiave IP e dedupe attivo
+    return BoundedEventQueue(
+        "ban",
+        maxsize,
+        None,
+        policy="coalesce",
+        key_fn=lambda ban_data: ban_data[0],
+        dedupe=True,
+        put_timeout=put_timeout,
+    )
+
+
+def test_coalesce_replaces_queued_entry_on_full_queue():
+    queue = make_ban_queue(3)
+    for ip in ("1.1.1.1", "2.2.2.2", "3.3.3.3"):
+        assert queue.put((ip, "/old"))
+
+    # Coda piena: lo stesso IP aggiorna l'elemento in attesa
+    assert queue.put(("2.2.2.2", "/new"))
+
+    stats = queue.get_stats()
+    assert stats["coalesced"] == 1
+    assert stats["dropped"] == 0
+    assert stats["deduplicated"] == 0
+    assert stats["depth"] == 3
+    assert [queue.get(timeout=0) for _ in range(3)] == [
+        ("1.1.1.1", "/old"),
+        ("2.2.2.2", "/new"),
+        ("3.3.3.3", "/old"),
+    ]
+
+
+def test_coalesce_new_key_waits_for_room():
+    queue = make_ban_queue(2, put_timeout=5)
+    queue.put(("1.1.1.1", "/a"))
+    queue.put(("2.2.2.2", "/b"))
+
+    threading.Timer(0.05, queue.get).start()
+    assert queue.put(("3.3.3.3", "/c"))
+
+    stats = queue.get_stats()
+    assert stats["dropped"] == 0
+    assert [queue.get(timeout=1) for _ in range(2)] == [
+        ("2.2.2.2", "/b"),
+        ("3.3.3.3", "/c"),
+    ]
+
+
+def test_coalesce_new_key_dropped_after_timeout():
+    queue = make_ban_queue(1, put_timeout=0.01)
+    queue.put(("1.1.1.1", "/a"))
+
+    assert not queue.put(("2.2.2.2", "/b"))
+    assert queue.get_stats()["dropped"] == 1
+
+
+def test_key_can_be_queued_again_after_get():
+    queue = make_ban_queue(2)
+    queue.put(("1.1.1.1", "/a"))
+    assert queue.get(timeout=0) == ("1.1.1.1", "/a")
+
+    queue.put(("1.1.1.1", "/b"))
+    assert queue.get_stats()["coalesced"] == 0
+    assert queue.get(timeout=0) == ("1.1.1.1", "/b")
+
+
+def test_dedupe_without_coalesce_keeps_first_entry():
+    queue = BoundedEventQueue(
+        "ban", 2, None, policy="block", key_fn=lambda item: item[0], dedupe=True
+    )
+    queue.put(("1.1.1.1", "/a"))
+    queue.put(("1.1.1.1", "/b"))
+
+    assert queue.get_stats()["deduplicated"] == 1
+    assert queue.get(timeout=0) == ("1.1.1.1", "/a")
+
+
+def test_coalesce_same_key_from_two_waiting_producers():
+    queue = make_ban_queue(1, put_timeout=5)
+    queue.put(("1.1.1.1", "/a"))
+
+    # Due produttori con lo stesso IP attendono entrambi a coda piena
+    producers = [
+        threading.Thread(target=queue.put, args=(("2.2.2.2", path),))
+        for path in ("/b", "/c")
+    ]
+    for producer in producers:
+        producer.start()
+    deadline = time.monotonic() + 5
+    while len(queue.not_full._waiters) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert queue.get(timeout=1) == ("1.1.1.1", "/a")
+    for producer in producers:
+        producer.join(timeout=5)
+        assert not producer.is_alive()
+
+    stats = queue.get_stats()
+    assert stats["depth"] == 1
+    assert stats["coalesced"] == 1
+    assert stats["dropped"] == 0
+    assert queue.get(timeout=0)[0] == "2.2.2.2"
+    assert not queue.queued and not queue.key_counts
+
+    # Lo stesso IP torna a fondersi invece di occupare un altro posto
+    queue.put(("2.2.2.2", "/d"))
+    queue.put(("2.2.2.2", "/e"))
+    assert queue.get_stats()["depth"] == 1
@@ -0,0 +1,136 @@
+import os
+import threading
+
+import pytest
+
+from functions.checkpoint_store import CheckpointStore
+from functions.file_monitor import LogTailer
+
+
+class Session:
+    """Un avvio dell'analyzer: tail e checkpoint, pilotati senza thread."""
+
+    def __init__(self, tmp_path):
+        self.store = CheckpointStore(str(tmp_path / "checkpoints.json"), None)
+        self.tailer = LogTailer(
+            threading.Event(), None, checkpoint_store=self.store, batch_max_delay=0
+        )
+        self.lines = []
+
+    def callback(self, lines):
+        self.lines.extend(lines)
+
+    def add_file(self, path):
+        self.tailer.add_file(str(path), self.callback, raw=True)
+
+    def poll(self):
+        self.tailer._check_files(self.tailer._snapshot())
+        self.tailer._flush_due()
+        lines, self.lines = self.lines, []
+        return lines
+
+    def stop(self):
+        self.store.flush(force=True)
+        if self.tailer.inotify is not None:
+            self.tailer.inotify.close()
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = tmp_path / "proxy-host-1_access.log"
+    path.write_bytes(b"old 1\nold 2\n")
+    return path
+
+
+def first_run(tmp_path, log_path):
+    # Primo avvio senza checkpoint: si parte dalla fine e si legge solo il nuovo
+    session = Session(tmp_path)
+    session.add_file(log_path)
+    with open(log_path, "ab") as f:
+        f.write(b"line 3\n")
+    assert session.poll() == [b"line 3"]
+    session.stop()
+
+
+def test_resume_at_checkpointed_offset(tmp_path, log_path):
+    first_run(tmp_path, log_path)
+    with open(log_path, "ab") as f:
+        f.write(b"while down\n")
+
+    session = Session(tmp_path)
+    session.add_file(log_path)
+    assert session.poll() == [b"while down"]
+
+    with open(log_path, "ab") as f:
+        f.write(b"live\n")
+    assert session.poll() == [b"live"]
+    session.stop()
+
+
+def test_restart_from_zero_after_rotation(tmp_path, log_path):
+    first_run(tmp_path, log_path)
+    os.rename(log_path, str(log_path) + ".1")
+    log_path.write_bytes(b"rotated 1\nrotated 2\n")
+
+    session = Session(tmp_path)
+    session.add_file(log_path)
+    assert session.poll() == [b"rotated 1", b"rotated 2"]
+    session.stop()
+
+
+def test_restart_from_zero_after_truncation(tmp_path, log_path):
+    first_run(tmp_path, log_path)
+    with open(log_path, "wb") as f:
+        f.write(b"short\n")
+
+    session = Session(tmp_path)
+    session.add_file(log_path)
+    assert session.poll() == [b"short"]
+    session.stop()
+
+
+def test_restart_from_zero_on_last_line_hash_mismatch(tmp_path, log_path):
+    first_run(tmp_path, log_path)
+    # Stesso inode e file piu' lungo del checkpoint, ma contenuto riscritto
+    with open(log_path, "r+b") as f:
+        f.write(b"new 1\nnew 2\nnew 3\nnew 4\n")
+
+    session = Session(tmp_path)
+    session.add_file(log_path)
+    assert session.poll() == [b"new 1", b"new 2", b"new 3", b"new 4"]
+    session.stop()
+
+
+def test_live_rotation_and_truncation(tmp_path, log_path):
+    session = Session(tmp_path)
+    session.add_file(log_path)
+
+    os.rename(log_path, str(log_path) + ".1")
+    log_path.write_bytes(b"after rotation\n")
+    assert session.poll() == [b"after rotation"]
+
+    with open(log_path, "wb") as f:
+        f.write(b"x\n")
+    assert session.poll() == [b"x"]
+    session.stop()
+
+
+def test_watch_pattern_attaches_existing_files_from_end(tmp_path, log_path):
+    session = Session(tmp_path)
+    session.tailer.watch_pattern(
+        str(tmp_path / "proxy-host-*_access.log"), session.callback, raw=True
+    )
+    assert session.poll() == []
+
+    # Un file trovato dalla scansione periodica non e' letto dall'inizio
+    other = tmp_path / "proxy-host-2_access.log"
+    other.write_bytes(b"history\n")
+    session.tailer._scan_patterns()
+    assert session.poll() == []
+
+    # Uno appena creato (IN_CREATE) si'
+    created = tmp_path / "proxy-host-3_access.log"
+    created.write_bytes(b"fresh\n")
+    session.tailer._discover([str(created)], created=True)
+    assert session.poll() == [b"fresh"]
+    session.stop()
@@ -0,0 +1,149 @@
+import random
+import socket
+from collections import OrderedDict
+
+from functions.ip_table import (
+    IPTable,
+    INITIAL_CAPACITY_BITS,
+    LIST_CLEAN,
+    LIST_WATCHED,
+    NIL,
+    pack_ipv4,
+)
+
+
+def ipv4(key):
+    return socket.inet_ntop(socket.AF_INET, key.to_bytes(4, "big"))
+
+
+def colliding_ips(table, home, count):
+    """IPv4 con lo stesso bucket iniziale nell'indice appena creato."""
+    ips = []
+    key = 1
+    while len(ips) < count:
+        if table._home(key) == home:
+            ips.append(ipv4(key))
+        key += 1
+    return ips
+
+
+def list_order(table, lst):
+    order = []
+    slot = table.heads[lst]
+    while slot != NIL:
+        order.append(table.ip_of(slot))
+        slot = table.next[slot]
+    return order
+
+
+def check(table, model, lists, pool):
+    assert len(table) == len(model)
+    for ip in pool:
+        slot = table.find(ip)
+        if ip in model:
+            assert slot >= 0 and table.ip_of(slot) == ip
+        else:
+            assert slot == -1
+
+    assert table.requests_total == sum(row["requests"] for row in model.values())
+    assert table.errors_total == sum(row["errors"] for row in model.values())
+    assert table.banned_total == sum(row["banned"] for row in model.values())
+
+    assert list_order(table, LIST_CLEAN) == list(lists[LIST_CLEAN])
+    assert list_order(table, LIST_WATCHED) == list(lists[LIST_WATCHED])
+
+    heads = [next(iter(lists[lst]), None) for lst in (LIST_CLEAN, LIST_WATCHED)]
+    candidates = [ip for ip in heads if ip is not None]
+    oldest = table.oldest()
+    if not candidates:
+        assert oldest == -1
+    else:
+        # A parita' di attivita' vince la lista degli IP puliti
+        expected = min(candidates, key=lambda ip: model[ip]["last_activity"])
+        assert table.ip_of(oldest) == expected
+
+
+def test_table_matches_dict_model_under_random_operations():
+    rng = random.Random(24)
+    table = IPTable()
+    mask = (1 << INITIAL_CAPACITY_BITS) - 1
+
+    # Catene di collisioni sull'ultimo bucket (wrap-around su mask), sul
+    # penultimo e sul primo, piu' indirizzi casuali e non IPv4
+    pool = (
+        colliding_ips(table, mask, 8)
+        + colliding_ips(table, mask - 1, 4)
+        + colliding_ips(table, 0, 4)
+        + [ipv4(rng.randrange(1, 2**32)) for _ in range(40)]
+        + ["2001:db8::1", "2001:db8::2", "::1", "not-an-ip"]
+    )
+    model = {}
+    lists = {LIST_CLEAN: OrderedDict(), LIST_WATCHED: OrderedDict()}
+    clock = 1_700_000_000
+
+    for _ in range(5000):
+        clock += rng.choice((0, 1, 5))
+        ip = rng.choice(pool)
+        op = rng.random()
+
+        if ip not in model:
+            slot = table.insert(ip, clock, key=pack_ipv4(ip))
+            model[ip] = {
+                "requests": 0,
+                "errors": 0.0,
+                "banned": False,
+                "last_activity": clock,
+                "list": LIST_CLEAN,
+            }
+            lists[LIST_CLEAN][ip] = None
+        elif op < 0.2:
+            assert table.remove(ip)
+            del lists[model.pop(ip)["list"]][ip]
+        else:
+            slot = table.find(ip)
+            row = model[ip]
+            if op < 0.4:
+                table.add_errors(slot, rng.choice((0.25, 0.5, 1.0)))
+                row["errors"] = table.errors[slot]
+            elif op < 0.5:
+                table.reset_errors(slot)
+                row["errors"] = 0.0
+            elif op < 0.6:
+                banned = rng.random() < 0.7
+                table.set_banned(slot, banned)
+                row["banned"] = banned
+            else:
+                table.add_request(slot)
+                row["requests"] += 1
+
+            watched = bool(row["errors"]) or row["banned"]
+            table.touch(slot, watched)
+            table.last_activity[slot] = clock
+            row["last_activity"] = clock
+            del lists[row["list"]][ip]
+            row["list"] = LIST_WATCHED if watched else LIST_CLEAN
+            lists[row["list"]][ip] = None
+
+        check(table, model, lists, pool)
+
+    for ip in list(model):
+        assert table.remove(ip)
+        del lists[model.pop(ip)["list"]][ip]
+        check(table, model, lists, pool)
+    assert table.index_used == 0
+
+
+def test_index_survives_growth_and_deletes():
+    table = IPTable()
+    keys = random.Random(7).sample(range(1, 2**32), 5000)
+    for key in keys:
+        table.insert(ipv4(key), 0, key=key)
+    assert table.bits > INITIAL_CAPACITY_BITS
+
+    removed = set(keys[::2])
+    for key in removed:
+        assert table.remove(ipv4(key))
+    for key in keys:
+        slot = table.find(ipv4(key))
+        assert (slot == -1) == (key in removed)
+    assert len(table) == table.index_used == len(keys) - len(removed)
@@ -0,0 +1,39 @@
+from functions.log_formats import CompiledFormat, LogRecord, PRESETS
+from functions.log_parsers import extract_proxy_fields_legacy
+
+NPM_PROXY_FORMAT = CompiledFormat(
+    "npm_proxy", PRESETS["npm_proxy"], fallback=extract_proxy_fields_legacy
+)
+
+# Riga senza i campi [Length ...] [Gzip ...] [Sent-to ...]: la regex
+# ancorata del preset npm_proxy non la riconosce, il parser legacy si'
+LEGACY_ONLY = (
+    '[17/Oct/2026:10:00:00 +0000] - 200 200 - GET https test.com "/index.php" '
+    '[Client 1.2.3.4] "curl/8.0" "-"'
+)
+FULL = (
+    '[17/Oct/2026:10:00:00 +0000] - 200 200 - GET https test.com "/index.php" '
+    '[Client 1.2.3.4] [Length 12] [Gzip -] [Sent-to 10.0.0.1] "curl/8.0" "-"'
+)
+
+
+def test_legacy_only_line_is_parsed_by_fallback():
+    assert NPM_PROXY_FORMAT.raw_regex.match(LEGACY_ONLY.encode()) is None
+    record = NPM_PROXY_FORMAT.extract_raw(LEGACY_ONLY.encode())
+    assert isinstance(record, LogRecord)
+    assert (record.ip, record.status) == ("1.2.3.4", 200)
+
+
+def test_legacy_only_line_with_allowed_code_is_skipped():
+    assert NPM_PROXY_FORMAT.extract_raw(LEGACY_ONLY.encode(), {200}) == 200
+
+
+def test_legacy_only_line_with_other_code_returns_record():
+    line = LEGACY_ONLY.replace("200 200", "404 404").encode()
+    record = NPM_PROXY_FORMAT.extract_raw(line, {200})
+    assert isinstance(record, LogRecord)
+    assert record.status == 404
+
+
+def test_anchored_line_with_allowed_code_is_skipped():
+    assert NPM_PROXY_FORMAT.extract_raw(FULL.encode(), {200}) == 200
@@ -0,0 +1,59 @@
+import time
+import threading
+
+from functions.work_queue import AnalysisWorkQueue
+
+
+def client_ip(line):
+    return line[0]
+
+
+def make_queue(apply, num_workers=2, maxsize=4):
+    return AnalysisWorkQueue(
+        lambda source, lines: lines, apply, num_workers, None, maxsize=maxsize
+    )
+
+
+def test_full_partition_drops_without_blocking():
+    queue = make_queue(lambda source, lines: None, num_workers=1, maxsize=1)
+    assert queue.submit("npm", [("1.1.1.1", 0)], client_ip)
+
+    # Nessun consumer avviato: la coda resta piena e il tail non attende
+    start = time.monotonic()
+    assert not queue.submit("npm", [("1.1.1.1", 1), ("2.2.2.2", 1)], client_ip)
+    assert time.monotonic() - start < 0.5
+
+    stats = queue.get_stats()
+    assert stats["batches_dropped"] == 1
+    assert stats["lines_dropped"] == 2
+    assert stats["depth"] == 1
+
+
+def test_lines_of_one_ip_are_applied_in_order():
+    applied = []
+    lock = threading.Lock()
+
+    def apply(source, lines):
+        time.sleep(0.001)
+        with lock:
+            applied.extend(lines)
+
+    queue = make_queue(apply, num_workers=4, maxsize=1000)
+    stop = threading.Event()
+    queue.start(stop)
+    try:
+        for batch in range(50):
+            lines = [(f"10.0.0.{i % 7}", batch * 10 + i) for i in range(10)]
+            assert queue.submit("npm", lines, client_ip)
+
+        deadline = time.monotonic() + 5
+        while len(applied) < 500 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        stop.set()
+
+    assert len(applied) == 500
+    by_ip = {}
+    for ip, sequence in applied:
+        by_ip.setdefault(ip, []).append(sequence)
+    assert all(sequences == sorted(sequences) for sequences in by_ip.values())